@@ -0,0 +1,321 @@
+"""
+Per-handler microbenchmarks for the Cows with a K Lambda functions
+Drives each lambda_handler with API Gateway events against a local storage stand-in
+
+Usage:
+    python benchmarks/bench_handlers.py --iterations 200 --output bench.json
+    python benchmarks/bench_handlers.py --baseline benchmarks/baseline.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import platform
+import tracemalloc
+from datetime import datetime
+
+import harness
+import instrumentation
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class Scenario:
+    """One benchmarked handler: a setup step (untimed) and the event to send"""
+
+    def __init__(self, handler, prepare):
+        self.handler = handler
+        self.prepare = prepare
+
+
+def build_scenarios(users):
+    """Realistic request for each handler against the seeded data"""
+    import storage
+
+    author = users[0]
+    admin = dict(users[1], clearanceLevel='TOP SECRET')
+    storage.users().put(admin)
+    post_message = harness.load_handler('post_message')
+    counter = {'n': 0}
+
+    def next_id():
+        counter['n'] += 1
+        return counter['n']
+
+    def signin():
+        return harness.api_event('POST', '/auth/signin', body={
+            'email': author['email'], 'password': harness.BENCH_PASSWORD
+        })
+
+    def signup():
+        n = next_id()
+        return harness.api_event('POST', '/auth/signup', body={
+            'email': f'newcow{n}@bench.cow',
+            'password': 'StrongMoo123',
+            'firstName': 'New',
+            'lastName': 'Cow',
+            'cowName': f'Newcomer {n}',
+            'answers': {'q1': 'Kentucky Bluegrass', 'q2': 'Four (Correct)', 'q3': 'divine', 'q4': 'Grazing'},
+        })
+
+    def signout():
+        # Signout revokes its token, so use a user no other scenario authenticates as
+        return harness.api_event('POST', '/auth/signout', token=harness.issue_token(users[2]))
+
+    token = harness.issue_token(author)
+    admin_token = harness.issue_token(admin)
+
+    def get_current_user():
+        return harness.api_event('GET', '/auth/me', token=token)
+
+    def get_messages():
+        return harness.api_event('GET', '/messages', token=token, query={'limit': '50'})
+
+    posts = itertools.count()
+
+    def post():
+        return harness.api_event('POST', '/messages', token=token, body={
+            'content': harness.chatter(next(posts))
+        })
+
+    def delete():
+        # A thread with a few replies, so the replies are deleted with it
+        message = post_message.create_message(
+            author['userId'], author['username'], 'To be deleted', author['clearanceLevel']
+        )
+        for i in range(3):
+            post_message.create_message(
+                author['userId'], author['username'], f'Doomed reply {i}', author['clearanceLevel'],
+                message['messageId']
+            )
+        return harness.api_event(
+            'DELETE', f"/messages/{message['messageId']}", resource='/messages/{messageId}',
+            token=admin_token, path_params={'messageId': message['messageId']}
+        )
+
+    # One busy thread, read a page at a time as a client expanding it would
+    thread = post_message.create_message(
+        author['userId'], author['username'], 'Which pasture is best?', author['clearanceLevel']
+    )
+    for i in range(30):
+        post_message.create_message(
+            author['userId'], author['username'], f'Reply {i}', author['clearanceLevel'], thread['messageId']
+        )
+
+    def get_replies():
+        return harness.api_event(
+            'GET', f"/messages/{thread['messageId']}/replies", resource='/messages/{messageId}/replies',
+            token=token, query={'limit': '20'}, path_params={'messageId': thread['messageId']}
+        )
+
+    def moo():
+        # A fresh message each time, so every request counts a new moo
+        message = post_message.create_message(
+            author['userId'], author['username'], 'Moo if you agree', author['clearanceLevel']
+        )
+        return harness.api_event(
+            'POST', f"/messages/{message['messageId']}/moo", resource='/messages/{messageId}/moo',
+            token=token, path_params={'messageId': message['messageId']}
+        )
+
+    def presence():
+        return harness.api_event('POST', '/presence', token=token)
+
+    def get_stats():
+        return harness.api_event('GET', '/stats', token=token)
+
+    def get_boards():
+        return harness.api_event('GET', '/boards', token=token)
+
+    # A client reconnecting 50 changes behind
+    for i in range(50):
+        message = post_message.create_message(
+            author['userId'], author['username'], harness.chatter(1000 + i), author['clearanceLevel']
+        )
+        post_message.record_change(message, message['boardId'])
+    since = storage.changes().latest(message['boardId']) - 50
+
+    def get_changes():
+        return harness.api_event(
+            'GET', '/messages/changes', token=token, query={'since': str(since), 'limit': '50'}
+        )
+
+    def admin_registrations():
+        return harness.api_event('GET', '/admin/registrations', token=admin_token, query={'limit': '25'})
+
+    return [
+        Scenario('signin', signin),
+        Scenario('signup', signup),
+        Scenario('signout', signout),
+        Scenario('get_current_user', get_current_user),
+        Scenario('get_messages', get_messages),
+        Scenario('post_message', post),
+        Scenario('delete_message', delete),
+        Scenario('get_replies', get_replies),
+        Scenario('moo_message', moo),
+        Scenario('presence', presence),
+        Scenario('get_stats', get_stats),
+        Scenario('get_boards', get_boards),
+        Scenario('get_changes', get_changes),
+        Scenario('admin_registrations', admin_registrations),
+    ]
+
+
+def run_scenario(scenario, backend, iterations, warmup, alloc_iterations):
+    """Time a scenario, then re-run a few iterations under tracemalloc"""
+    module = harness.load_handler(scenario.handler)
+    counters = backend.counters
+
+    for _ in range(warmup):
+        module.lambda_handler(scenario.prepare(), None)
+
+    latencies, calls, bytes_read, read_units, write_units, statuses = [], [], [], [], [], {}
+    for _ in range(iterations):
+        event = scenario.prepare()
+        counters.reset()
+        start = time.perf_counter()
+        response = module.lambda_handler(event, None)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        call_count, byte_count = counters.snapshot()
+        calls.append(call_count)
+        bytes_read.append(byte_count)
+        request = instrumentation.last_request()
+        read_units.append(request.read_units)
+        write_units.append(request.write_units)
+        statuses[response['statusCode']] = statuses.get(response['statusCode'], 0) + 1
+
+    peaks, blocks = [], []
+    for _ in range(alloc_iterations):
+        event = scenario.prepare()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        module.lambda_handler(event, None)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        peaks.append(peak - base)
+        blocks.append(sum(max(0, s.count_diff) for s in after.compare_to(before, 'lineno')))
+
+    return {
+        'iterations': iterations,
+        'statusCodes': {str(k): v for k, v in sorted(statuses.items())},
+        'latencyMs': {
+            'p50': round(percentile(latencies, 50), 4),
+            'p95': round(percentile(latencies, 95), 4),
+            'p99': round(percentile(latencies, 99), 4),
+            'mean': round(sum(latencies) / len(latencies), 4),
+            'max': round(max(latencies), 4),
+        },
+        'allocations': {
+            'peakBytes': int(percentile(peaks, 50)),
+            'retainedBlocks': int(percentile(blocks, 50)),
+        },
+        'storageCallsPerRequest': round(sum(calls) / len(calls), 3),
+        'bytesReadPerRequest': round(sum(bytes_read) / len(bytes_read), 1),
+        'readUnitsPerRequest': round(sum(read_units) / len(read_units), 3),
+        'writeUnitsPerRequest': round(sum(write_units) / len(write_units), 3),
+    }
+
+
+def compare(results, baseline, max_regression):
+    """Print deltas against a baseline file; returns the list of regressions"""
+    regressions = []
+    print(f"\n{'handler':<20} {'p50 ms':>10} {'base':>10} {'p95 ms':>10} {'base':>10} {'calls':>7} {'base':>6}")
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            print(f"{name:<20} (not in baseline)")
+            continue
+        p50, p95 = result['latencyMs']['p50'], result['latencyMs']['p95']
+        b50, b95 = base['latencyMs']['p50'], base['latencyMs']['p95']
+        calls, bcalls = result['storageCallsPerRequest'], base['storageCallsPerRequest']
+        print(f"{name:<20} {p50:>10.3f} {b50:>10.3f} {p95:>10.3f} {b95:>10.3f} {calls:>7.2f} {bcalls:>6.2f}")
+        if b95 and (p95 - b95) / b95 > max_regression:
+            regressions.append(f"{name}: p95 {b95:.3f} ms -> {p95:.3f} ms")
+        if calls > bcalls:
+            regressions.append(f"{name}: storage calls {bcalls} -> {calls}")
+        for units in ('readUnitsPerRequest', 'writeUnitsPerRequest'):
+            if units in base and result[units] > base[units]:
+                regressions.append(f"{name}: {units} {base[units]} -> {result[units]}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Lambda handlers locally')
+    parser.add_argument('--handlers', nargs='*', default=harness.HANDLERS, help='Handlers to run')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--alloc-iterations', type=int, default=5)
+    parser.add_argument('--backend', choices=['memory', 'sqlite'], default='memory')
+    parser.add_argument('--sqlite-path', default='bench.db')
+    parser.add_argument('--storage-latency-ms', type=float, default=0.0,
+                        help='Delay added to every storage call, e.g. 5 to approximate DynamoDB')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--output', default='bench_output.json', help='Machine-readable results file')
+    parser.add_argument('--baseline', help='Results file to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='Allowed relative p95 slowdown before failing (default 0.25)')
+    args = parser.parse_args(argv)
+
+    if args.backend == 'sqlite' and os.path.exists(args.sqlite_path):
+        os.remove(args.sqlite_path)
+    backend = harness.install_backend(args.backend, args.sqlite_path)
+    users = harness.seed(args.users, args.messages)
+    backend.latency_ms = args.storage_latency_ms
+
+    results = {}
+    for scenario in build_scenarios(users):
+        if scenario.handler not in args.handlers:
+            continue
+        # signin/signup hash passwords with 100k PBKDF2 rounds; keep their runs short
+        iterations = args.iterations if scenario.handler not in ('signin', 'signup') else max(10, args.iterations // 10)
+        results[scenario.handler] = run_scenario(
+            scenario, backend, iterations, min(args.warmup, iterations), args.alloc_iterations
+        )
+        latency = results[scenario.handler]['latencyMs']
+        print(f"{scenario.handler:<20} p50 {latency['p50']:8.3f} ms  p95 {latency['p95']:8.3f} ms  "
+              f"p99 {latency['p99']:8.3f} ms  calls {results[scenario.handler]['storageCallsPerRequest']}  "
+              f"RCU {results[scenario.handler]['readUnitsPerRequest']}  WCU {results[scenario.handler]['writeUnitsPerRequest']}")
+
+    report = {
+        'meta': {
+            'generatedAt': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'backend': args.backend,
+            'storageLatencyMs': args.storage_latency_ms,
+            'seed': {'users': args.users, 'messages': args.messages},
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print('\nRegressions against baseline:')
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+Storage backend parity check
+Runs the same table operations on each backend and reports where their results differ
+
+Usage:
+    python benchmarks/check_backends.py
+    python benchmarks/check_backends.py --dynamodb-table CowsWithAK-ParityCheck
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import harness  # noqa: F401  (puts ../lambda on the path and keeps handlers off AWS)
+import storage
+
+# hash pk (S), range sk (N), index group-index on grp (S) + sk (N), TTL on ttl
+PARITY_TABLE = 'CowsWithAK-ParityCheck'
+
+
+def parity_schema(name=PARITY_TABLE):
+    return storage.TableSchema(name, 'pk', 'sk', indexes={'group-index': ('grp', 'sk')}, ttl_attribute='ttl')
+
+
+def keys_of(items):
+    return [(item['pk'], int(item['sk'])) for item in items]
+
+
+def pages(read, limit):
+    """Every page of a paginated read, as lists of keys"""
+    result, start_key = [], None
+    while True:
+        page = read(limit, start_key)
+        result.append(keys_of(page.items))
+        if not page.last_key:
+            return result
+        start_key = page.last_key
+
+
+def outcome(call):
+    """The value of call(), or the name of the storage error it raised"""
+    try:
+        return call()
+    except storage.TransactionCanceled as e:
+        return f'TransactionCanceled{sorted(e.failed)}'
+    except storage.ConditionFailed:
+        return 'ConditionFailed'
+
+
+def transcript(table, schema):
+    """The results of a fixed series of operations, comparable across backends"""
+    expired = int(time.time()) - 60
+    for pk in ('a', 'b'):
+        for sk in range(1, 16):
+            # Index order between equal index keys is unspecified, so only pk a is grouped by parity
+            grp = ('odd' if sk % 2 else 'even') if pk == 'a' else 'b'
+            item = {'pk': pk, 'sk': sk, 'grp': grp, 'body': f'{pk}{sk}'}
+            if sk % 3 == 0:
+                item['flag'] = True
+            if sk in (7, 8):
+                item['ttl'] = expired
+            table.put_item(item)
+    # Sparse index: no grp
+    table.put_item({'pk': 'a', 'sk': 16, 'body': 'ungrouped'})
+
+    result = {}
+    result['query_forward'] = pages(lambda limit, start: table.query('a', limit=limit, start_key=start), 4)
+    result['query_backward_range'] = pages(
+        lambda limit, start: table.query('a', range_condition=('>', 3), forward=False, limit=limit, start_key=start), 4
+    )
+    result['query_between'] = keys_of(table.query('b', range_condition=('between', 4, 9)).items)
+    # Filtered items still count towards limit, so pages can come back short
+    result['query_filtered'] = pages(
+        lambda limit, start: table.query('a', limit=limit, start_key=start, filters=[storage.equals('flag', True)]), 5
+    )
+    result['index_query'] = pages(
+        lambda limit, start: table.query('odd', index='group-index', forward=False, limit=limit, start_key=start), 3
+    )
+    # Scan order is backend-specific; compare what is returned, not where
+    result['scan'] = sorted(key for page in pages(
+        lambda limit, start: table.scan(limit=limit, start_key=start), 7) for key in page)
+    result['scan_segments'] = sorted(key for segment in range(3) for page in pages(
+        lambda limit, start: table.scan(limit=limit, start_key=start, segment=segment, total_segments=3), 5
+    ) for key in page)
+    result['batch_get'] = sorted(keys_of(table.batch_get_item(
+        [{'pk': 'a', 'sk': 1}, {'pk': 'a', 'sk': 7}, {'pk': 'a', 'sk': 99}, {'pk': 'a', 'sk': 1}]
+    )))
+    result['get_expired'] = table.get_item({'pk': 'b', 'sk': 8})
+
+    result['put_not_exists'] = outcome(lambda: table.put_item(
+        {'pk': 'a', 'sk': 1}, conditions=[storage.attribute_not_exists('pk')]
+    ))
+    result['update_mismatch'] = outcome(lambda: table.update_item(
+        {'pk': 'a', 'sk': 2}, set_values={'body': 'x'}, conditions=[storage.equals('body', 'wrong')]
+    ))
+    result['update_all_new'] = outcome(lambda: table.update_item(
+        {'pk': 'a', 'sk': 2}, set_values={'body': 'new'}, add_values={'count': 2}, remove=['grp'],
+        conditions=[storage.attribute_exists('pk')]
+    ))
+    result['update_missing'] = outcome(lambda: table.update_item(
+        {'pk': 'z', 'sk': 1}, add_values={'count': 1}, conditions=[storage.attribute_exists('pk')]
+    ))
+    result['delete_mismatch'] = outcome(lambda: table.delete_item(
+        {'pk': 'a', 'sk': 3}, conditions=[storage.equals('body', 'wrong')]
+    ))
+    result['delete_returns_old'] = outcome(lambda: table.delete_item({'pk': 'a', 'sk': 3}))
+    result['delete_missing'] = outcome(lambda: table.delete_item({'pk': 'a', 'sk': 3}))
+
+    result['transaction_canceled'] = outcome(lambda: storage.transact_write([
+        storage.TransactPut(schema, {'pk': 'c', 'sk': 1}, [storage.attribute_not_exists('pk')]),
+        storage.TransactPut(schema, {'pk': 'a', 'sk': 1}, [storage.attribute_not_exists('pk')]),
+    ]))
+    result['transaction_wrote_nothing'] = table.get_item({'pk': 'c', 'sk': 1})
+    result['transaction_applied'] = outcome(lambda: storage.transact_write([
+        storage.TransactPut(schema, {'pk': 'c', 'sk': 1}, [storage.attribute_not_exists('pk')]),
+        storage.TransactPut(schema, {'pk': 'c', 'sk': 2}, None),
+    ]))
+    result['transaction_items'] = keys_of(table.query('c').items)
+    return json.loads(json.dumps(result, default=storage.json_default, sort_keys=True))
+
+
+def run(backend, schema):
+    storage.set_backend(backend)
+    return transcript(backend.table(schema), schema)
+
+
+def differences(reference, other, path=''):
+    """Readable lines for every place other differs from reference"""
+    if isinstance(reference, dict) and isinstance(other, dict):
+        lines = []
+        for key in sorted(set(reference) | set(other)):
+            lines += differences(reference.get(key), other.get(key), f'{path}.{key}' if path else key)
+        return lines
+    if reference != other:
+        return [f'{path}: {json.dumps(reference)} != {json.dumps(other)}']
+    return []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check that the storage backends agree')
+    parser.add_argument('--dynamodb-table',
+                        help='Also check DynamoDB, against an empty table laid out as parity_schema() describes')
+    args = parser.parse_args(argv)
+
+    sqlite_path = os.path.join(tempfile.mkdtemp(prefix='cowswithak-parity-'), 'parity.db')
+    backends = [
+        ('memory', storage.MemoryBackend(), parity_schema()),
+        ('sqlite', storage.SQLiteBackend(sqlite_path), parity_schema()),
+    ]
+    if args.dynamodb_table:
+        backends.append(('dynamodb', storage.DynamoDBBackend(), parity_schema(args.dynamodb_table)))
+
+    reference_name, reference = None, None
+    failures = 0
+    for name, backend, schema in backends:
+        result = run(backend, schema)
+        if reference is None:
+            reference_name, reference = name, result
+            print(f"{name:<10} reference ({len(result)} checks)")
+            continue
+        lines = differences(reference, result)
+        failures += len(lines)
+        print(f"{name:<10} {'matches ' + reference_name if not lines else f'{len(lines)} differences'}")
+        for line in lines:
+            print(f"  {line}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,270 @@
+"""
+Shared harness for driving the Lambda handlers locally
+Builds API Gateway proxy events, seeds a local storage stand-in and counts storage traffic
+"""
+
+import os
+import sys
+import json
+import base64
+import random
+import time
+import hashlib
+import tempfile
+import threading
+import importlib
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda')
+if LAMBDA_DIR not in sys.path:
+    sys.path.insert(0, LAMBDA_DIR)
+
+# Handlers must never reach AWS from the harness
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+os.environ.setdefault('ARCHIVE_BACKEND', 'local')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+# Spans are still recorded; only the per-request stdout line is suppressed
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+import archive  # noqa: E402
+import clients  # noqa: E402
+import instrumentation  # noqa: E402
+import storage  # noqa: E402
+
+HANDLERS = [
+    'signin',
+    'signup',
+    'signout',
+    'get_current_user',
+    'get_messages',
+    'post_message',
+    'delete_message',
+    'get_replies',
+    'moo_message',
+    'presence',
+    'get_stats',
+    'get_boards',
+    'get_changes',
+    'admin_registrations',
+]
+
+BENCH_PASSWORD = 'MooBench123'
+
+
+def load_handler(name):
+    """Import a handler module by name"""
+    return importlib.import_module(name)
+
+
+def api_event(method, path, resource=None, body=None, token=None, query=None, path_params=None,
+              extra_headers=None):
+    """Build an API Gateway REST (v1) proxy event like the ones Lambda receives"""
+    headers = {
+        'Accept': 'application/json',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Content-Type': 'application/json',
+        'Host': 'api.cowswithak.com',
+        'Origin': 'https://cowswithak.com',
+        'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36',
+        'X-Forwarded-For': '203.0.113.7',
+        'X-Forwarded-Proto': 'https',
+    }
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    headers.update(extra_headers or {})
+    return {
+        'resource': resource or path,
+        'path': path,
+        'httpMethod': method,
+        'headers': headers,
+        'multiValueHeaders': {k: [v] for k, v in headers.items()},
+        'queryStringParameters': query,
+        'multiValueQueryStringParameters': {k: [v] for k, v in query.items()} if query else None,
+        'pathParameters': path_params,
+        'stageVariables': None,
+        'requestContext': {
+            'resourcePath': resource or path,
+            'httpMethod': method,
+            'path': f'/prod{path}',
+            'stage': 'prod',
+            'identity': {'sourceIp': '203.0.113.7'},
+        },
+        'body': json.dumps(body) if body is not None else None,
+        'isBase64Encoded': False,
+    }
+
+
+def make_user(email, clearance='LEVEL 1', status='active', password=BENCH_PASSWORD, iterations=100000):
+    """Build a Users item with a real PBKDF2 password hash"""
+    salt = os.urandom(32)
+    pwd_hash = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+    return {
+        'userId': f'user-{hashlib.md5(email.encode()).hexdigest()}',
+        'email': email,
+        'username': email,
+        'firstName': 'Bench',
+        'lastName': 'Cow',
+        'cowName': f'Bench {email.split("@")[0]}',
+        'passwordHash': base64.b64encode(pwd_hash).decode('utf-8'),
+        'passwordSalt': base64.b64encode(salt).decode('utf-8'),
+        'status': status,
+        'clearanceLevel': clearance,
+        'answers': {'q1': 'Kentucky Bluegrass', 'q2': 'Four (Correct)', 'q3': 'divine', 'q4': 'Grazing'},
+        'createdAt': '2024-01-01T00:00:00',
+        'lastLogin': None,
+    }
+
+
+def issue_token(user):
+    """Sign a JWT for a user the same way signin does"""
+    signin = load_handler('signin')
+    return signin.generate_jwt_token(user)
+
+
+# Words for generated posts; repeating one sentence would trip near-duplicate detection
+CHATTER = (
+    'moo clover fence grass paddock trough barn tractor farmer sunrise meadow hay '
+    'gate bucket rain mud shade oak creek calf herd bell milking silo fog dew '
+    'thistle bale hill pond north south east west morning evening noon dusk '
+    'greener quiet windy muddy fresh sweet long warm cold early late best worst'
+).split()
+
+
+def chatter(n, words=12):
+    """A post's content, distinct for each n and the same every run"""
+    rng = random.Random(n)
+    return f"Moo {n}: " + ' '.join(rng.choice(CHATTER) for _ in range(words))
+
+
+def seed(users=10, messages=200):
+    """Fill the current backend with active users and messages; returns the user items"""
+    post_message = load_handler('post_message')
+    user_items = [make_user(f'cow{i}@bench.cow') for i in range(users)]
+    for user in user_items:
+        storage.users().put(user)
+    for i in range(messages):
+        user = user_items[i % len(user_items)]
+        post_message.create_message(
+            user['userId'], user['username'], f'Moo number {i}: the grass is greener today.',
+            user['clearanceLevel']
+        )
+    return user_items
+
+
+class NullSES:
+    """Stand-in SES client that accepts and discards email"""
+
+    def __init__(self):
+        self.sent = 0
+
+    def send_email(self, **kwargs):
+        self.sent += 1
+        return {'MessageId': f'bench-{self.sent}'}
+
+
+class CountingTable:
+    """Wraps a backend table, counting calls and the bytes of items returned"""
+
+    def __init__(self, table, backend):
+        self._table = table
+        self._backend = backend
+        self._counters = backend.counters
+        self.schema = table.schema
+
+    def __getattr__(self, name):
+        attr = getattr(self._table, name)
+        if name not in ('get_item', 'batch_get_item', 'put_item', 'update_item', 'delete_item', 'scan', 'query'):
+            return attr
+
+        def counted(*args, **kwargs):
+            if self._backend.latency_ms:
+                # Stand-in for the network round trip to DynamoDB
+                time.sleep(self._backend.latency_ms / 1000.0)
+            result = attr(*args, **kwargs)
+            self._counters.record(name, result)
+            return result
+        return counted
+
+
+class StorageCounters:
+    """
+    Per-request storage call and byte counters
+
+    Calls made inside an instrumented request are counted on that request, so
+    reads a handler fans out to helper threads are included; anything else is
+    counted per thread.
+    """
+
+    CALLS = 'harness.storage_calls'
+    BYTES_READ = 'harness.bytes_read'
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def reset(self):
+        self._local.calls = 0
+        self._local.bytes_read = 0
+
+    def record(self, operation, result):
+        size = 0
+        if result is not None:
+            if isinstance(result, storage.Page):
+                items = result.items
+            else:
+                items = result if isinstance(result, list) else [result]
+            size = sum(len(json.dumps(item, default=str)) for item in items if isinstance(item, dict))
+        request = instrumentation.current()
+        if request is not None:
+            request.add_count(self.CALLS)
+            request.add_count(self.BYTES_READ, size)
+            return
+        self._local.calls = getattr(self._local, 'calls', 0) + 1
+        self._local.bytes_read = getattr(self._local, 'bytes_read', 0) + size
+
+    def snapshot(self):
+        """Calls and bytes since reset(), including the last request on this thread"""
+        calls, bytes_read = getattr(self._local, 'calls', 0), getattr(self._local, 'bytes_read', 0)
+        request = instrumentation.last_request()
+        if request is not None and request is not getattr(self._local, 'counted', None):
+            self._local.counted = request
+            calls += request.counts.get(self.CALLS, 0)
+            bytes_read += request.counts.get(self.BYTES_READ, 0)
+        return calls, bytes_read
+
+
+class CountingBackend(storage.Backend):
+    """Backend decorator that counts every storage call made through it"""
+
+    def __init__(self, inner, latency_ms=0.0):
+        super().__init__()
+        self.inner = inner
+        # Added to every storage call; can be changed after seeding
+        self.latency_ms = latency_ms
+        self.counters = StorageCounters()
+
+    def __getattr__(self, name):
+        # Connections and clients the inner backend's transactions use
+        if name == 'inner':
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    def create_table(self, schema):
+        return CountingTable(self.inner.create_table(schema), self)
+
+    def transact_write(self, puts):
+        # The inner backend's transaction, run against this backend's counted tables
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        try:
+            type(self.inner).transact_write(self, puts)
+        finally:
+            self.counters.record('transact_write', None)
+
+
+def install_backend(kind='memory', sqlite_path=None, latency_ms=0.0):
+    """Install a fresh counting backend of the given kind and return it"""
+    inner = storage.SQLiteBackend(sqlite_path) if kind == 'sqlite' else storage.MemoryBackend()
+    backend = CountingBackend(inner, latency_ms)
+    storage.set_backend(backend)
+    archive.set_archive(archive.Archive(archive.LocalStore(tempfile.mkdtemp(prefix='cowswithak-archive-'))))
+    clients.set_client('ses', NullSES())
+    return backend
@@ -0,0 +1,88 @@
+"""
+Import-time profile of each Lambda handler
+Runs `python -X importtime` in a fresh interpreter per handler and reports where cold-start import time goes
+
+Usage:
+    python benchmarks/import_profile.py --top 15 --output import_profile.json
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+import harness
+
+
+def parse_importtime(stderr):
+    """Parse -X importtime lines into (module, self_us, cumulative_us, depth) tuples"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            _, timings = line.split(':', 1)
+            self_us, cumulative_us, name = timings.split('|', 2)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def profile_handler(name, preflight=True):
+    """Import a handler in a clean interpreter, optionally serving an OPTIONS preflight"""
+    code = f'import {name}'
+    if preflight:
+        code += f"; {name}.lambda_handler({{'httpMethod': 'OPTIONS'}}, None)"
+    # Report which heavy modules the preflight pulled in
+    code += "; import sys; print(json.dumps(sorted(m for m in ('boto3', 'botocore', 'jwt', 'sqlite3') if m in sys.modules)))"
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import json; {code}'],
+        cwd=harness.LAMBDA_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'{name}: {result.stderr.strip().splitlines()[-1]}')
+    rows = parse_importtime(result.stderr)
+    top_level = next((r for r in rows if r[0] == name), None)
+    return {
+        'handlerImportUs': top_level[2] if top_level else 0,
+        'totalSelfUs': sum(r[1] for r in rows),
+        'modules': len(rows),
+        'heavyModulesLoaded': json.loads(result.stdout.strip().splitlines()[-1]),
+        'rows': rows,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Profile handler import time')
+    parser.add_argument('--handlers', nargs='*', default=harness.HANDLERS)
+    parser.add_argument('--top', type=int, default=10, help='Slowest modules to list per handler')
+    parser.add_argument('--output', help='Write the full report as JSON')
+    args = parser.parse_args(argv)
+
+    report = {}
+    for name in args.handlers:
+        profile = profile_handler(name)
+        rows = profile.pop('rows')
+        slowest = sorted(rows, key=lambda r: r[1], reverse=True)[:args.top]
+        profile['slowestSelf'] = [{'module': m, 'selfUs': s, 'cumulativeUs': c} for m, s, c, _ in slowest]
+        report[name] = profile
+
+        print(f"{name}: import {profile['handlerImportUs'] / 1000:.1f} ms, "
+              f"{profile['modules']} modules, total {profile['totalSelfUs'] / 1000:.1f} ms; "
+              f"after preflight loaded: {', '.join(profile['heavyModulesLoaded']) or 'none of boto3/jwt/sqlite3'}")
+        for row in profile['slowestSelf']:
+            print(f"    {row['selfUs'] / 1000:8.2f} ms self {row['cumulativeUs'] / 1000:8.2f} ms cum  {row['module']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,399 @@
+"""
+Scenario-based load generator for the Cows with a K Lambda functions
+Replays a mix of cow behaviour through concurrent workers against a local storage stand-in and checks SLOs
+
+Usage:
+    python benchmarks/loadgen.py --cows 200 --duration 60 --workers 32
+    python benchmarks/loadgen.py --scenario benchmarks/scenarios/new_herd.json --output load.json
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import heapq
+import random
+import argparse
+import platform
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import harness
+from bench_handlers import percentile
+
+import router
+
+DEFAULT_SCENARIO = {
+    'name': 'board-evening',
+    'cows': 50,
+    'durationSeconds': 30,
+    # Cows join at random points in this interval instead of all at once
+    'rampSeconds': 5,
+    'seedMessages': 500,
+    # Mean seconds between actions, per cow; arrivals are Poisson
+    'actions': {
+        'poll': 3,
+        'heartbeat': 30,
+        'stats': 60,
+        'moo': 20,
+        'thread': 30,
+        'post': 45,
+        'reply': 90,
+        'delete': 300,
+        'signin': 600,
+    },
+    # New cows arriving across the whole board, per second
+    'arrivals': {
+        'signup': 0.1,
+    },
+    'slo': {
+        'default': {'p95Ms': 100, 'p99Ms': 250, 'errorRate': 0.001},
+        'routes': {
+            # PBKDF2 with 100,000 rounds is slow by design
+            'POST /auth/signin': {'p95Ms': 400, 'p99Ms': 800},
+            'POST /auth/signup': {'p95Ms': 400, 'p99Ms': 800},
+        },
+    },
+}
+
+
+def load_scenario(path=None):
+    """The default scenario, overlaid with a JSON scenario file if one is given"""
+    scenario = copy.deepcopy(DEFAULT_SCENARIO)
+    if path:
+        with open(path) as f:
+            overrides = json.load(f)
+        for key, value in overrides.items():
+            if isinstance(value, dict) and isinstance(scenario.get(key), dict):
+                scenario[key] = {**scenario[key], **value}
+            else:
+                scenario[key] = value
+    return scenario
+
+
+class Cow:
+    """One simulated user: a token and what it last saw on the board"""
+
+    def __init__(self, user):
+        self.user = user
+        self.token = harness.issue_token(user)
+        self.lock = threading.Lock()
+        self.feed = []
+        self.threads = []
+        self.posts = []
+
+    def pick(self, rng, attribute):
+        with self.lock:
+            choices = getattr(self, attribute)
+            return rng.choice(choices) if choices else None
+
+
+# ============================================
+# Actions: each returns a request or None when it does not apply yet
+# ============================================
+
+def poll(cow, rng, n):
+    return harness.api_event('GET', '/messages', token=cow.token, query={'limit': '50'})
+
+
+def heartbeat(cow, rng, n):
+    return harness.api_event('POST', '/presence', token=cow.token)
+
+
+def stats(cow, rng, n):
+    return harness.api_event('GET', '/stats', token=cow.token)
+
+
+def moo(cow, rng, n):
+    message_id = cow.pick(rng, 'feed')
+    if not message_id:
+        return None
+    return harness.api_event(
+        'POST', f'/messages/{message_id}/moo', resource='/messages/{messageId}/moo',
+        token=cow.token, path_params={'messageId': message_id}
+    )
+
+
+def thread(cow, rng, n):
+    message_id = cow.pick(rng, 'threads')
+    if not message_id:
+        return None
+    return harness.api_event(
+        'GET', f'/messages/{message_id}/replies', resource='/messages/{messageId}/replies',
+        token=cow.token, query={'limit': '20'}, path_params={'messageId': message_id}
+    )
+
+
+def post(cow, rng, n):
+    return harness.api_event(
+        'POST', '/messages', token=cow.token,
+        body={'content': harness.chatter(n)},
+        extra_headers={'Idempotency-Key': f'load-{n}'}
+    )
+
+
+def reply(cow, rng, n):
+    message_id = cow.pick(rng, 'feed')
+    if not message_id:
+        return None
+    return harness.api_event(
+        'POST', '/messages', token=cow.token,
+        body={'content': f'Reply {n}: agreed, moo.', 'parentId': message_id}
+    )
+
+
+def delete(cow, rng, n):
+    with cow.lock:
+        if not cow.posts:
+            return None
+        message_id = cow.posts.pop(rng.randrange(len(cow.posts)))
+    return harness.api_event(
+        'DELETE', f'/messages/{message_id}', resource='/messages/{messageId}',
+        token=cow.token, path_params={'messageId': message_id}
+    )
+
+
+def signin(cow, rng, n):
+    return harness.api_event('POST', '/auth/signin', body={
+        'email': cow.user['email'], 'password': harness.BENCH_PASSWORD
+    })
+
+
+def signup(cow, rng, n):
+    return harness.api_event('POST', '/auth/signup', body={
+        'email': f'herd{n}@load.cow',
+        'password': 'StrongMoo123',
+        'firstName': 'Herd',
+        'lastName': 'Cow',
+        'cowName': f'Herd Cow {n}',
+        'answers': {'q1': 'Kentucky Bluegrass', 'q2': 'Four (Correct)', 'q3': 'divine', 'q4': 'Grazing'},
+    })
+
+
+ACTIONS = {
+    'poll': poll,
+    'heartbeat': heartbeat,
+    'stats': stats,
+    'moo': moo,
+    'thread': thread,
+    'post': post,
+    'reply': reply,
+    'delete': delete,
+    'signin': signin,
+    'signup': signup,
+}
+
+
+def observe(cow, action, response):
+    """Update a cow's view of the board from a successful response"""
+    if cow is None or response['statusCode'] >= 300:
+        return
+    body = json.loads(response['body'])
+    with cow.lock:
+        if action == 'poll':
+            cow.feed = [m['messageId'] for m in body.get('messages', [])]
+            cow.threads = [m['messageId'] for m in body.get('messages', []) if m.get('replyCount')]
+        elif action == 'post':
+            cow.posts.append(body['message']['messageId'])
+        elif action == 'signin':
+            cow.token = body.get('token', cow.token)
+
+
+# ============================================
+# Running and reporting
+# ============================================
+
+class Recorder:
+    """Collects one sample per request, keyed by route"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, route, status, latency_ms, service_ms):
+        with self._lock:
+            self.samples.setdefault(route, []).append((status, latency_ms, service_ms))
+
+
+def schedule(scenario, cows, rng, start):
+    """Yield (due time, cow, action) in time order until the scenario ends"""
+    end = start + scenario['durationSeconds']
+    ramp = scenario.get('rampSeconds', 0)
+    heap, sequence = [], itertools.count()
+
+    for cow in cows:
+        joined = start + rng.uniform(0, ramp) if ramp else start
+        for action, every in scenario['actions'].items():
+            if every:
+                heapq.heappush(heap, (joined + rng.expovariate(1.0 / every), next(sequence), cow, action, every))
+    for action, rate in scenario.get('arrivals', {}).items():
+        if rate:
+            heapq.heappush(heap, (start + rng.expovariate(rate), next(sequence), None, action, 1.0 / rate))
+
+    while heap:
+        due, _, cow, action, every = heapq.heappop(heap)
+        if due >= end:
+            continue
+        yield due, cow, action
+        heapq.heappush(heap, (due + rng.expovariate(1.0 / every), next(sequence), cow, action, every))
+
+
+def execute(due, cow, action, n, rng, recorder):
+    """Send one request; latency counts from when it was due, so queueing shows up"""
+    event = ACTIONS[action](cow, rng, n)
+    if event is None:
+        return
+    route = f"{event['httpMethod']} {event['resource']}"
+    module = harness.load_handler(router.ROUTES[(event['httpMethod'], event['resource'])])
+    started = time.perf_counter()
+    try:
+        response = module.lambda_handler(event, None)
+        status = response['statusCode']
+        observe(cow, action, response)
+    except Exception as e:
+        print(f"{route} raised {type(e).__name__}: {e}")
+        status = 599
+    finished = time.perf_counter()
+    recorder.record(route, status, (finished - due) * 1000.0, (finished - started) * 1000.0)
+
+
+def run(scenario, cows, workers, seed=None):
+    """Replay the scenario; returns the recorder and the elapsed seconds"""
+    rng = random.Random(seed)
+    recorder = Recorder()
+    counter = itertools.count()
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Open loop: requests are sent when due, whether or not earlier ones have finished
+        for due, cow, action in schedule(scenario, cows, rng, start):
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(execute, due, cow, action, next(counter), random.Random(rng.random()), recorder)
+
+    return recorder, time.perf_counter() - start
+
+
+def summarize(recorder, elapsed):
+    """Per-route throughput, latency percentiles and error rates"""
+    routes = {}
+    for route, samples in sorted(recorder.samples.items()):
+        latencies = [s[1] for s in samples]
+        service = [s[2] for s in samples]
+        errors = sum(1 for s in samples if s[0] >= 500)
+        routes[route] = {
+            'requests': len(samples),
+            'throughputPerSecond': round(len(samples) / elapsed, 3),
+            'clientErrors': sum(1 for s in samples if 400 <= s[0] < 500),
+            'errors': errors,
+            'errorRate': round(errors / len(samples), 5),
+            'latencyMs': {
+                'p50': round(percentile(latencies, 50), 3),
+                'p95': round(percentile(latencies, 95), 3),
+                'p99': round(percentile(latencies, 99), 3),
+                'max': round(max(latencies), 3),
+            },
+            'serviceMs': {
+                'p50': round(percentile(service, 50), 3),
+                'p95': round(percentile(service, 95), 3),
+            },
+        }
+    total = sum(r['requests'] for r in routes.values())
+    return {
+        'elapsedSeconds': round(elapsed, 3),
+        'requests': total,
+        'throughputPerSecond': round(total / elapsed, 3) if elapsed else 0.0,
+        'errors': sum(r['errors'] for r in routes.values()),
+        'routes': routes,
+    }
+
+
+def check_slos(summary, slo):
+    """Evaluate every route against its SLO; returns a list of failures"""
+    failures = []
+    for route, result in summary['routes'].items():
+        target = {**slo.get('default', {}), **slo.get('routes', {}).get(route, {})}
+        checks = [
+            ('p95Ms', result['latencyMs']['p95']),
+            ('p99Ms', result['latencyMs']['p99']),
+            ('errorRate', result['errorRate']),
+        ]
+        for name, value in checks:
+            if name in target and value > target[name]:
+                failures.append(f"{route}: {name} {value} > {target[name]}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a traffic scenario against the handlers locally')
+    parser.add_argument('--scenario', help='JSON file overriding the default scenario')
+    parser.add_argument('--cows', type=int, help='Simulated users (overrides the scenario)')
+    parser.add_argument('--duration', type=float, help='Seconds to run (overrides the scenario)')
+    parser.add_argument('--workers', type=int, default=16, help='Concurrent requests in flight')
+    parser.add_argument('--backend', choices=['memory', 'sqlite'], default='memory')
+    parser.add_argument('--sqlite-path', default='load.db')
+    parser.add_argument('--storage-latency-ms', type=float, default=0.0,
+                        help='Delay added to every storage call, e.g. 5 to approximate DynamoDB')
+    parser.add_argument('--seed', type=int, help='Random seed for a repeatable schedule')
+    parser.add_argument('--output', default='load_output.json', help='Machine-readable results file')
+    args = parser.parse_args(argv)
+
+    scenario = load_scenario(args.scenario)
+    if args.cows is not None:
+        scenario['cows'] = args.cows
+    if args.duration is not None:
+        scenario['durationSeconds'] = args.duration
+
+    if args.backend == 'sqlite' and os.path.exists(args.sqlite_path):
+        os.remove(args.sqlite_path)
+    backend = harness.install_backend(args.backend, args.sqlite_path)
+    print(f"Seeding {scenario['cows']} cows and {scenario['seedMessages']} messages...")
+    cows = [Cow(user) for user in harness.seed(scenario['cows'], scenario['seedMessages'])]
+    backend.latency_ms = args.storage_latency_ms
+
+    print(f"Running '{scenario['name']}' for {scenario['durationSeconds']}s with {args.workers} workers")
+    recorder, elapsed = run(scenario, cows, args.workers, args.seed)
+    summary = summarize(recorder, elapsed)
+    failures = check_slos(summary, scenario.get('slo', {}))
+
+    print(f"\n{'route':<36} {'req':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'4xx':>5} {'5xx':>5}")
+    for route, result in summary['routes'].items():
+        latency = result['latencyMs']
+        print(f"{route:<36} {result['requests']:>6} {result['throughputPerSecond']:>8.2f} "
+              f"{latency['p50']:>9.2f} {latency['p95']:>9.2f} {latency['p99']:>9.2f} "
+              f"{result['clientErrors']:>5} {result['errors']:>5}")
+    print(f"\n{summary['requests']} requests in {summary['elapsedSeconds']}s "
+          f"({summary['throughputPerSecond']} req/s), {summary['errors']} errors")
+
+    report = {
+        'meta': {
+            'generatedAt': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'backend': args.backend,
+            'workers': args.workers,
+            'storageLatencyMs': args.storage_latency_ms,
+        },
+        'scenario': scenario,
+        'summary': summary,
+        'slo': {'passed': not failures, 'failures': failures},
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+    if failures:
+        print('\nSLO FAILED:')
+        for line in failures:
+            print(f"  - {line}")
+        return 1
+    print('\nSLO PASSED')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -367,13 +367,16 @@ const AWSBackend = {
    */
   MessageBoard: {
     /**
-     * Get messages - GET /messages
+     * Get messages - GET /messages (the default board when boardId is null)
      */
-    async getMessages(limit = 50, lastKey = null) {
+    async getMessages(limit = 50, lastKey = null, boardId = null) {
       try {
         const token = AWSBackend._authToken || localStorage.getItem('cow_auth_token');
         
         let url = `${API_BASE_URL}/messages?limit=${limit}`;
+        if (boardId) {
+          url += `&boardId=${encodeURIComponent(boardId)}`;
+        }
         if (lastKey) {
           url += `&lastKey=${lastKey}`;
         }
@@ -400,23 +403,114 @@ const AWSBackend = {
     },
 
     /**
-     * Post message - POST /messages
+     * Get what changed on a board since a sync - GET /messages/changes
+     * since is the changeSeq from getMessages, or the since of the previous sync;
+     * a 410 (CHANGES_EXPIRED) means the board must be reloaded instead
      */
-    async postMessage(content) {
+    async getChanges(since, boardId = null, limit = 100) {
       try {
         const token = AWSBackend._authToken || localStorage.getItem('cow_auth_token');
-        
-        const response = await fetch(`${API_BASE_URL}/messages`, {
-          method: 'POST',
+
+        let url = `${API_BASE_URL}/messages/changes?since=${since}&limit=${limit}`;
+        if (boardId) {
+          url += `&boardId=${encodeURIComponent(boardId)}`;
+        }
+
+        const response = await fetch(url, {
+          method: 'GET',
           headers: {
             'Content-Type': 'application/json',
             'Authorization': `Bearer ${token}`
-          },
-          body: JSON.stringify({ content })
+          }
         });
 
         const data = await response.json();
 
+        if (!response.ok) {
+          const error = new Error(data.error || 'Failed to retrieve changes');
+          error.code = data.code;
+          throw error;
+        }
+
+        return data;
+      } catch (error) {
+        console.error('Get changes error:', error);
+        throw error;
+      }
+    },
+
+    /**
+     * Get the replies in a thread - GET /messages/{messageId}/replies
+     * Only called when a thread is expanded; the feed carries just replyCount
+     */
+    async getReplies(messageId, limit = 20, lastKey = null) {
+      try {
+        const token = AWSBackend._authToken || localStorage.getItem('cow_auth_token');
+
+        let url = `${API_BASE_URL}/messages/${messageId}/replies?limit=${limit}`;
+        if (lastKey) {
+          url += `&lastKey=${lastKey}`;
+        }
+
+        const response = await fetch(url, {
+          method: 'GET',
+          headers: {
+            'Content-Type': 'application/json',
+            'Authorization': `Bearer ${token}`
+          }
+        });
+
+        const data = await response.json();
+
+        if (!response.ok) {
+          throw new Error(data.error || 'Failed to retrieve replies');
+        }
+
+        return data;
+      } catch (error) {
+        console.error('Get replies error:', error);
+        throw error;
+      }
+    },
+
+    /**
+     * Post message - POST /messages (a reply when parentId is given; replies
+     * go on their parent's board, so boardId is only sent for new messages)
+     * Retries on network errors with the same Idempotency-Key, so a post that
+     * reached the server before the connection dropped is not stored twice
+     */
+    async postMessage(content, parentId = null, idempotencyKey = crypto.randomUUID(), boardId = null) {
+      try {
+        const token = AWSBackend._authToken || localStorage.getItem('cow_auth_token');
+        const request = {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+            'Authorization': `Bearer ${token}`,
+            'Idempotency-Key': idempotencyKey
+          },
+          body: JSON.stringify(parentId ? { content, parentId } : boardId ? { content, boardId } : { content })
+        };
+
+        let response;
+        for (let attempt = 1; ; attempt++) {
+          try {
+            response = await fetch(`${API_BASE_URL}/messages`, request);
+          } catch (networkError) {
+            if (attempt >= 3) throw networkError;
+            await new Promise(resolve => setTimeout(resolve, 250 * attempt));
+            continue;
+          }
+          // The first attempt is still being processed; ask again shortly
+          if (response.status === 409 && attempt < 3) {
+            await new Promise(resolve => setTimeout(resolve, 250 * attempt));
+            continue;
+          }
+          break;
+        }
+
+        const data = await response.json();
+
         if (!response.ok) {
           throw new Error(data.error || 'Failed to post message');
         }
@@ -454,6 +548,135 @@ const AWSBackend = {
         console.error('Delete message error:', error);
         throw error;
       }
+    },
+
+    /**
+     * Moo a message - POST /messages/{messageId}/moo (DELETE takes it back)
+     */
+    async mooMessage(messageId, mooed = true) {
+      try {
+        const token = AWSBackend._authToken || localStorage.getItem('cow_auth_token');
+
+        const response = await fetch(`${API_BASE_URL}/messages/${messageId}/moo`, {
+          method: mooed ? 'POST' : 'DELETE',
+          headers: {
+            'Content-Type': 'application/json',
+            'Authorization': `Bearer ${token}`
+          }
+        });
+
+        const data = await response.json();
+
+        if (!response.ok) {
+          throw new Error(data.error || 'Failed to moo');
+        }
+
+        return data;
+      } catch (error) {
+        console.error('Moo error:', error);
+        throw error;
+      }
+    }
+  },
+
+  /**
+   * Presence Operations
+   */
+  Presence: {
+    /**
+     * Heartbeat - POST /presence
+     * Marks this cow as online and returns the online count
+     */
+    async heartbeat() {
+      try {
+        const token = AWSBackend._authToken || localStorage.getItem('cow_auth_token');
+
+        const response = await fetch(`${API_BASE_URL}/presence`, {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+            'Authorization': `Bearer ${token}`
+          }
+        });
+
+        const data = await response.json();
+
+        if (!response.ok) {
+          throw new Error(data.error || 'Failed to send heartbeat');
+        }
+
+        return data;
+      } catch (error) {
+        console.error('Heartbeat error:', error);
+        throw error;
+      }
+    }
+  },
+
+  /**
+   * Board Operations
+   */
+  Boards: {
+    /**
+     * Boards this cow may read - GET /boards
+     */
+    async list() {
+      try {
+        const token = AWSBackend._authToken || localStorage.getItem('cow_auth_token');
+
+        const response = await fetch(`${API_BASE_URL}/boards`, {
+          method: 'GET',
+          headers: {
+            'Content-Type': 'application/json',
+            'Authorization': `Bearer ${token}`
+          }
+        });
+
+        const data = await response.json();
+
+        if (!response.ok) {
+          throw new Error(data.error || 'Failed to load boards');
+        }
+
+        return data;
+      } catch (error) {
+        console.error('Boards error:', error);
+        throw error;
+      }
+    }
+  },
+
+  /**
+   * Statistics Operations
+   */
+  Stats: {
+    /**
+     * Board statistics - GET /stats
+     * Totals, daily rollups and this cow's post count; may be up to 30 seconds old
+     */
+    async get() {
+      try {
+        const token = AWSBackend._authToken || localStorage.getItem('cow_auth_token');
+
+        const response = await fetch(`${API_BASE_URL}/stats`, {
+          method: 'GET',
+          headers: {
+            'Content-Type': 'application/json',
+            'Authorization': `Bearer ${token}`
+          }
+        });
+
+        const data = await response.json();
+
+        if (!response.ok) {
+          throw new Error(data.error || 'Failed to load statistics');
+        }
+
+        return data;
+      } catch (error) {
+        console.error('Stats error:', error);
+        throw error;
+      }
     }
   }
 };
@@ -1001,15 +1224,81 @@ const DashboardView = ({ user }) => {
   const [newMessage, setNewMessage] = useState('');
   const [messageLoading, setMessageLoading] = useState(false);
   const [messageError, setMessageError] = useState('');
+  // messageId -> { open, replies, lastKey } for threads that have been expanded
+  const [threads, setThreads] = useState({});
+  // userId -> { username, cowName, avatar }, as sent alongside each page
+  const [authors, setAuthors] = useState({});
+  const [onlineCount, setOnlineCount] = useState(null);
+  // { stats, myPosts } from GET /stats
+  const [boardStats, setBoardStats] = useState(null);
+  // Boards from GET /boards; null boardId means the default board
+  const [boards, setBoards] = useState([]);
+  const [boardId, setBoardId] = useState(null);
   const messagesEndRef = useRef(null);
+  // Latest change applied to the board, from GET /messages and then each sync
+  const changeSeqRef = useRef(null);
+  // Messages this tab posted, already shown, so their logged posts are skipped
+  const postedIdsRef = useRef(new Set());
 
-  // Load messages when board tab is active
+  // Load messages when board tab is active, and again when the board changes
   useEffect(() => {
     if (activeTab === 'board') {
       loadMessages();
+      loadStats();
+    }
+  }, [activeTab, boardId]);
+
+  useEffect(() => {
+    if (activeTab === 'board' && boards.length === 0) {
+      loadBoards();
     }
   }, [activeTab]);
 
+  const loadBoards = async () => {
+    try {
+      const data = await AWSBackend.Boards.list();
+      setBoards(data.boards || []);
+    } catch (error) {
+      // Only the default board is offered without the list
+    }
+  };
+
+  const currentBoard = boards.find(b => b.boardId === boardId) || boards[0];
+
+  const loadStats = async () => {
+    try {
+      const data = await AWSBackend.Stats.get();
+      setBoardStats({ stats: data.stats, myPosts: data.posts?.[user?.attributes?.sub] ?? 0 });
+    } catch (error) {
+      // Statistics are decorative; leave the last ones showing
+    }
+  };
+
+  // Heartbeat while the board is open; the response carries the online count
+  useEffect(() => {
+    if (activeTab !== 'board') return;
+
+    let timer = null;
+    let cancelled = false;
+    const beat = async () => {
+      let delaySeconds = 30;
+      try {
+        const data = await AWSBackend.Presence.heartbeat();
+        if (!cancelled) setOnlineCount(data.online);
+        delaySeconds = data.heartbeatSeconds || delaySeconds;
+      } catch (error) {
+        // Presence is decorative; keep trying quietly
+      }
+      if (!cancelled) timer = setTimeout(beat, delaySeconds * 1000);
+    };
+    beat();
+
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [activeTab]);
+
   // Auto-scroll to bottom when new messages arrive
   useEffect(() => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -1019,9 +1308,11 @@ const DashboardView = ({ user }) => {
     setMessageLoading(true);
     setMessageError('');
     try {
-      const data = await AWSBackend.MessageBoard.getMessages(50);
+      const data = await AWSBackend.MessageBoard.getMessages(50, null, boardId);
       if (data.success && data.messages) {
         setMessages(data.messages);
+        setAuthors(prev => ({ ...prev, ...(data.authors || {}) }));
+        changeSeqRef.current = data.changeSeq ?? null;
       }
     } catch (error) {
       console.error('Failed to load messages:', error);
@@ -1048,6 +1339,72 @@ const DashboardView = ({ user }) => {
     }
   };
 
+  const applyChange = (change) => {
+    const bumpReplies = (delta) => setMessages(prev => prev.map(msg =>
+      msg.messageId === change.parentId ? { ...msg, replyCount: Math.max(0, (msg.replyCount || 0) + delta) } : msg
+    ));
+
+    if (change.type === 'post') {
+      if (postedIdsRef.current.has(change.messageId)) return;
+      if (change.parentId) {
+        bumpReplies(1);
+        setThreads(prev => prev[change.parentId] ? {
+          ...prev,
+          [change.parentId]: { ...prev[change.parentId], replies: [...prev[change.parentId].replies, change.message] }
+        } : prev);
+      } else {
+        setMessages(prev => prev.some(msg => msg.messageId === change.messageId) ? prev : [...prev, change.message]);
+      }
+    } else if (change.type === 'edit') {
+      setMessages(prev => prev.map(msg =>
+        msg.messageId === change.messageId ? { ...msg, ...change.fields } : msg
+      ));
+    } else if (change.type === 'delete') {
+      if (change.parentId) {
+        bumpReplies(-1);
+        setThreads(prev => prev[change.parentId] ? {
+          ...prev,
+          [change.parentId]: {
+            ...prev[change.parentId],
+            replies: prev[change.parentId].replies.filter(reply => reply.messageId !== change.messageId)
+          }
+        } : prev);
+      } else {
+        setMessages(prev => prev.filter(msg => msg.messageId !== change.messageId));
+      }
+    }
+  };
+
+  // Catch up with what changed since the last load instead of reloading the board
+  const syncMessages = async () => {
+    if (changeSeqRef.current === null) {
+      return loadMessages();
+    }
+    setMessageError('');
+    try {
+      let hasMore = true;
+      while (hasMore) {
+        const data = await AWSBackend.MessageBoard.getChanges(changeSeqRef.current, boardId);
+        setAuthors(prev => ({ ...prev, ...(data.authors || {}) }));
+        data.changes.forEach(applyChange);
+        changeSeqRef.current = data.since;
+        hasMore = data.hasMore;
+      }
+    } catch (error) {
+      // Away longer than the log keeps changes (CHANGES_EXPIRED), or no log: reload
+      loadMessages();
+    }
+  };
+
+  // Catch up when the connection comes back
+  useEffect(() => {
+    if (activeTab !== 'board') return;
+
+    const onOnline = () => { syncMessages(); };
+    window.addEventListener('online', onOnline);
+    return () => window.removeEventListener('online', onOnline);
+  }, [activeTab, boardId]);
+
   const handleSendMessage = async () => {
     if (!newMessage.trim()) return;
 
@@ -1056,9 +1413,10 @@ const DashboardView = ({ user }) => {
     setNewMessage(''); // Clear input immediately
 
     try {
-      const data = await AWSBackend.MessageBoard.postMessage(messageContent);
+      const data = await AWSBackend.MessageBoard.postMessage(messageContent, null, undefined, boardId);
       if (data.success && data.message) {
         // Add new message to the list
+        postedIdsRef.current.add(data.message.messageId);
         setMessages(prev => [...prev, data.message]);
       }
     } catch (error) {
@@ -1068,6 +1426,70 @@ const DashboardView = ({ user }) => {
     }
   };
 
+  const handleMoo = async (messageId) => {
+    try {
+      const data = await AWSBackend.MessageBoard.mooMessage(messageId);
+      if (data.changed) {
+        // The stored total catches up on the next rollup; count our moo now
+        setMessages(prev => prev.map(msg =>
+          msg.messageId === messageId ? { ...msg, mooCount: (msg.mooCount || 0) + 1 } : msg
+        ));
+      }
+    } catch (error) {
+      setMessageError(error.message || 'Failed to moo');
+    }
+  };
+
+  const loadReplies = async (messageId, lastKey = null) => {
+    try {
+      const data = await AWSBackend.MessageBoard.getReplies(messageId, 20, lastKey);
+      setAuthors(prev => ({ ...prev, ...(data.authors || {}) }));
+      setThreads(prev => ({
+        ...prev,
+        [messageId]: {
+          open: true,
+          replies: [...(lastKey ? prev[messageId]?.replies || [] : []), ...data.replies],
+          lastKey: data.lastKey || null
+        }
+      }));
+    } catch (error) {
+      setMessageError(error.message || 'Failed to load replies');
+    }
+  };
+
+  const handleToggleThread = (messageId) => {
+    if (threads[messageId]?.open) {
+      setThreads(prev => ({ ...prev, [messageId]: { ...prev[messageId], open: false } }));
+    } else {
+      loadReplies(messageId);
+    }
+  };
+
+  const handleReply = async (messageId) => {
+    const content = window.prompt('Reply to this message:');
+    if (!content || !content.trim()) return;
+
+    try {
+      const data = await AWSBackend.MessageBoard.postMessage(content.trim(), messageId);
+      if (data.success && data.message) {
+        postedIdsRef.current.add(data.message.messageId);
+        setMessages(prev => prev.map(msg =>
+          msg.messageId === messageId ? { ...msg, replyCount: (msg.replyCount || 0) + 1 } : msg
+        ));
+        setThreads(prev => ({
+          ...prev,
+          [messageId]: {
+            open: true,
+            replies: [...(prev[messageId]?.replies || []), data.message],
+            lastKey: prev[messageId]?.lastKey || null
+          }
+        }));
+      }
+    } catch (error) {
+      setMessageError(error.message || 'Failed to post reply');
+    }
+  };
+
   const handleDeleteMessage = async (messageId) => {
     if (!window.confirm('Delete this message from the pasture?')) return;
 
@@ -1158,9 +1580,23 @@ const DashboardView = ({ user }) => {
             {activeTab === 'board' && (
               <div className="h-full flex flex-col relative z-10">
                 <div className="flex items-center justify-between mb-4">
-                  <h2 className="text-4xl font-display text-grass-green border-b-4 border-soft-pink pb-2 inline-block">Herd Chatter</h2>
+                  <h2 className="text-4xl font-display text-grass-green border-b-4 border-soft-pink pb-2 inline-block">{currentBoard?.name || 'Herd Chatter'}</h2>
+                  {boards.length > 1 && (
+                    <select
+                      value={currentBoard?.boardId || ''}
+                      onChange={(e) => { setMessages([]); setThreads({}); setBoardId(e.target.value); }}
+                      className="border-2 border-cow-black bg-white p-2 rounded-lg font-body text-sm"
+                    >
+                      {boards.map(b => (
+                        <option key={b.boardId} value={b.boardId}>{b.name}</option>
+                      ))}
+                    </select>
+                  )}
+                  {onlineCount !== null && (
+                    <span className="text-sm text-gray-500 font-body">🐄 {onlineCount} in the pasture now</span>
+                  )}
                   <button 
-                    onClick={loadMessages}
+                    onClick={() => { syncMessages(); loadStats(); }}
                     disabled={messageLoading}
                     className="text-sm bg-grass-green text-white px-4 py-2 rounded-lg hover:bg-dark-grass transition-colors disabled:opacity-50"
                   >
@@ -1168,6 +1604,12 @@ const DashboardView = ({ user }) => {
                   </button>
                 </div>
                 
+                {boardStats && (
+                  <p className="text-sm text-gray-500 font-body mb-4">
+                    {boardStats.stats.messages} messages · {boardStats.stats.activeCows} cows · {boardStats.stats.postsToday} posts today · you've posted {boardStats.myPosts}
+                  </p>
+                )}
+
                 {messageError && (
                   <div className="bg-soft-pink/20 border-l-4 border-soft-pink text-cow-black px-4 py-2 mb-4 text-sm">
                     {messageError}
@@ -1189,8 +1631,11 @@ const DashboardView = ({ user }) => {
                       return (
                         <div key={msg.messageId} className={`flex flex-col space-y-1 ${isCurrentUser ? 'items-end' : 'items-start'}`}>
                           <div className="flex items-center space-x-2">
+                            {authors[msg.userId]?.avatar && (
+                              <img src={authors[msg.userId].avatar} alt="" className="h-5 w-5 rounded-full object-cover" />
+                            )}
                             <span className={`text-xs font-bold uppercase ${isCurrentUser ? 'text-soft-pink' : 'text-grass-green'}`}>
-                              {msg.username}
+                              {authors[msg.userId]?.cowName || authors[msg.userId]?.username || msg.username}
                             </span>
                             <span className="text-xs text-gray-400">{formatTimestamp(msg.timestamp)}</span>
                           </div>
@@ -1200,8 +1645,34 @@ const DashboardView = ({ user }) => {
                                 ? 'bg-cow-black text-white border-r-4 border-soft-pink' 
                                 : 'bg-gray-100 text-cow-black border-l-4 border-grass-green'
                             }`}>
-                              {msg.content}
+                              {msg.renderedContent !== undefined ? (
+                                // Escaped and linkified by the API when the message was posted
+                                <span dangerouslySetInnerHTML={{ __html: msg.renderedContent }} />
+                              ) : (
+                                msg.content
+                              )}
                             </div>
+                            <button
+                              onClick={() => handleMoo(msg.messageId)}
+                              className="text-xs p-1 text-gray-500 hover:text-grass-green"
+                              title="Moo"
+                            >
+                              🐄 {msg.mooCount || 0}
+                            </button>
+                            <button
+                              onClick={() => handleToggleThread(msg.messageId)}
+                              className="text-xs p-1 text-gray-500 hover:text-grass-green"
+                              title={threads[msg.messageId]?.open ? 'Hide replies' : 'Show replies'}
+                            >
+                              💬 {msg.replyCount || 0}
+                            </button>
+                            <button
+                              onClick={() => handleReply(msg.messageId)}
+                              className="text-xs p-1 text-gray-500 hover:text-grass-green"
+                              title="Reply"
+                            >
+                              Reply
+                            </button>
                             {isCurrentUser && (
                               <button 
                                 onClick={() => handleDeleteMessage(msg.messageId)}
@@ -1212,6 +1683,25 @@ const DashboardView = ({ user }) => {
                               </button>
                             )}
                           </div>
+                          {threads[msg.messageId]?.open && (
+                            <div className="ml-6 pl-3 border-l-2 border-gray-200 space-y-2 max-w-[80%]">
+                              {threads[msg.messageId].replies.map((reply) => (
+                                <div key={reply.messageId} className="text-sm font-body">
+                                  <span className="text-xs font-bold uppercase text-grass-green mr-2">{authors[reply.userId]?.cowName || reply.username}</span>
+                                  <span className="text-xs text-gray-400 mr-2">{formatTimestamp(reply.timestamp)}</span>
+                                  <span dangerouslySetInnerHTML={{ __html: reply.renderedContent }} />
+                                </div>
+                              ))}
+                              {threads[msg.messageId].lastKey && (
+                                <button
+                                  onClick={() => loadReplies(msg.messageId, threads[msg.messageId].lastKey)}
+                                  className="text-xs text-gray-500 hover:text-grass-green"
+                                >
+                                  More replies
+                                </button>
+                              )}
+                            </div>
+                          )}
                         </div>
                       );
                     })
@@ -1224,13 +1714,14 @@ const DashboardView = ({ user }) => {
                     value={newMessage}
                     onChange={(e) => setNewMessage(e.target.value)}
                     onKeyPress={(e) => e.key === 'Enter' && handleSendMessage()}
-                    placeholder="Type a message..." 
+                    placeholder={currentBoard && !currentBoard.canPost ? 'This board is read-only for you' : 'Type a message...'}
+                    disabled={currentBoard && !currentBoard.canPost}
                     maxLength={500}
                     className="flex-1 border-2 border-cow-black bg-white p-4 rounded-l-lg focus:outline-none focus:border-soft-pink font-body" 
                   />
                   <button 
                     onClick={handleSendMessage}
-                    disabled={!newMessage.trim()}
+                    disabled={!newMessage.trim() || (currentBoard && !currentBoard.canPost)}
                     className="bg-grass-green text-white px-8 rounded-r-lg hover:bg-soft-pink hover:text-cow-black font-display text-xl transition-colors border-2 border-cow-black border-l-0 disabled:opacity-50 disabled:cursor-not-allowed"
                   >
                     Moo!
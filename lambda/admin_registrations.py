@@ -0,0 +1,195 @@
+"""
+AWS Lambda function for reviewing pending registrations
+Lists users awaiting approval and approves or rejects them in batches (TOP SECRET clearance only)
+"""
+
+import json
+from datetime import datetime
+import auth
+import instrumentation
+import storage
+
+MAX_REVIEW_BATCH = 100
+CLEARANCE_LEVELS = ('LEVEL 1', 'LEVEL 2', 'TOP SECRET')
+# action -> status the user moves to
+REVIEW_ACTIONS = {'approve': 'active', 'reject': 'rejected'}
+
+# CORS headers
+HEADERS = auth.cors_headers('GET,POST,OPTIONS')
+
+
+def authenticate_admin(event):
+    """Return (admin user, None) or (None, error response)"""
+    user, error = auth.authenticate_user(event, HEADERS, require_active=False)
+    if error:
+        return None, error
+
+    if user.get('status') != 'active' or user.get('clearanceLevel') != 'TOP SECRET':
+        return None, auth.error_response(HEADERS, 403, 'Reviewing registrations requires TOP SECRET clearance', 'FORBIDDEN')
+
+    return user, None
+
+
+def encode_last_key(last_key):
+    """Pagination key for clients: '<createdAt>|<email>' of the last user on the page"""
+    if not last_key:
+        return None
+    return f"{last_key['createdAt']}|{last_key['email']}"
+
+
+def decode_last_key(value):
+    if not value or '|' not in value:
+        return None, None
+    created_at, _, email = value.partition('|')
+    return created_at, email
+
+
+@instrumentation.instrumented('GET /admin/registrations')
+def list_registrations(event, context):
+    """
+    List pending registrations, oldest first
+
+    Query parameters:
+    - limit: Maximum number of users (default 25, max 100)
+    - lastKey: Pagination key from the previous page
+    """
+    try:
+        admin, error = authenticate_admin(event)
+        if error:
+            return error
+
+        query_params = event.get('queryStringParameters') or {}
+        try:
+            limit = max(1, min(int(query_params.get('limit', 25)), 100))
+        except ValueError:
+            return auth.error_response(HEADERS, 400, 'limit must be a number', 'INVALID_LIMIT')
+
+        created_at, email = decode_last_key(query_params.get('lastKey'))
+
+        # Reads only the sparse pending-index, so cost follows the queue length
+        page = storage.users().list_pending(limit, created_at, email)
+
+        result = {
+            'success': True,
+            'registrations': page.items
+        }
+        if page.last_key:
+            result['lastKey'] = encode_last_key(page.last_key)
+
+        with instrumentation.span('serialize'):
+            response_body = json.dumps(result, default=storage.json_default)
+
+        return {
+            'statusCode': 200,
+            'headers': HEADERS,
+            'body': response_body
+        }
+
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return auth.error_response(HEADERS, 500, 'Internal server error', 'INTERNAL_ERROR')
+
+
+def record_approvals(count, reviewed_at):
+    """Count newly active cows in the board statistics (best effort)"""
+    try:
+        storage.stats().record_approvals(count, reviewed_at)
+    except Exception as e:
+        print(f"Error recording stats: {str(e)}")
+
+
+@instrumentation.instrumented('POST /admin/registrations')
+def review_registrations(event, context):
+    """
+    Approve or reject pending registrations
+
+    Expected body:
+    {
+        "action": "approve" | "reject",
+        "emails": ["cow@example.com", ...],
+        "clearanceLevel": "LEVEL 1" (optional, approve only)
+    }
+
+    Each user is updated only if still pending, so reviewing the same user
+    twice (or two admins racing) changes them at most once.
+    """
+    try:
+        admin, error = authenticate_admin(event)
+        if error:
+            return error
+
+        body = json.loads(event.get('body') or '{}')
+        action = body.get('action')
+        emails = body.get('emails') or []
+        clearance_level = body.get('clearanceLevel')
+
+        if action not in REVIEW_ACTIONS:
+            return auth.error_response(HEADERS, 400, 'action must be "approve" or "reject"', 'INVALID_ACTION')
+
+        if not isinstance(emails, list) or not emails or not all(isinstance(e, str) and e for e in emails):
+            return auth.error_response(HEADERS, 400, 'emails must be a non-empty list', 'MISSING_EMAILS')
+
+        if len(emails) > MAX_REVIEW_BATCH:
+            return auth.error_response(HEADERS, 400, f'At most {MAX_REVIEW_BATCH} users per request', 'BATCH_TOO_LARGE')
+
+        if clearance_level is not None and (action != 'approve' or clearance_level not in CLEARANCE_LEVELS):
+            return auth.error_response(HEADERS, 400, 'Invalid clearanceLevel', 'INVALID_CLEARANCE')
+
+        reviewed_at = datetime.utcnow().isoformat()
+        results = storage.users().review_many(
+            emails,
+            REVIEW_ACTIONS[action],
+            admin.get('email'),
+            reviewed_at,
+            clearance_level
+        )
+
+        if action == 'approve':
+            record_approvals(sum(1 for outcome in results.values() if outcome == 'updated'), reviewed_at)
+
+        with instrumentation.span('serialize'):
+            response_body = json.dumps({
+                'success': True,
+                'action': action,
+                'updated': [email for email, outcome in results.items() if outcome == 'updated'],
+                'notPending': [email for email, outcome in results.items() if outcome == 'not_pending'],
+                'failed': [email for email, outcome in results.items() if outcome == 'error']
+            })
+
+        return {
+            'statusCode': 200,
+            'headers': HEADERS,
+            'body': response_body
+        }
+
+    except json.JSONDecodeError:
+        return auth.error_response(HEADERS, 400, 'Invalid JSON in request body', 'INVALID_JSON')
+
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return auth.error_response(HEADERS, 500, 'Internal server error', 'INTERNAL_ERROR')
+
+
+def lambda_handler(event, context):
+    """
+    Main Lambda handler for the registration queue
+
+    Expected headers:
+    Authorization: Bearer <jwt_token> (TOP SECRET clearance)
+
+    GET lists pending registrations; POST approves or rejects a batch.
+    """
+    method = event.get('httpMethod')
+
+    # Handle OPTIONS request for CORS
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': HEADERS,
+            'body': json.dumps({'message': 'OK'})
+        }
+
+    if method == 'POST':
+        return review_registrations(event, context)
+
+    return list_registrations(event, context)
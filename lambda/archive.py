@@ -0,0 +1,331 @@
+"""
+Cold tier for message board posts
+Messages past the retention age live in gzipped NDJSON segments partitioned by day,
+in S3 or a local directory stand-in, and are read back for deep pagination;
+each archived thread also gets a segment of its own, read when it is expanded
+"""
+
+import os
+import gzip
+import json
+import time
+import bisect
+import threading
+from collections import OrderedDict, namedtuple
+
+import clients
+import instrumentation
+import storage
+
+# Object store: s3 (default) or local (a directory, for local runs and load testing)
+ARCHIVE_BACKEND = os.environ.get('ARCHIVE_BACKEND', 's3')
+ARCHIVE_BUCKET = os.environ.get('ARCHIVE_BUCKET', 'cowswithak-archive')
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+
+# Segment listings are cached per container; new segments only appear once a day
+LISTING_TTL_SECONDS = float(os.environ.get('ARCHIVE_LISTING_TTL', '60'))
+SEGMENT_CACHE_SIZE = int(os.environ.get('ARCHIVE_SEGMENT_CACHE_SIZE', '4'))
+SEGMENT_MAX_MESSAGES = int(os.environ.get('ARCHIVE_SEGMENT_MAX_MESSAGES', '5000'))
+
+PREFIX = 'messages/'
+THREAD_PREFIX = 'threads/'
+
+# Pagination keys that point into the archive rather than the hot table
+CURSOR_PREFIX = 'archive:'
+
+# One page of archived messages; cursor is None when the archive is exhausted
+ArchivePage = namedtuple('ArchivePage', ['items', 'cursor'])
+
+
+# ============================================
+# Object stores
+# ============================================
+
+class S3Store:
+    """Segments as objects in an S3 bucket"""
+
+    def __init__(self, bucket, client=None):
+        self.bucket = bucket
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = clients.s3()
+        return self._client
+
+    def put(self, key, data):
+        self.client.put_object(
+            Bucket=self.bucket, Key=key, Body=data,
+            ContentType='application/x-ndjson', ContentEncoding='gzip'
+        )
+
+    def get(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def find(self, key):
+        """The object's bytes, or None if there is no such key"""
+        try:
+            return self.get(key)
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def list(self, prefix):
+        keys = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            keys.extend(obj['Key'] for obj in page.get('Contents', []))
+        return keys
+
+
+class LocalStore:
+    """Segments as files under a directory, laid out like the S3 keys"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a partial segment
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    def get(self, key):
+        with open(self._path(key), 'rb') as f:
+            return f.read()
+
+    def find(self, key):
+        """The file's bytes, or None if there is no such key"""
+        try:
+            return self.get(key)
+        except FileNotFoundError:
+            return None
+
+    def list(self, prefix):
+        keys = []
+        for directory, _, files in os.walk(self._path(prefix.rstrip('/'))):
+            relative = os.path.relpath(directory, self.root).replace(os.sep, '/')
+            keys.extend(f'{relative}/{name}' for name in files if name.endswith('.ndjson.gz'))
+        return keys
+
+
+# ============================================
+# Segments
+# ============================================
+
+def _sort_newest_first(messages):
+    return sorted(messages, key=lambda m: (m.get('timestamp', ''), m.get('messageId', '')), reverse=True)
+
+
+def encode_segment(messages):
+    """Messages (newest first) as gzipped newline-delimited JSON"""
+    lines = ''.join(
+        json.dumps(message, default=storage.json_default, separators=(',', ':')) + '\n'
+        for message in messages
+    )
+    # mtime=0 keeps the bytes identical when a segment is rewritten
+    return gzip.compress(lines.encode('utf-8'), mtime=0)
+
+
+def decode_segment(data):
+    return [json.loads(line) for line in gzip.decompress(data).decode('utf-8').splitlines() if line]
+
+
+def _compact(timestamp):
+    return timestamp.replace(':', '').replace('-', '').replace('.', '')
+
+
+def segment_key(day, messages):
+    """
+    messages/dt=<day>/<newest timestamp>-<oldest timestamp>.ndjson.gz
+
+    messages are newest first. Segments of a day cover time ranges that do
+    not overlap, so keys sort by the newest message they hold and listing
+    in reverse order walks the archive newest first.
+    """
+    newest = _compact(messages[0].get('timestamp', ''))
+    oldest = _compact(messages[-1].get('timestamp', ''))
+    return f'{PREFIX}dt={day}/{newest}-{oldest}.ndjson.gz'
+
+
+def thread_key(parent_id):
+    """threads/<parentId>.ndjson.gz: an archived message followed by its replies, oldest first"""
+    return f'{THREAD_PREFIX}{parent_id}.ndjson.gz'
+
+
+class Archive:
+    """Writes and pages through archived messages"""
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._listing = None
+        self._listed_at = 0.0
+        self._segments = OrderedDict()
+
+    def archived_ids(self, day):
+        """messageIds already in the segments of one day"""
+        with instrumentation.span('archive.list'):
+            keys = self.store.list(f'{PREFIX}dt={day}/')
+        return {message['messageId'] for key in keys for message in self.read(key)}
+
+    def write(self, messages):
+        """
+        Write messages as day-partitioned segments; returns the segment keys
+
+        Pass all of a day's messages in one call: each day is sorted as a
+        whole and split into segments covering consecutive time ranges.
+        Messages a day's existing segments already hold (from a run that
+        failed before deleting them) are left out, so a repeated run adds
+        nothing twice.
+        """
+        by_day = {}
+        for message in messages:
+            by_day.setdefault(message.get('timestamp', '')[:10] or 'unknown', []).append(message)
+
+        keys = []
+        for day, day_messages in sorted(by_day.items()):
+            archived = self.archived_ids(day)
+            day_messages = _sort_newest_first(m for m in day_messages if m['messageId'] not in archived)
+            for start in range(0, len(day_messages), SEGMENT_MAX_MESSAGES):
+                chunk = day_messages[start:start + SEGMENT_MAX_MESSAGES]
+                key = segment_key(day, chunk)
+                with instrumentation.span('archive.put_segment'):
+                    self.store.put(key, encode_segment(chunk))
+                keys.append(key)
+
+        with self._lock:
+            self._listing = None
+        return keys
+
+    def thread(self, parent_id):
+        """(message, its replies oldest first) of an archived thread, or None if it was not archived"""
+        with instrumentation.span('archive.get_thread'):
+            data = self.store.find(thread_key(parent_id))
+        if data is None:
+            return None
+        messages = decode_segment(data)
+        return messages[0], messages[1:]
+
+    def write_thread(self, parent, replies):
+        """
+        Write a top-level message and its replies as the thread's segment; returns its key
+
+        Replies the segment already holds are kept, so replies found after the
+        first write (or by a repeated run) are added rather than replacing it.
+        """
+        archived = self.thread(parent['messageId'])
+        by_id = {reply['messageId']: reply for reply in (archived[1] if archived else [])}
+        by_id.update((reply['messageId'], reply) for reply in replies)
+        ordered = sorted(by_id.values(), key=lambda m: (m.get('timestamp', ''), m['messageId']))
+        key = thread_key(parent['messageId'])
+        with instrumentation.span('archive.put_segment'):
+            self.store.put(key, encode_segment([parent] + ordered))
+        return key
+
+    def segments(self):
+        """Segment keys, newest first"""
+        with self._lock:
+            if self._listing is not None and time.monotonic() - self._listed_at < LISTING_TTL_SECONDS:
+                return self._listing
+        with instrumentation.span('archive.list'):
+            listing = sorted(self.store.list(PREFIX), reverse=True)
+        with self._lock:
+            self._listing, self._listed_at = listing, time.monotonic()
+        return listing
+
+    def read(self, key):
+        """Messages of one segment; recently read segments are kept, since pages walk them in turn"""
+        with self._lock:
+            if key in self._segments:
+                self._segments.move_to_end(key)
+                return self._segments[key]
+        with instrumentation.span('archive.get_segment'):
+            messages = decode_segment(self.store.get(key))
+        with self._lock:
+            self._segments[key] = messages
+            while len(self._segments) > SEGMENT_CACHE_SIZE:
+                self._segments.popitem(last=False)
+        return messages
+
+    def has_messages(self):
+        return bool(self.segments())
+
+    def page(self, limit, cursor=None, accept=None, max_segments=8):
+        """
+        Up to limit archived messages, newest first
+
+        cursor is the value returned by the previous page ('archive:' starts at
+        the newest segment); the returned cursor is None at the end of the archive.
+        With accept, only messages it returns True for are included, and a
+        page reads at most max_segments segments, so it may come back short.
+        Those are read in waves of one, one, two, four... segments, each wave
+        at once, so a sparse board waits on a few reads rather than on each.
+        """
+        listing = self.segments()
+        position, offset = 0, 0
+        if cursor and cursor != CURSOR_PREFIX:
+            key, _, offset = cursor[len(CURSOR_PREFIX):].rpartition('#')
+            offset = int(offset or 0)
+            # Listing is descending; find the cursor's segment by bisecting the reversed keys
+            ascending = listing[::-1]
+            position = len(listing) - bisect.bisect_right(ascending, key)
+            if position < len(listing) and listing[position] != key:
+                offset = 0
+
+        items, segments_read, fetched = [], 0, {}
+        while position < len(listing) and len(items) < limit:
+            key = listing[position]
+            if key not in fetched:
+                if accept is not None and segments_read >= max_segments:
+                    break
+                size = min(max(1, segments_read), max_segments - segments_read) if accept is not None else 1
+                wave = listing[position:position + size]
+                fetched = dict(zip(wave, storage.fan_out(self.read, wave)))
+                segments_read += len(wave)
+            messages = fetched[key]
+            if accept is None:
+                taken = messages[offset:offset + limit - len(items)]
+                items.extend(taken)
+                offset += len(taken)
+            else:
+                while offset < len(messages) and len(items) < limit:
+                    if accept(messages[offset]):
+                        items.append(messages[offset])
+                    offset += 1
+            if offset >= len(messages):
+                position, offset = position + 1, 0
+
+        if position >= len(listing):
+            return ArchivePage(items, None)
+        return ArchivePage(items, f'{CURSOR_PREFIX}{listing[position]}#{offset}')
+
+
+# ============================================
+# Accessors
+# ============================================
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_archive():
+    """The container's archive, built from ARCHIVE_BACKEND on first use"""
+    global _archive
+    if _archive is None:
+        with _archive_lock:
+            if _archive is None:
+                store = LocalStore(ARCHIVE_DIR) if ARCHIVE_BACKEND == 'local' else S3Store(ARCHIVE_BUCKET)
+                _archive = Archive(store)
+    return _archive
+
+
+def set_archive(archive):
+    """Install an archive (e.g. over a temporary directory) in place of the configured one"""
+    global _archive
+    _archive = archive
@@ -0,0 +1,153 @@
+"""
+Request authentication shared by every handler
+Parses the Bearer token, verifies the JWT, checks revocation and loads the caller,
+and builds the JSON error responses the handlers return
+"""
+
+import json
+import os
+import instrumentation
+import storage
+
+# JWT Configuration
+JWT_SECRET = os.environ.get('JWT_SECRET', 'moo-secret-key-change-in-production')
+JWT_ALGORITHM = 'HS256'
+
+
+def cors_headers(methods):
+    """Response headers for a handler serving methods, e.g. 'GET,OPTIONS'"""
+    return {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Headers': 'Content-Type,Authorization',
+        'Access-Control-Allow-Methods': methods
+    }
+
+
+def error_response(headers, status_code, error, code):
+    return {
+        'statusCode': status_code,
+        'headers': headers,
+        'body': json.dumps({
+            'success': False,
+            'error': error,
+            'code': code
+        })
+    }
+
+
+@instrumentation.timed('auth.jwt_verify')
+def verify_token(token):
+    """Verify JWT token and extract payload"""
+    # Deferred: PyJWT is only needed once a request carries a token
+    import jwt
+
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        return True, payload
+    except jwt.ExpiredSignatureError:
+        return False, {'error': 'Token has expired'}
+    except jwt.InvalidTokenError:
+        return False, {'error': 'Invalid token'}
+
+
+@instrumentation.timed('auth.blacklist_check')
+def is_token_blacklisted(token):
+    """Check if token is in blacklist"""
+    try:
+        return storage.blacklist().is_revoked(token, hedge=True)
+    except Exception as e:
+        print(f"Error checking blacklist: {str(e)}")
+        return False
+
+
+@instrumentation.timed('auth.parse_header')
+def extract_token_from_header(headers):
+    """Extract Bearer token from Authorization header"""
+    auth_header = headers.get('Authorization') or headers.get('authorization')
+
+    if not auth_header:
+        return None
+
+    parts = auth_header.split()
+
+    if len(parts) != 2 or parts[0].lower() != 'bearer':
+        return None
+
+    return parts[1]
+
+
+@instrumentation.timed('auth.user_fetch')
+def get_user_by_email(email):
+    """Retrieve user from storage by email"""
+    try:
+        return storage.users().get(email, hedge=True)
+    except Exception as e:
+        print(f"Error retrieving user: {str(e)}")
+        return None
+
+
+@instrumentation.timed('auth.lookups')
+def lookup_token_and_user(token, email):
+    """Blacklist check and user fetch, issued together once the JWT is verified"""
+    return storage.concurrently(
+        lambda: is_token_blacklisted(token),
+        lambda: get_user_by_email(email)
+    )
+
+
+def _verified_token(event, headers):
+    """(token, payload, None) for a genuine token, or (None, None, error response)"""
+    token = extract_token_from_header(event.get('headers') or {})
+
+    if not token:
+        return None, None, error_response(headers, 401, 'No authorization token provided', 'MISSING_TOKEN')
+
+    is_valid, payload = verify_token(token)
+
+    if not is_valid:
+        return None, None, error_response(headers, 401, payload.get('error', 'Invalid token'), 'INVALID_TOKEN')
+
+    return token, payload, None
+
+
+def authenticate_token(event, headers):
+    """
+    Return (token payload, None) or (None, error response)
+
+    The user item is not read, for routes that need no more than the token's
+    userId and clearanceLevel.
+    """
+    token, payload, error = _verified_token(event, headers)
+    if error:
+        return None, error
+
+    if is_token_blacklisted(token):
+        return None, error_response(headers, 401, 'Token has been invalidated', 'TOKEN_BLACKLISTED')
+
+    return payload, None
+
+
+def authenticate_user(event, headers, require_active=True):
+    """
+    Return (user, None) or (None, error response)
+
+    Only a genuine token costs reads: revocation and the user are then
+    looked up together, in one round trip.
+    """
+    token, payload, error = _verified_token(event, headers)
+    if error:
+        return None, error
+
+    blacklisted, user = lookup_token_and_user(token, payload.get('email'))
+
+    if blacklisted:
+        return None, error_response(headers, 401, 'Token has been invalidated', 'TOKEN_BLACKLISTED')
+
+    if not user:
+        return None, error_response(headers, 404, 'User not found', 'USER_NOT_FOUND')
+
+    if require_active and user.get('status') != 'active':
+        return None, error_response(headers, 403, 'Account is not active', 'ACCOUNT_NOT_ACTIVE')
+
+    return user, None
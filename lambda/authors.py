@@ -0,0 +1,98 @@
+"""
+Current display data for message authors
+Looks authors up with one BatchGetItem per page of messages, behind a per-container cache
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import instrumentation
+import storage
+
+# How long a container reuses an author's profile before reading it again
+AUTHOR_CACHE_SECONDS = float(os.environ.get('AUTHOR_CACHE_SECONDS', '300'))
+AUTHOR_CACHE_SIZE = int(os.environ.get('AUTHOR_CACHE_SIZE', '500'))
+
+# Profile pictures are stored inline as data URLs; larger ones are left out of
+# feed responses rather than repeated on every page
+AUTHOR_AVATAR_MAX_BYTES = int(os.environ.get('AUTHOR_AVATAR_MAX_BYTES', '65536'))
+
+# Only what a message needs to show its author; never password hashes or answers
+PROFILE_ATTRIBUTES = ('email', 'userId', 'username', 'cowName', 'profilePicture')
+
+# email -> (expires at, profile or None); None remembers users that do not exist
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def to_profile(user):
+    """The display fields of a user item"""
+    avatar = user.get('profilePicture') or None
+    if avatar and len(avatar) > AUTHOR_AVATAR_MAX_BYTES:
+        avatar = None
+    return {
+        'userId': user.get('userId'),
+        'username': user.get('username', user.get('email')),
+        'cowName': user.get('cowName'),
+        'avatar': avatar
+    }
+
+
+def _cached(emails, now):
+    """(profiles found in the cache, emails that still need reading)"""
+    found, missing = {}, []
+    with _cache_lock:
+        for email in emails:
+            entry = _cache.get(email)
+            if entry and now < entry[0]:
+                found[email] = entry[1]
+            else:
+                missing.append(email)
+    return found, missing
+
+
+def _remember(profiles, now):
+    with _cache_lock:
+        for email, profile in profiles.items():
+            _cache.pop(email, None)
+            _cache[email] = (now + AUTHOR_CACHE_SECONDS, profile)
+        while len(_cache) > AUTHOR_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def profiles(emails, now=None):
+    """
+    email -> profile (or None for unknown users) for every email given
+
+    Emails missing from the cache are read together in one BatchGetItem.
+    """
+    now = now or time.time()
+    emails = list(dict.fromkeys(e.lower() for e in emails if e))
+    found, missing = _cached(emails, now)
+    instrumentation.record_count('authors.cache_hits', len(found))
+
+    if missing:
+        instrumentation.record_count('authors.fetched', len(missing))
+        users = storage.users().get_many(missing, PROFILE_ATTRIBUTES)
+        fetched = {email: to_profile(users[email]) if email in users else None for email in missing}
+        _remember(fetched, now)
+        found.update(fetched)
+    return found
+
+
+def for_messages(messages):
+    """
+    userId -> profile for the authors of response messages
+
+    Messages only carry the username they were posted with, which is the
+    author's email; a profile is used only if its userId matches the message.
+    """
+    by_email = profiles(m.get('username') or '' for m in messages)
+    authors = {}
+    for message in messages:
+        profile = by_email.get((message.get('username') or '').lower())
+        if profile and profile['userId'] == message.get('userId'):
+            authors[profile['userId']] = profile
+    return authors
@@ -0,0 +1,97 @@
+"""
+Boards (channels) and who may read and post on them
+Definitions come from the Boards table, cached per container; feeds are partitioned by boardId
+"""
+
+import os
+import time
+import threading
+
+import storage
+
+# Messages posted without a board, and messages from before boards existed, belong here
+DEFAULT_BOARD_ID = os.environ.get('DEFAULT_BOARD_ID', 'herd')
+
+# How long a container reuses board definitions before reading them again
+BOARD_CACHE_SECONDS = float(os.environ.get('BOARD_CACHE_SECONDS', '60'))
+
+# Lowest to highest
+CLEARANCE_LEVELS = ('LEVEL 1', 'LEVEL 2', 'TOP SECRET')
+
+# Served when the Boards table has no item for the default board (local runs, first deploy)
+DEFAULT_BOARD = {
+    'boardId': DEFAULT_BOARD_ID,
+    'name': 'Herd Chatter',
+    'description': 'The whole herd, all together',
+    'clearanceLevel': 'LEVEL 1'
+}
+
+# (expires at, boardId -> board) shared by every request this container serves
+_cache = {'expires': 0.0, 'boards': None}
+_cache_lock = threading.Lock()
+
+
+def rank(clearance_level):
+    """Position of a clearance level; unknown levels rank below LEVEL 1"""
+    try:
+        return CLEARANCE_LEVELS.index(clearance_level)
+    except ValueError:
+        return -1
+
+
+def all_boards(now=None):
+    """boardId -> board, read from storage at most once per BOARD_CACHE_SECONDS"""
+    now = now or time.time()
+    with _cache_lock:
+        if _cache['boards'] is not None and now < _cache['expires']:
+            return _cache['boards']
+
+        boards = {DEFAULT_BOARD_ID: DEFAULT_BOARD}
+        boards.update((board['boardId'], board) for board in storage.boards().all())
+        _cache['boards'] = boards
+        _cache['expires'] = now + BOARD_CACHE_SECONDS
+        return boards
+
+
+def get(board_id):
+    return all_boards().get(board_id)
+
+
+def board_of(message):
+    """The board a top-level message was posted on"""
+    return message.get('boardId') or DEFAULT_BOARD_ID
+
+
+def can_read(board, clearance_level):
+    return rank(clearance_level) >= rank(board.get('clearanceLevel', 'LEVEL 1'))
+
+
+def can_post(board, clearance_level):
+    """Posting may need more clearance than reading (e.g. announcements)"""
+    required = board.get('postClearanceLevel') or board.get('clearanceLevel', 'LEVEL 1')
+    return can_read(board, clearance_level) and rank(clearance_level) >= rank(required)
+
+
+def readable(board_id, clearance_level):
+    """The board if it exists and clearance_level may read it, otherwise None"""
+    board = get(board_id)
+    if board is None or not can_read(board, clearance_level):
+        return None
+    return board
+
+
+def to_response_board(board, clearance_level):
+    return {
+        'boardId': board['boardId'],
+        'name': board.get('name', board['boardId']),
+        'description': board.get('description', ''),
+        'clearanceLevel': board.get('clearanceLevel', 'LEVEL 1'),
+        'canPost': can_post(board, clearance_level)
+    }
+
+
+def visible(clearance_level):
+    """The boards clearance_level may read, default board first, then by name"""
+    boards = [b for b in all_boards().values() if can_read(b, clearance_level)]
+    boards.sort(key=lambda b: (b['boardId'] != DEFAULT_BOARD_ID, b.get('name', b['boardId']).lower()))
+    return [to_response_board(b, clearance_level) for b in boards]
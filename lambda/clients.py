@@ -0,0 +1,105 @@
+"""
+Lazily constructed AWS clients shared by the Lambda functions
+Nothing is created at import time, so preflights and validation errors never load boto3
+"""
+
+import os
+import threading
+
+# Tuned for a 30 s Lambda timeout: fail fast and retry rather than wait out botocore's 60 s defaults
+CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT', '1.0'))
+READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT', '2.0'))
+MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '3'))
+MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '32'))
+
+_clients = {}
+# Names in _clients that get() built, as opposed to stand-ins from set_client()
+_built = set()
+_lock = threading.Lock()
+
+
+def client_config(**overrides):
+    """botocore Config shared by every client: tight timeouts, adaptive retries, kept-alive connections"""
+    from botocore.config import Config
+
+    settings = {
+        'connect_timeout': CONNECT_TIMEOUT,
+        'read_timeout': READ_TIMEOUT,
+        'retries': {'mode': 'adaptive', 'max_attempts': MAX_ATTEMPTS},
+        # Sized for hedged and concurrent reads from one container
+        'max_pool_connections': MAX_POOL_CONNECTIONS,
+        'tcp_keepalive': True,
+    }
+    settings.update(overrides)
+    return Config(**settings)
+
+
+def _build_dynamodb():
+    import boto3
+    return boto3.resource('dynamodb', config=client_config())
+
+
+def _build_ses():
+    import boto3
+    # Notification email is off the critical path; allow a slower read
+    return boto3.client('ses', config=client_config(read_timeout=5.0))
+
+
+def _build_s3():
+    import boto3
+    # Archive segments can be a few MB; give reads more time than a GetItem
+    return boto3.client('s3', config=client_config(read_timeout=10.0))
+
+
+BUILDERS = {
+    'dynamodb': _build_dynamodb,
+    'ses': _build_ses,
+    's3': _build_s3,
+}
+
+
+def get(name):
+    """Return the memoized client for name, building it on first use"""
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = BUILDERS[name]()
+                _built.add(name)
+    return client
+
+
+def set_max_pool_connections(count):
+    """
+    Size the connection pool of every client, e.g. to a server's worker count
+
+    Clients already built are dropped and rebuilt on next use, so the size
+    applies whenever this is called. Storage tables created before keep the
+    old DynamoDB resource until the backend is reset (Backend.reset()).
+    """
+    global MAX_POOL_CONNECTIONS
+    with _lock:
+        MAX_POOL_CONNECTIONS = count
+        for name in _built:
+            _clients.pop(name, None)
+        _built.clear()
+
+
+def set_client(name, client):
+    """Install a client (or local stand-in) in place of the real one"""
+    with _lock:
+        _clients[name] = client
+        _built.discard(name)
+
+
+def dynamodb():
+    return get('dynamodb')
+
+
+def ses():
+    return get('ses')
+
+
+def s3():
+    return get('s3')
@@ -4,87 +4,83 @@ Allows users to delete their own messages or admins to delete any message
 """
 
 import json
-import boto3
-import os
-import jwt
+import auth
+import boards
+import instrumentation
+import storage
 
-# AWS Clients
-dynamodb = boto3.resource('dynamodb')
-messages_table = dynamodb.Table(os.environ.get('MESSAGES_TABLE', 'CowsWithAK-Messages'))
-users_table = dynamodb.Table(os.environ.get('USERS_TABLE', 'CowsWithAK-Users'))
-blacklist_table = dynamodb.Table(os.environ.get('BLACKLIST_TABLE', 'CowsWithAK-TokenBlacklist'))
-
-# JWT Configuration
-JWT_SECRET = os.environ.get('JWT_SECRET', 'moo-secret-key-change-in-production')
-JWT_ALGORITHM = 'HS256'
-
-
-def verify_token(token):
-    """Verify JWT token and extract payload"""
+def get_message(message_id):
+    """Retrieve message from storage"""
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return True, payload
-    except jwt.ExpiredSignatureError:
-        return False, {'error': 'Token has expired'}
-    except jwt.InvalidTokenError:
-        return False, {'error': 'Invalid token'}
+        return storage.messages().get(message_id)
+    except Exception as e:
+        print(f"Error retrieving message: {str(e)}")
+        return None
 
 
-def is_token_blacklisted(token):
-    """Check if token is in blacklist"""
+def delete_message(message_id):
+    """Delete message from storage"""
     try:
-        response = blacklist_table.get_item(Key={'token': token})
-        return 'Item' in response
+        removed = storage.messages().delete(message_id)
     except Exception as e:
-        print(f"Error checking blacklist: {str(e)}")
+        print(f"Error deleting message: {str(e)}")
         return False
-
-
-def extract_token_from_header(headers):
-    """Extract Bearer token from Authorization header"""
-    auth_header = headers.get('Authorization') or headers.get('authorization')
-    
-    if not auth_header:
-        return None
     
-    parts = auth_header.split()
-    
-    if len(parts) != 2 or parts[0].lower() != 'bearer':
-        return None
-    
-    return parts[1]
-
+    # Only the request that actually removed it uncounts and logs it
+    if removed:
+        storage.concurrently(
+            lambda: record_stats(removed),
+            lambda: record_change(removed)
+        )
+        # On the request thread: it fans out over the batch pool itself
+        delete_thread(removed)
+    return True
+
+
+def delete_thread(message):
+    """
+    Delete a top-level message's replies, which nothing could reach without it (best effort)
 
-def get_user_by_email(email):
-    """Retrieve user from DynamoDB by email"""
+    Clients drop the thread with its parent's tombstone, so the replies are
+    not logged one by one.
+    """
+    if message.get('parentId') or not message.get('replyCount'):
+        return
     try:
-        response = users_table.get_item(Key={'email': email.lower()})
-        return response.get('Item')
+        replies = storage.messages().delete_replies(message['messageId'])
+        storage.stats().record_deletes(replies)
     except Exception as e:
-        print(f"Error retrieving user: {str(e)}")
-        return None
+        print(f"Error deleting replies: {str(e)}")
 
 
-def get_message(message_id):
-    """Retrieve message from DynamoDB"""
+def record_stats(message):
+    """Uncount a deleted message in the board statistics (best effort)"""
     try:
-        response = messages_table.get_item(Key={'messageId': message_id})
-        return response.get('Item')
+        storage.stats().record_delete(message['userId'], message['timestamp'], bool(message.get('parentId')))
     except Exception as e:
-        print(f"Error retrieving message: {str(e)}")
-        return None
+        print(f"Error recording stats: {str(e)}")
 
 
-def delete_message(message_id):
-    """Delete message from DynamoDB"""
+def record_change(message):
+    """Log a delete tombstone for delta sync (best effort)"""
+    entry = {'type': 'delete', 'messageId': message['messageId']}
     try:
-        messages_table.delete_item(Key={'messageId': message_id})
-        return True
+        if message.get('parentId'):
+            # Replies are logged on their parent's board; if the parent is
+            # gone too, clients dropped the whole thread with its tombstone
+            parent = storage.messages().get(message['parentId'])
+            if not parent:
+                return
+            entry['parentId'] = message['parentId']
+            board_id = boards.board_of(parent)
+        else:
+            board_id = boards.board_of(message)
+        storage.changes().append(board_id, [entry])
     except Exception as e:
-        print(f"Error deleting message: {str(e)}")
-        return False
+        print(f"Error recording change: {str(e)}")
 
 
+@instrumentation.instrumented('DELETE /messages/{messageId}')
 def lambda_handler(event, context):
     """
     Main Lambda handler to delete a message
@@ -115,7 +111,7 @@ def lambda_handler(event, context):
     try:
         # Extract and verify token
         request_headers = event.get('headers', {})
-        token = extract_token_from_header(request_headers)
+        token = auth.extract_token_from_header(request_headers)
         
         if not token:
             return {
@@ -128,36 +124,36 @@ def lambda_handler(event, context):
                 })
             }
         
-        # Check if token is blacklisted
-        if is_token_blacklisted(token):
+        # Verify token
+        is_valid, payload = auth.verify_token(token)
+        
+        if not is_valid:
             return {
                 'statusCode': 401,
                 'headers': headers,
                 'body': json.dumps({
                     'success': False,
-                    'error': 'Token has been invalidated',
-                    'code': 'TOKEN_BLACKLISTED'
+                    'error': payload.get('error', 'Invalid token'),
+                    'code': 'INVALID_TOKEN'
                 })
             }
         
-        # Verify token
-        is_valid, payload = verify_token(token)
+        # Only a genuine token costs reads: check revocation and load the
+        # user together, in one round trip
+        email = payload.get('email')
+        blacklisted, user = auth.lookup_token_and_user(token, email)
         
-        if not is_valid:
+        if blacklisted:
             return {
                 'statusCode': 401,
                 'headers': headers,
                 'body': json.dumps({
                     'success': False,
-                    'error': payload.get('error', 'Invalid token'),
-                    'code': 'INVALID_TOKEN'
+                    'error': 'Token has been invalidated',
+                    'code': 'TOKEN_BLACKLISTED'
                 })
             }
         
-        # Get user info from token
-        email = payload.get('email')
-        user = get_user_by_email(email)
-        
         if not user:
             return {
                 'statusCode': 404,
@@ -229,13 +225,16 @@ def lambda_handler(event, context):
             }
         
         # Success response
-        return {
-            'statusCode': 200,
-            'headers': headers,
-            'body': json.dumps({
+        with instrumentation.span('serialize'):
+            response_body = json.dumps({
                 'success': True,
                 'message': 'Message deleted successfully'
             })
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': response_body
         }
         
     except Exception as e:
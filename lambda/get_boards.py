@@ -0,0 +1,59 @@
+"""
+AWS Lambda function to list message boards
+Returns the boards the caller's clearance can read, from the container's cached definitions
+"""
+
+import json
+import auth
+import boards
+import instrumentation
+
+# CORS headers
+HEADERS = auth.cors_headers('GET,OPTIONS')
+
+
+@instrumentation.instrumented('GET /boards')
+def get_boards(event, context):
+    try:
+        # The token's clearanceLevel decides which boards are listed, as it does for the feed
+        payload, error = auth.authenticate_token(event, HEADERS)
+        if error:
+            return error
+
+        with instrumentation.span('serialize'):
+            response_body = json.dumps({
+                'success': True,
+                'defaultBoardId': boards.DEFAULT_BOARD_ID,
+                'boards': boards.visible(payload.get('clearanceLevel', 'LEVEL 1'))
+            })
+
+        return {
+            'statusCode': 200,
+            'headers': HEADERS,
+            'body': response_body
+        }
+
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return auth.error_response(HEADERS, 500, 'Internal server error', 'INTERNAL_ERROR')
+
+
+def lambda_handler(event, context):
+    """
+    Main Lambda handler for the board list
+
+    Expected headers:
+    Authorization: Bearer <jwt_token>
+
+    Boards above the caller's clearance are left out. Each board says whether
+    the caller may post on it. Definitions may be up to BOARD_CACHE_SECONDS old.
+    """
+    # Handle OPTIONS request for CORS
+    if event.get('httpMethod') == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': HEADERS,
+            'body': json.dumps({'message': 'OK'})
+        }
+
+    return get_boards(event, context)
@@ -0,0 +1,185 @@
+"""
+AWS Lambda function for delta sync of a board
+Returns the posts, edits and deletes logged since a client's last sync, so reconnecting clients do not reload pages
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+import auth
+import authors
+import boards
+import instrumentation
+import storage
+from get_messages import to_response_message
+
+# How long a missing seq may still be an entry being written; after that its
+# write is taken to have failed
+CHANGE_SETTLE_SECONDS = float(os.environ.get('CHANGE_SETTLE_SECONDS', '10'))
+DEFAULT_CHANGES_LIMIT = 100
+MAX_CHANGES_LIMIT = 500
+
+# CORS headers
+HEADERS = auth.cors_headers('GET,OPTIONS')
+
+
+def settled_before(now=None):
+    """Changes at or before this time (ISO 8601) are no longer being written"""
+    return ((now or datetime.utcnow()) - timedelta(seconds=CHANGE_SETTLE_SECONDS)).isoformat()
+
+
+def contiguous(entries, since, now=None):
+    """
+    The entries that follow on from since without a gap, and whether the log has expired
+
+    A missing seq may be an entry still being written, so reading stops at a
+    gap until the entry after it is CHANGE_SETTLE_SECONDS old; later gaps
+    are then failed writes and skipped. A settled gap straight after since
+    may just as well be entries the log no longer keeps, so the client is
+    told to reload instead. Returns (entries, expired).
+    """
+    settled = settled_before(now)
+    expected, taken = since + 1, []
+    for entry in entries:
+        seq = int(entry['seq'])
+        if seq != expected:
+            if entry.get('changedAt', '') > settled:
+                break
+            if not taken:
+                return [], True
+        taken.append(entry)
+        expected = seq + 1
+    return taken, False
+
+
+def to_response_change(entry):
+    change = {
+        'seq': int(entry['seq']),
+        'type': entry['type'],
+        'messageId': entry['messageId'],
+        'parentId': entry.get('parentId'),
+        'changedAt': entry.get('changedAt')
+    }
+    if entry['type'] == 'post':
+        change['message'] = to_response_message(entry['message'])
+    elif entry['type'] == 'edit':
+        change['fields'] = {name: storage.json_default(value) for name, value in entry['fields'].items()}
+    return change
+
+
+def get_changes(board_id, since, limit):
+    """
+    A board's changes after since, oldest first; returns (result, None) or (None, error response)
+
+    The board's counter and one Query on its partition of the change log are
+    read together. The returned since is the seq to pass next time; hasMore
+    means another request would return more straight away. A since beyond
+    the counter was never handed out. Changes the counter has counted but
+    the log no longer returns, once the last of them has had time to
+    settle, mean since is older than the log.
+    """
+    changes_log = storage.changes()
+    (latest, counted_at), page = storage.concurrently(
+        lambda: changes_log.head(board_id),
+        lambda: changes_log.after(board_id, since, limit)
+    )
+    if since > latest:
+        return None, auth.error_response(HEADERS, 400, 'since is ahead of the board', 'INVALID_SINCE')
+
+    entries, expired = contiguous(page.items, since)
+    if not entries and not page.items and since < latest:
+        # Nothing at all after since: expired, unless the counter only just moved
+        expired = (counted_at or '') <= settled_before()
+    if expired:
+        return None, auth.error_response(HEADERS, 410, 'Changes this old are no longer kept; reload the board', 'CHANGES_EXPIRED')
+
+    changes = [to_response_change(entry) for entry in entries]
+    result = {
+        'boardId': board_id,
+        'changes': changes,
+        'since': changes[-1]['seq'] if changes else since,
+        'hasMore': bool(page.last_key) and len(entries) == len(page.items)
+    }
+    try:
+        result['authors'] = authors.for_messages([c['message'] for c in changes if 'message' in c])
+    except Exception as e:
+        # Best effort: messages still carry the username they were posted with
+        print(f"Error loading authors: {str(e)}")
+        result['authors'] = {}
+    return result, None
+
+
+@instrumentation.instrumented('GET /messages/changes')
+def changes_since(event, context):
+    try:
+        # The token's clearanceLevel decides which boards may be synced, as it does for the feed
+        payload, error = auth.authenticate_token(event, HEADERS)
+        if error:
+            return error
+
+        query_params = event.get('queryStringParameters') or {}
+        board_id = query_params.get('boardId') or boards.DEFAULT_BOARD_ID
+
+        try:
+            since = int(query_params.get('since', ''))
+        except ValueError:
+            since = -1
+
+        if since < 0:
+            return auth.error_response(HEADERS, 400, 'since must be a sequence number', 'INVALID_SINCE')
+
+        try:
+            limit = max(1, min(int(query_params.get('limit', DEFAULT_CHANGES_LIMIT)), MAX_CHANGES_LIMIT))
+        except ValueError:
+            limit = DEFAULT_CHANGES_LIMIT
+
+        # Boards above the caller's clearance are reported as missing
+        if not boards.readable(board_id, payload.get('clearanceLevel', 'LEVEL 1')):
+            return auth.error_response(HEADERS, 404, 'Board not found', 'BOARD_NOT_FOUND')
+
+        result, error = get_changes(board_id, since, limit)
+        if error:
+            return error
+
+        with instrumentation.span('serialize'):
+            response_body = json.dumps({
+                'success': True,
+                **result
+            })
+
+        return {
+            'statusCode': 200,
+            'headers': HEADERS,
+            'body': response_body
+        }
+
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return auth.error_response(HEADERS, 500, 'Internal server error', 'INTERNAL_ERROR')
+
+
+def lambda_handler(event, context):
+    """
+    Main Lambda handler for delta sync
+
+    Expected headers:
+    Authorization: Bearer <jwt_token>
+
+    Query parameters:
+    - since: changeSeq from GET /messages, or the since of the previous sync
+    - boardId: Board to sync (default: the herd board)
+    - limit: Maximum number of changes (default 100, max 500)
+
+    Each change is a post (with the message), an edit (with the changed
+    fields) or a delete tombstone. 410 CHANGES_EXPIRED means the client has
+    been away longer than the log keeps changes and should reload the board.
+    """
+    # Handle OPTIONS request for CORS
+    if event.get('httpMethod') == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': HEADERS,
+            'body': json.dumps({'message': 'OK'})
+        }
+
+    return changes_since(event, context)
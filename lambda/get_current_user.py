@@ -4,66 +4,10 @@ Verifies JWT token and returns user information
 """
 
 import json
-import boto3
-import os
-import jwt
-
-# AWS Clients
-dynamodb = boto3.resource('dynamodb')
-users_table = dynamodb.Table(os.environ.get('USERS_TABLE', 'CowsWithAK-Users'))
-blacklist_table = dynamodb.Table(os.environ.get('BLACKLIST_TABLE', 'CowsWithAK-TokenBlacklist'))
-
-# JWT Configuration
-JWT_SECRET = os.environ.get('JWT_SECRET', 'moo-secret-key-change-in-production')
-JWT_ALGORITHM = 'HS256'
-
-
-def verify_token(token):
-    """Verify JWT token and extract payload"""
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return True, payload
-    except jwt.ExpiredSignatureError:
-        return False, {'error': 'Token has expired'}
-    except jwt.InvalidTokenError:
-        return False, {'error': 'Invalid token'}
-
-
-def is_token_blacklisted(token):
-    """Check if token is in blacklist"""
-    try:
-        response = blacklist_table.get_item(Key={'token': token})
-        return 'Item' in response
-    except Exception as e:
-        print(f"Error checking blacklist: {str(e)}")
-        return False
-
-
-def get_user_by_email(email):
-    """Retrieve user from DynamoDB by email"""
-    try:
-        response = users_table.get_item(Key={'email': email.lower()})
-        return response.get('Item')
-    except Exception as e:
-        print(f"Error retrieving user: {str(e)}")
-        return None
-
-
-def extract_token_from_header(headers):
-    """Extract Bearer token from Authorization header"""
-    auth_header = headers.get('Authorization') or headers.get('authorization')
-    
-    if not auth_header:
-        return None
-    
-    parts = auth_header.split()
-    
-    if len(parts) != 2 or parts[0].lower() != 'bearer':
-        return None
-    
-    return parts[1]
-
+import auth
+import instrumentation
 
+@instrumentation.instrumented('GET /auth/me')
 def lambda_handler(event, context):
     """
     Main Lambda handler to get current authenticated user
@@ -91,7 +35,7 @@ def lambda_handler(event, context):
     try:
         # Extract token from Authorization header
         request_headers = event.get('headers', {})
-        token = extract_token_from_header(request_headers)
+        token = auth.extract_token_from_header(request_headers)
         
         if not token:
             return {
@@ -104,36 +48,36 @@ def lambda_handler(event, context):
                 })
             }
         
-        # Check if token is blacklisted
-        if is_token_blacklisted(token):
+        # Verify token
+        is_valid, payload = auth.verify_token(token)
+        
+        if not is_valid:
             return {
                 'statusCode': 401,
                 'headers': headers,
                 'body': json.dumps({
                     'success': False,
-                    'error': 'Token has been invalidated',
-                    'code': 'TOKEN_BLACKLISTED'
+                    'error': payload.get('error', 'Invalid token'),
+                    'code': 'INVALID_TOKEN'
                 })
             }
         
-        # Verify token
-        is_valid, payload = verify_token(token)
+        # Only a genuine token costs reads: check revocation and load the
+        # user together, in one round trip
+        email = payload.get('email')
+        blacklisted, user = auth.lookup_token_and_user(token, email)
         
-        if not is_valid:
+        if blacklisted:
             return {
                 'statusCode': 401,
                 'headers': headers,
                 'body': json.dumps({
                     'success': False,
-                    'error': payload.get('error', 'Invalid token'),
-                    'code': 'INVALID_TOKEN'
+                    'error': 'Token has been invalidated',
+                    'code': 'TOKEN_BLACKLISTED'
                 })
             }
         
-        # Get user from database
-        email = payload.get('email')
-        user = get_user_by_email(email)
-        
         if not user:
             return {
                 'statusCode': 404,
@@ -169,13 +113,16 @@ def lambda_handler(event, context):
         }
         
         # Success response
-        return {
-            'statusCode': 200,
-            'headers': headers,
-            'body': json.dumps({
+        with instrumentation.span('serialize'):
+            response_body = json.dumps({
                 'success': True,
                 'user': user_data
             })
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': response_body
         }
         
     except Exception as e:
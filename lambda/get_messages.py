@@ -1,115 +1,131 @@
 """
 AWS Lambda function to retrieve message board messages
-Gets paginated messages from DynamoDB
+Gets paginated messages of one board from DynamoDB
 """
 
 import json
-import boto3
-import os
 from datetime import datetime
-import jwt
-from decimal import Decimal
+import archive
+import auth
+import authors
+import boards
+import instrumentation
+import rendering
+import storage
 
-# AWS Clients
-dynamodb = boto3.resource('dynamodb')
-messages_table = dynamodb.Table(os.environ.get('MESSAGES_TABLE', 'CowsWithAK-Messages'))
-blacklist_table = dynamodb.Table(os.environ.get('BLACKLIST_TABLE', 'CowsWithAK-TokenBlacklist'))
 
-# JWT Configuration
-JWT_SECRET = os.environ.get('JWT_SECRET', 'moo-secret-key-change-in-production')
-JWT_ALGORITHM = 'HS256'
+def to_response_message(item):
+    """Fields of a stored or archived message returned to clients"""
+    return {
+        'messageId': item.get('messageId'),
+        'userId': item.get('userId'),
+        'username': item.get('username'),
+        'content': item.get('content'),
+        'renderedContent': rendering.rendered_content(item),
+        'links': item.get('links', []),
+        'mentions': item.get('mentions', []),
+        # Rolled up from the reaction shards every minute
+        'mooCount': int(item.get('mooCount', 0)),
+        # Top-level posts only; a thread's replies are fetched when it is expanded
+        'replyCount': int(item.get('replyCount', 0)),
+        'parentId': item.get('parentId'),
+        # Replies belong to their parent's board and do not carry one
+        'boardId': None if item.get('parentId') else boards.board_of(item),
+        'timestamp': item.get('timestamp'),
+        'clearanceLevel': item.get('clearanceLevel', 'LEVEL 1')
+    }
 
 
-def decimal_to_float(obj):
-    """Convert Decimal objects to float for JSON serialization"""
-    if isinstance(obj, Decimal):
-        return float(obj)
-    raise TypeError
+def add_authors(result, key='messages'):
+    """Attach current display data for the authors of result[key]"""
+    try:
+        result['authors'] = authors.for_messages(result[key])
+    except Exception as e:
+        # Best effort: messages still carry the username they were posted with
+        print(f"Error loading authors: {str(e)}")
+        result['authors'] = {}
+    return result
 
 
-def verify_token(token):
-    """Verify JWT token and extract payload"""
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return True, payload
-    except jwt.ExpiredSignatureError:
-        return False, {'error': 'Token has expired'}
-    except jwt.InvalidTokenError:
-        return False, {'error': 'Invalid token'}
+def get_archived_messages(limit, cursor, board_id=boards.DEFAULT_BOARD_ID):
+    """A page of a board's top-level messages from the archive, continuing from cursor"""
+    page = archive.get_archive().page(
+        limit, cursor, accept=lambda item: not item.get('parentId') and boards.board_of(item) == board_id
+    )
+    result = {'messages': [to_response_message(item) for item in page.items]}
+    if page.cursor:
+        result['lastKey'] = page.cursor
+    return result
 
 
-def is_token_blacklisted(token):
-    """Check if token is in blacklist"""
+def latest_change(board_id):
+    """The board's last change log seq, for clients to sync from; None if it cannot be read"""
     try:
-        response = blacklist_table.get_item(Key={'token': token})
-        return 'Item' in response
+        return storage.changes().latest(board_id)
     except Exception as e:
-        print(f"Error checking blacklist: {str(e)}")
-        return False
-
-
-def extract_token_from_header(headers):
-    """Extract Bearer token from Authorization header"""
-    auth_header = headers.get('Authorization') or headers.get('authorization')
-    
-    if not auth_header:
-        return None
-    
-    parts = auth_header.split()
-    
-    if len(parts) != 2 or parts[0].lower() != 'bearer':
+        print(f"Error reading change log: {str(e)}")
         return None
-    
-    return parts[1]
 
 
-def get_messages(limit=50, last_key=None):
-    """Retrieve messages from DynamoDB with pagination"""
+def get_messages(limit=50, last_key=None, board_id=boards.DEFAULT_BOARD_ID):
+    """
+    Retrieve a board's top-level messages from storage with pagination
+
+    Pages come from the hot table first; once it is exhausted, pagination
+    continues into the archive with lastKey values starting 'archive:'.
+    Every page carries authors: userId -> current username, cowName and avatar.
+    The first page also carries changeSeq, where delta sync continues from.
+    """
+    limit = max(1, min(limit, 100))
     try:
-        scan_kwargs = {
-            'Limit': min(limit, 100),
-            'IndexName': 'timestamp-index'  # Assumes GSI on timestamp for chronological order
-        }
+        if last_key and last_key.startswith(archive.CURSOR_PREFIX):
+            return add_authors(dict(get_archived_messages(limit, last_key, board_id), boardId=board_id))
         
-        if last_key:
-            scan_kwargs['ExclusiveStartKey'] = {'messageId': last_key}
+        # Read before the page: changes up to this seq are already in it, and
+        # later ones are safe for the client to apply on top
+        change_seq = latest_change(board_id) if not last_key else None
         
-        # Scan in reverse chronological order
-        response = messages_table.scan(**scan_kwargs)
+        # Newest first from the board's own partition of board-index
+        page = storage.messages().board_page(board_id, limit, last_key)
         
-        items = response.get('Items', [])
-        
-        # Sort by timestamp descending (newest first)
-        items.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-        
-        # Convert Decimal to float for JSON serialization
-        messages = []
-        for item in items:
-            message = {
-                'messageId': item.get('messageId'),
-                'userId': item.get('userId'),
-                'username': item.get('username'),
-                'content': item.get('content'),
-                'timestamp': item.get('timestamp'),
-                'clearanceLevel': item.get('clearanceLevel', 'LEVEL 1')
-            }
-            messages.append(message)
+        messages = [to_response_message(item) for item in page.items]
         
         result = {
+            'boardId': board_id,
             'messages': messages
         }
         
+        if change_seq is not None:
+            result['changeSeq'] = change_seq
+        
         # Add pagination key if there are more results
-        if 'LastEvaluatedKey' in response:
-            result['lastKey'] = response['LastEvaluatedKey'].get('messageId')
+        if page.last_key:
+            result['lastKey'] = page.last_key.get('messageId')
+            return add_authors(result)
+        
+        # Hot table exhausted: fill the rest of the page from the archive
+        try:
+            if len(messages) < limit:
+                archived = get_archived_messages(limit - len(messages), archive.CURSOR_PREFIX, board_id)
+                messages.extend(archived['messages'])
+                if 'lastKey' in archived:
+                    result['lastKey'] = archived['lastKey']
+            elif archive.get_archive().has_messages():
+                result['lastKey'] = archive.CURSOR_PREFIX
+        except Exception as e:
+            # The archive is best effort here; recent messages are still served
+            print(f"Error reading message archive: {str(e)}")
         
-        return result
+        return add_authors(result)
         
+    except storage.InvalidStartKey:
+        raise
     except Exception as e:
         print(f"Error retrieving messages: {str(e)}")
         raise
 
 
+@instrumentation.instrumented('GET /messages')
 def lambda_handler(event, context):
     """
     Main Lambda handler to get message board messages
@@ -118,8 +134,9 @@ def lambda_handler(event, context):
     Authorization: Bearer <jwt_token>
     
     Query parameters:
+    - boardId: Board to read (default: the herd board)
     - limit: Maximum number of messages (default 50, max 100)
-    - lastKey: Last message ID for pagination
+    - lastKey: Last message ID (or archive cursor) for pagination
     """
     
     # CORS headers
@@ -141,7 +158,7 @@ def lambda_handler(event, context):
     try:
         # Extract and verify token
         request_headers = event.get('headers', {})
-        token = extract_token_from_header(request_headers)
+        token = auth.extract_token_from_header(request_headers)
         
         if not token:
             return {
@@ -155,7 +172,7 @@ def lambda_handler(event, context):
             }
         
         # Check if token is blacklisted
-        if is_token_blacklisted(token):
+        if auth.is_token_blacklisted(token):
             return {
                 'statusCode': 401,
                 'headers': headers,
@@ -167,7 +184,7 @@ def lambda_handler(event, context):
             }
         
         # Verify token
-        is_valid, payload = verify_token(token)
+        is_valid, payload = auth.verify_token(token)
         
         if not is_valid:
             return {
@@ -182,20 +199,58 @@ def lambda_handler(event, context):
         
         # Get query parameters
         query_params = event.get('queryStringParameters') or {}
-        limit = int(query_params.get('limit', 50))
+        try:
+            limit = max(1, min(int(query_params.get('limit', 50)), 100))
+        except ValueError:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({
+                    'success': False,
+                    'error': 'limit must be a number',
+                    'code': 'INVALID_LIMIT'
+                })
+            }
         last_key = query_params.get('lastKey')
+        board_id = query_params.get('boardId') or boards.DEFAULT_BOARD_ID
+        
+        # Boards above the caller's clearance are reported as missing
+        if not boards.readable(board_id, payload.get('clearanceLevel', 'LEVEL 1')):
+            return {
+                'statusCode': 404,
+                'headers': headers,
+                'body': json.dumps({
+                    'success': False,
+                    'error': 'Board not found',
+                    'code': 'BOARD_NOT_FOUND'
+                })
+            }
         
         # Retrieve messages
-        result = get_messages(limit, last_key)
+        try:
+            result = get_messages(limit, last_key, board_id)
+        except storage.InvalidStartKey:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({
+                    'success': False,
+                    'error': 'lastKey is not a message on this board',
+                    'code': 'INVALID_LAST_KEY'
+                })
+            }
         
         # Success response
-        return {
-            'statusCode': 200,
-            'headers': headers,
-            'body': json.dumps({
+        with instrumentation.span('serialize'):
+            response_body = json.dumps({
                 'success': True,
                 **result
             })
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': response_body
         }
         
     except Exception as e:
@@ -0,0 +1,138 @@
+"""
+AWS Lambda function to retrieve the replies in a message thread
+Pages through the parent-index, so a thread is only read when a client expands it
+"""
+
+import json
+import archive
+import auth
+import boards
+import instrumentation
+import storage
+from get_messages import add_authors, to_response_message
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# CORS headers
+HEADERS = auth.cors_headers('GET,OPTIONS')
+
+
+def get_replies(parent_id, limit=DEFAULT_LIMIT, last_key=None, clearance_level='LEVEL 1'):
+    """
+    One page of a thread's replies, oldest first
+
+    None if the parent does not exist or is on a board above clearance_level.
+    Threads moved out of the table by retention are read from the archive.
+    """
+    parent = storage.messages().get(parent_id)
+    if not parent:
+        return get_archived_replies(parent_id, limit, last_key, clearance_level)
+    if parent.get('parentId'):
+        return None
+
+    if not boards.readable(boards.board_of(parent), clearance_level):
+        return None
+
+    page = storage.messages().replies(parent_id, min(limit, MAX_LIMIT), last_key)
+    result = {
+        'messageId': parent_id,
+        'replyCount': int(parent.get('replyCount', 0)),
+        'replies': [to_response_message(item) for item in page.items]
+    }
+    if page.last_key:
+        result['lastKey'] = page.last_key.get('messageId')
+    return add_authors(result, 'replies')
+
+
+def get_archived_replies(parent_id, limit, last_key, clearance_level):
+    """The same page from an archived thread's segment; None if no thread of parent_id was archived"""
+    thread = archive.get_archive().thread(parent_id)
+    if thread is None:
+        return None
+    parent, replies = thread
+    if not boards.readable(boards.board_of(parent), clearance_level):
+        return None
+
+    start = 0
+    if last_key:
+        reply_ids = [reply['messageId'] for reply in replies]
+        if last_key not in reply_ids:
+            raise storage.InvalidStartKey(last_key)
+        start = reply_ids.index(last_key) + 1
+    page = replies[start:start + min(limit, MAX_LIMIT)]
+    result = {
+        'messageId': parent_id,
+        'replyCount': len(replies),
+        'replies': [to_response_message(item) for item in page]
+    }
+    if start + len(page) < len(replies):
+        result['lastKey'] = page[-1]['messageId']
+    return add_authors(result, 'replies')
+
+
+@instrumentation.instrumented('GET /messages/{messageId}/replies')
+def lambda_handler(event, context):
+    """
+    Main Lambda handler to get the replies to a message
+
+    Expected headers:
+    Authorization: Bearer <jwt_token>
+
+    Path parameters:
+    - messageId: ID of the top-level message
+
+    Query parameters:
+    - limit: Maximum number of replies (default 20, max 100)
+    - lastKey: Last reply ID for pagination
+    """
+
+    # Handle OPTIONS request for CORS
+    if event.get('httpMethod') == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': HEADERS,
+            'body': json.dumps({'message': 'OK'})
+        }
+
+    try:
+        payload, error = auth.authenticate_token(event, HEADERS)
+        if error:
+            return error
+
+        message_id = (event.get('pathParameters') or {}).get('messageId')
+
+        if not message_id:
+            return auth.error_response(HEADERS, 400, 'Message ID is required', 'MISSING_MESSAGE_ID')
+
+        query_params = event.get('queryStringParameters') or {}
+        try:
+            limit = max(1, int(query_params.get('limit', DEFAULT_LIMIT)))
+        except ValueError:
+            return auth.error_response(HEADERS, 400, 'limit must be a number', 'INVALID_LIMIT')
+
+        try:
+            result = get_replies(
+                message_id, limit, query_params.get('lastKey'), payload.get('clearanceLevel', 'LEVEL 1')
+            )
+        except storage.InvalidStartKey:
+            return auth.error_response(HEADERS, 400, 'lastKey is not a reply in this thread', 'INVALID_LAST_KEY')
+
+        if result is None:
+            return auth.error_response(HEADERS, 404, 'Message not found', 'MESSAGE_NOT_FOUND')
+
+        with instrumentation.span('serialize'):
+            response_body = json.dumps({
+                'success': True,
+                **result
+            })
+
+        return {
+            'statusCode': 200,
+            'headers': HEADERS,
+            'body': response_body
+        }
+
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return auth.error_response(HEADERS, 500, 'Internal server error', 'INTERNAL_ERROR')
@@ -0,0 +1,152 @@
+"""
+AWS Lambda function for board statistics
+Serves totals, daily rollups and post counts from maintained counters, never from the Messages table
+"""
+
+import json
+import os
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import auth
+import instrumentation
+import storage
+
+# How long each container reuses the counters before reading them again
+STATS_CACHE_SECONDS = float(os.environ.get('STATS_CACHE_SECONDS', '30'))
+# Daily rollups returned, today included
+STATS_DAYS = int(os.environ.get('STATS_DAYS', '7'))
+# Other cows whose post counts one request may ask for
+MAX_STATS_USERS = 25
+STATS_USER_CACHE_SIZE = 1000
+
+# CORS headers
+HEADERS = auth.cors_headers('GET,OPTIONS')
+
+# Board-wide figures and userId -> (expires at, posts), shared by every
+# request this container serves
+_board_cache = {'expires': 0.0, 'board': None}
+_user_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def recent_days(now):
+    """The last STATS_DAYS UTC days, oldest first"""
+    today = datetime.utcfromtimestamp(now).date()
+    return [(today - timedelta(days=n)).isoformat() for n in range(STATS_DAYS - 1, -1, -1)]
+
+
+def to_board(totals, rollups, days, now):
+    return {
+        # messages counts replies too; topLevel is the messages that started a thread
+        'messages': totals['messages'],
+        'topLevel': max(0, totals['messages'] - totals['replies']),
+        'replies': totals['replies'],
+        'activeCows': totals['cows'],
+        'postsToday': rollups[days[-1]]['posts'],
+        'days': [{'date': day, **rollups[day]} for day in days],
+        'asOf': datetime.utcfromtimestamp(now).isoformat()
+    }
+
+
+def read_stats(user_ids, now=None):
+    """
+    (board figures, userId -> posts), read from storage at most once per STATS_CACHE_SECONDS
+
+    Whatever the cache is missing is read in one BatchGetItem; a stale board
+    brings the requested users' counts along with it.
+    """
+    now = now or time.time()
+    with _cache_lock:
+        board = _board_cache['board'] if now < _board_cache['expires'] else None
+        posts, missing = {}, []
+        for user_id in user_ids:
+            entry = _user_cache.get(user_id)
+            if entry and now < entry[0]:
+                posts[user_id] = entry[1]
+            else:
+                missing.append(user_id)
+
+    if board is not None and not missing:
+        instrumentation.record_count('stats.cache_hits')
+        return board, posts
+
+    days = recent_days(now) if board is None else []
+    totals, rollups, fetched = storage.stats().read(days, missing, totals=board is None)
+    posts.update(fetched)
+
+    with _cache_lock:
+        if board is None:
+            board = to_board(totals, rollups, days, now)
+            _board_cache['board'] = board
+            _board_cache['expires'] = now + STATS_CACHE_SECONDS
+        for user_id, count in fetched.items():
+            _user_cache.pop(user_id, None)
+            _user_cache[user_id] = (now + STATS_CACHE_SECONDS, count)
+        while len(_user_cache) > STATS_USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+    return board, posts
+
+
+@instrumentation.instrumented('GET /stats')
+def get_stats(event, context):
+    try:
+        # The counters are not per-clearance; the token's userId is all that is needed
+        payload, error = auth.authenticate_token(event, HEADERS)
+        if error:
+            return error
+
+        user_id = payload.get('userId')
+
+        if not user_id:
+            return auth.error_response(HEADERS, 401, 'Invalid token', 'INVALID_TOKEN')
+
+        query_params = event.get('queryStringParameters') or {}
+        others = [u.strip() for u in (query_params.get('userIds') or '').split(',') if u.strip()]
+
+        if len(others) > MAX_STATS_USERS:
+            return auth.error_response(HEADERS, 400, f'At most {MAX_STATS_USERS} userIds per request', 'TOO_MANY_USERS')
+
+        board, posts = read_stats(list(dict.fromkeys([user_id] + others)))
+
+        with instrumentation.span('serialize'):
+            response_body = json.dumps({
+                'success': True,
+                'stats': board,
+                'posts': posts
+            })
+
+        return {
+            'statusCode': 200,
+            'headers': HEADERS,
+            'body': response_body
+        }
+
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return auth.error_response(HEADERS, 500, 'Internal server error', 'INTERNAL_ERROR')
+
+
+def lambda_handler(event, context):
+    """
+    Main Lambda handler for board statistics
+
+    Expected headers:
+    Authorization: Bearer <jwt_token>
+
+    Query parameters:
+    - userIds: Optional comma-separated cows to include post counts for
+      (the caller's own count is always included)
+
+    Figures may be up to STATS_CACHE_SECONDS old.
+    """
+    # Handle OPTIONS request for CORS
+    if event.get('httpMethod') == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': HEADERS,
+            'body': json.dumps({'message': 'OK'})
+        }
+
+    return get_stats(event, context)
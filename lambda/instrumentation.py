@@ -0,0 +1,269 @@
+"""
+Per-request timing spans and metrics for the Lambda functions
+Emits one CloudWatch Embedded Metric Format (EMF) line per request
+"""
+
+import os
+import sys
+import json
+import time
+import functools
+import threading
+from contextlib import contextmanager
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'CowsWithAK')
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+
+# Per-route capacity budgets (read units, write units) per request; override
+# with CAPACITY_BUDGETS='{"GET /messages": {"read": 8, "write": 0}}'
+CAPACITY_BUDGETS = {
+    'POST /auth/signin': {'read': 1.0, 'write': 2.0},
+    'POST /auth/signup': {'read': 0.0, 'write': 4.0},
+    'POST /auth/signout': {'read': 0.0, 'write': 1.0},
+    'GET /auth/me': {'read': 1.5, 'write': 0.0},
+    'GET /messages': {'read': 14.5, 'write': 0.0},
+    'POST /messages': {'read': 8.0, 'write': 18.0},
+    'GET /messages/changes': {'read': 20.0, 'write': 0.0},
+    'DELETE /messages/{messageId}': {'read': 2.5, 'write': 16.0},
+    'GET /messages/{messageId}/replies': {'read': 10.0, 'write': 0.0},
+    'POST /messages/{messageId}/moo': {'read': 2.0, 'write': 2.0},
+    'DELETE /messages/{messageId}/moo': {'read': 1.0, 'write': 2.0},
+    'GET /presence': {'read': 5.0, 'write': 0.0},
+    'POST /presence': {'read': 5.0, 'write': 2.0},
+    'GET /stats': {'read': 18.0, 'write': 0.0},
+    'GET /boards': {'read': 1.0, 'write': 0.0},
+    'GET /admin/registrations': {'read': 8.0, 'write': 0.0},
+    'POST /admin/registrations': {'read': 1.5, 'write': 102.0},
+}
+CAPACITY_BUDGETS.update(json.loads(os.environ.get('CAPACITY_BUDGETS', '{}')))
+
+# route -> totals for the life of this container
+ROUTE_TOTALS = {}
+_totals_lock = threading.Lock()
+
+_local = threading.local()
+_cold_start = True
+_cold_lock = threading.Lock()
+
+
+class RequestMetrics:
+    """Spans and outcome of one request"""
+
+    def __init__(self, route, cold_start, request_id=None):
+        self.route = route
+        self.cold_start = cold_start
+        self.request_id = request_id
+        self.status_code = None
+        # span name -> [total ms, count]
+        self.spans = {}
+        # table label -> [read units, write units]
+        self.capacity = {}
+        self.over_budget = []
+        # name -> count of events that are not timed (e.g. hedged reads fired)
+        self.counts = {}
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        # Spans and capacity may be recorded from helper threads (hedged reads)
+        self._lock = threading.Lock()
+
+    def add_span(self, name, duration_ms):
+        with self._lock:
+            totals = self.spans.setdefault(name, [0.0, 0])
+            totals[0] += duration_ms
+            totals[1] += 1
+
+    def add_capacity(self, table, read, write):
+        with self._lock:
+            units = self.capacity.setdefault(table, [0.0, 0.0])
+            units[0] += read
+            units[1] += write
+
+    def add_count(self, name, amount=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    @property
+    def read_units(self):
+        return sum(read for read, _ in self.capacity.values())
+
+    @property
+    def write_units(self):
+        return sum(write for _, write in self.capacity.values())
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self.started) * 1000.0
+
+    def to_emf(self):
+        """Render as a CloudWatch Embedded Metric Format document"""
+        metric_values = {'Duration': round(self.duration_ms, 3)}
+        for name, (total_ms, _) in self.spans.items():
+            metric_values[name] = round(total_ms, 3)
+        units = {
+            'ReadCapacityUnits': round(self.read_units, 2),
+            'WriteCapacityUnits': round(self.write_units, 2),
+            'CapacityBudgetExceeded': 1 if self.over_budget else 0,
+        }
+        units.update(self.counts)
+        document = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['Route'], ['Route', 'ColdStart']],
+                    'Metrics': [{'Name': name, 'Unit': 'Milliseconds'} for name in metric_values]
+                    + [{'Name': name, 'Unit': 'Count'} for name in units]
+                }]
+            },
+            'Route': self.route,
+            'ColdStart': 'true' if self.cold_start else 'false',
+            'StatusCode': self.status_code,
+            'SpanCounts': {name: count for name, (_, count) in self.spans.items()},
+            'CapacityByTable': {
+                table: {'read': round(read, 2), 'write': round(write, 2)}
+                for table, (read, write) in self.capacity.items()
+            },
+        }
+        if self.request_id:
+            document['RequestId'] = self.request_id
+        document.update(metric_values)
+        document.update(units)
+        return document
+
+
+def current():
+    """The request being measured on this thread, or None"""
+    return getattr(_local, 'request', None)
+
+
+def last_request():
+    """The most recently finished request on this thread (benchmarks, tests)"""
+    return getattr(_local, 'last', None)
+
+
+def record_capacity(table, read=0.0, write=0.0):
+    """Charge capacity units consumed on a table to the current request"""
+    metrics = current()
+    if metrics is not None:
+        metrics.add_capacity(table, read, write)
+
+
+def record_count(name, amount=1):
+    """Count an event against the current request"""
+    metrics = current()
+    if metrics is not None:
+        metrics.add_count(name, amount)
+
+
+def bind(func):
+    """Wrap func so it records into the caller's request when run on another thread"""
+    metrics = current()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        previous, _local.request = current(), metrics
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.request = previous
+    return wrapper
+
+
+def check_budget(metrics):
+    """Compare a request's consumed capacity with its route budget and warn on overrun"""
+    budget = CAPACITY_BUDGETS.get(metrics.route)
+    if not budget:
+        return
+    if metrics.read_units > budget.get('read', float('inf')):
+        metrics.over_budget.append(f"read {metrics.read_units:.2f} > {budget['read']}")
+    if metrics.write_units > budget.get('write', float('inf')):
+        metrics.over_budget.append(f"write {metrics.write_units:.2f} > {budget['write']}")
+    if metrics.over_budget:
+        print(f"Warning: capacity budget exceeded on {metrics.route}: {', '.join(metrics.over_budget)}")
+
+
+def accumulate(metrics):
+    """Add a finished request to the container's per-route totals"""
+    with _totals_lock:
+        totals = ROUTE_TOTALS.setdefault(metrics.route, {
+            'requests': 0, 'readUnits': 0.0, 'writeUnits': 0.0, 'overBudget': 0, 'totalMs': 0.0
+        })
+        totals['requests'] += 1
+        totals['readUnits'] += metrics.read_units
+        totals['writeUnits'] += metrics.write_units
+        totals['overBudget'] += 1 if metrics.over_budget else 0
+        totals['totalMs'] += metrics.duration_ms
+
+
+def _take_cold_start():
+    global _cold_start
+    with _cold_lock:
+        cold, _cold_start = _cold_start, False
+    return cold
+
+
+def warmed():
+    """Treat the process as warm, so its first request is not tagged cold (server.py)"""
+    _take_cold_start()
+
+
+def emit(metrics):
+    """Write the request's metrics line to stdout (CloudWatch Logs in Lambda)"""
+    if METRICS_ENABLED:
+        sys.stdout.write(json.dumps(metrics.to_emf(), default=str) + '\n')
+
+
+@contextmanager
+def request(route, context=None):
+    """Measure everything inside the block as one request and emit it on exit"""
+    metrics = RequestMetrics(route, _take_cold_start(), getattr(context, 'aws_request_id', None))
+    previous, _local.request = current(), metrics
+    try:
+        yield metrics
+    finally:
+        _local.request = previous
+        _local.last = metrics
+        metrics.finish()
+        check_budget(metrics)
+        accumulate(metrics)
+        emit(metrics)
+
+
+@contextmanager
+def span(name):
+    """Time a block as a named span of the current request; no-op outside a request"""
+    metrics = current()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_span(name, (time.perf_counter() - start) * 1000.0)
+
+
+def timed(name):
+    """Decorator timing every call of a function as a span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrumented(route):
+    """Decorator for lambda_handler: one metrics line per request, tagged cold or warm"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            if current() is not None:
+                # Already measured by an outer dispatcher (router.py)
+                return handler(event, context)
+            with request(route, context) as metrics:
+                response = handler(event, context)
+                metrics.status_code = response.get('statusCode')
+                return response
+        return wrapper
+    return decorator
@@ -0,0 +1,173 @@
+"""
+Banned-term filter for posted messages
+Matches every term in one pass over the folded text, so the cost of a check does not grow with the list
+"""
+
+import os
+import threading
+import unicodedata
+from collections import deque
+
+import instrumentation
+
+CONTENT_FILTER = os.environ.get('CONTENT_FILTER', 'true').lower() == 'true'
+
+# One term per line ('#' starts a comment), plus any comma-separated extras
+BANNED_TERMS_FILE = os.environ.get(
+    'BANNED_TERMS_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'banned_terms.txt')
+)
+BANNED_TERMS = os.environ.get('BANNED_TERMS', '')
+
+# Look-alike letters and the digits and symbols used in their place, applied
+# after NFKD normalization and case folding
+CONFUSABLES = str.maketrans({
+    # Digits and symbols
+    '0': 'o', '1': 'i', '!': 'i', '|': 'i', 'l': 'i', '3': 'e', '4': 'a', '@': 'a',
+    '5': 's', '$': 's', '7': 't', '+': 't', '8': 'b',
+    # Cyrillic
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h', 'о': 'o',
+    'р': 'p', 'с': 'c', 'т': 't', 'у': 'y', 'х': 'x', 'і': 'i', 'ј': 'j', 'ѕ': 's',
+    # Greek
+    'α': 'a', 'β': 'b', 'ε': 'e', 'η': 'n', 'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o',
+    'ρ': 'p', 'τ': 't', 'υ': 'u', 'χ': 'x',
+})
+
+
+def fold(text):
+    """
+    Reduce text to the letters and digits a reader sees, plus word boundaries
+
+    Returns (folded, starts): folded has accents, case and look-alikes folded
+    away and separators removed, so 'F.R.E.E', 'fr ee' and 'ｆｒ３ｅ' all read
+    'free'; starts[i] is True when a word may start at folded[i]. A digit or
+    symbol standing in for a letter may also be punctuation ('free!'), so a
+    word may start on either side of it. Invisible characters (zero-width
+    spaces, soft hyphens) are dropped without counting as separators.
+    """
+    chars, starts = [], []
+    boundary = True
+    for ch in unicodedata.normalize('NFKD', text):
+        if unicodedata.combining(ch) or unicodedata.category(ch) == 'Cf':
+            continue
+        ch = ch.casefold()
+        folded = ch.translate(CONFUSABLES)
+        if not folded.isalnum():
+            boundary = True
+            continue
+        substitute = not ch.isalpha() and folded.isalpha()
+        for c in folded:
+            chars.append(c)
+            starts.append(boundary or substitute)
+            boundary = substitute
+    return ''.join(chars), starts
+
+
+class TermMatcher:
+    """Aho-Corasick automaton over folded terms"""
+
+    def __init__(self, terms):
+        # Per state: transitions, failure link, and the lengths of the terms ending there
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        self.size = 0
+        for term in terms:
+            self._add(term)
+        self._link()
+
+    def _add(self, term):
+        folded, _ = fold(term)
+        if not folded:
+            return
+        state = 0
+        for ch in folded:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        if len(folded) not in self._out[state]:
+            self._out[state] += (len(folded),)
+            self.size += 1
+
+    def _link(self):
+        """Breadth-first failure links; each state also reports the terms its suffixes end"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def find(self, folded, starts):
+        """
+        The first term found in folded text, or None
+
+        A term must start and end on a word boundary, so 'ass' is not found in
+        'class' or 'assorted', while separators inside a term are ignored.
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        end = len(folded)
+        state = 0
+        for i, ch in enumerate(folded):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state] and (i + 1 == end or starts[i + 1]):
+                for length in out[state]:
+                    if starts[i - length + 1]:
+                        return folded[i - length + 1:i + 1]
+        return None
+
+
+def load_terms(path=None, extra=None):
+    """Banned terms from the terms file (if present) and the comma-separated extras"""
+    terms = []
+    path = path or BANNED_TERMS_FILE
+    if path and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                term = line.split('#', 1)[0].strip()
+                if term:
+                    terms.append(term)
+    terms.extend(t.strip() for t in (BANNED_TERMS if extra is None else extra).split(',') if t.strip())
+    return terms
+
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+
+def matcher():
+    """The container's automaton, compiled once (post_message builds it at import) and kept"""
+    global _matcher
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                with instrumentation.span('moderation.compile'):
+                    _matcher = TermMatcher(load_terms())
+    return _matcher
+
+
+def set_matcher(term_matcher):
+    """Replace the container's automaton (local runs, benchmarks)"""
+    global _matcher
+    _matcher = term_matcher
+
+
+def blocked_term(content):
+    """The folded banned term content contains, or None if it may be posted"""
+    if not CONTENT_FILTER:
+        return None
+    term_matcher = matcher()
+    if not term_matcher.size:
+        return None
+    with instrumentation.span('moderation.check'):
+        return term_matcher.find(*fold(content))
@@ -0,0 +1,109 @@
+"""
+AWS Lambda function for "moo" reactions on messages
+Adds or removes the caller's moo; totals are rolled up into the message by reaction_rollup.py
+"""
+
+import json
+from datetime import datetime
+import auth
+import boards
+import instrumentation
+import storage
+
+# CORS headers
+HEADERS = auth.cors_headers('POST,DELETE,OPTIONS')
+
+
+def visible_message(message_id, clearance_level):
+    """The message if it exists on a board clearance_level may read, otherwise None"""
+    messages = storage.messages()
+    message = messages.get(message_id)
+    if not message:
+        return None
+    # Replies are on their parent's board
+    thread = messages.get(message['parentId']) if message.get('parentId') else message
+    if not thread or not boards.readable(boards.board_of(thread), clearance_level):
+        return None
+    return message
+
+
+def react(event, adding):
+    """Shared body of the add and remove handlers"""
+    try:
+        user, error = auth.authenticate_user(event, HEADERS)
+        if error:
+            return error
+
+        message_id = (event.get('pathParameters') or {}).get('messageId')
+
+        if not message_id:
+            return auth.error_response(HEADERS, 400, 'Message ID is required', 'MISSING_MESSAGE_ID')
+
+        # Messages on boards above the caller's clearance are reported as missing
+        if adding and not visible_message(message_id, user.get('clearanceLevel', 'LEVEL 1')):
+            return auth.error_response(HEADERS, 404, 'Message not found', 'MESSAGE_NOT_FOUND')
+
+        reactions = storage.reactions()
+        now = datetime.utcnow().isoformat()
+        if adding:
+            changed = reactions.add(message_id, user.get('userId'), now)
+        else:
+            changed = reactions.remove(message_id, user.get('userId'), now)
+
+        # Repeats are not errors: mooing twice leaves one moo
+        with instrumentation.span('serialize'):
+            response_body = json.dumps({
+                'success': True,
+                'messageId': message_id,
+                'mooed': adding,
+                'changed': changed
+            })
+
+        return {
+            'statusCode': 200,
+            'headers': HEADERS,
+            'body': response_body
+        }
+
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return auth.error_response(HEADERS, 500, 'Internal server error', 'INTERNAL_ERROR')
+
+
+@instrumentation.instrumented('POST /messages/{messageId}/moo')
+def add_moo(event, context):
+    return react(event, True)
+
+
+@instrumentation.instrumented('DELETE /messages/{messageId}/moo')
+def remove_moo(event, context):
+    return react(event, False)
+
+
+def lambda_handler(event, context):
+    """
+    Main Lambda handler for moo reactions
+
+    Expected headers:
+    Authorization: Bearer <jwt_token>
+
+    Path parameters:
+    - messageId: ID of the message to moo
+
+    POST adds the caller's moo, DELETE takes it back. The message's mooCount
+    catches up when the rollup job next runs.
+    """
+    method = event.get('httpMethod')
+
+    # Handle OPTIONS request for CORS
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': HEADERS,
+            'body': json.dumps({'message': 'OK'})
+        }
+
+    if method == 'DELETE':
+        return remove_moo(event, context)
+
+    return add_moo(event, context)
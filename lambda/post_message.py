@@ -4,71 +4,90 @@ Creates new messages in DynamoDB
 """
 
 import json
-import boto3
 import os
+import time
+import hashlib
 from datetime import datetime
 import uuid
-import jwt
+import auth
+import boards
+import instrumentation
+import moderation
+import rendering
+import spam
+import storage
 
-# AWS Clients
-dynamodb = boto3.resource('dynamodb')
-messages_table = dynamodb.Table(os.environ.get('MESSAGES_TABLE', 'CowsWithAK-Messages'))
-users_table = dynamodb.Table(os.environ.get('USERS_TABLE', 'CowsWithAK-Users'))
-blacklist_table = dynamodb.Table(os.environ.get('BLACKLIST_TABLE', 'CowsWithAK-TokenBlacklist'))
+# How long a retry with the same Idempotency-Key replays the first response
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400'))
+# How long a claimed key blocks retries before it is taken to be abandoned;
+# longer than the function timeout (30 s), so a live request never loses it
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', '60'))
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
 
-# JWT Configuration
-JWT_SECRET = os.environ.get('JWT_SECRET', 'moo-secret-key-change-in-production')
-JWT_ALGORITHM = 'HS256'
+# Compile the banned-term automaton while the container initializes (the Lambda
+# init phase, or server.warm_up), so no post waits for it
+if moderation.CONTENT_FILTER:
+    moderation.matcher()
 
 
-def verify_token(token):
-    """Verify JWT token and extract payload"""
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return True, payload
-    except jwt.ExpiredSignatureError:
-        return False, {'error': 'Token has expired'}
-    except jwt.InvalidTokenError:
-        return False, {'error': 'Invalid token'}
+def extract_idempotency_key(headers):
+    """Read the optional Idempotency-Key header (header names are case-insensitive)"""
+    for name, value in (headers or {}).items():
+        if name.lower() == 'idempotency-key':
+            return (value or '').strip()
+    return None
 
 
-def is_token_blacklisted(token):
-    """Check if token is in blacklist"""
-    try:
-        response = blacklist_table.get_item(Key={'token': token})
-        return 'Item' in response
-    except Exception as e:
-        print(f"Error checking blacklist: {str(e)}")
-        return False
+def content_fingerprint(content, parent_id=None, board_id=None):
+    """Hash of the request a key was first used with, to catch keys reused for other content"""
+    request = content if parent_id is None else f"{parent_id}\n{content}"
+    # The default board is left out, so keys claimed before boards existed still match
+    if board_id and board_id != boards.DEFAULT_BOARD_ID:
+        request = f"board:{board_id}\n{request}"
+    return hashlib.sha256(request.encode('utf-8')).hexdigest()
 
 
-def extract_token_from_header(headers):
-    """Extract Bearer token from Authorization header"""
-    auth_header = headers.get('Authorization') or headers.get('authorization')
-    
-    if not auth_header:
-        return None
-    
-    parts = auth_header.split()
-    
-    if len(parts) != 2 or parts[0].lower() != 'bearer':
-        return None
-    
-    return parts[1]
+def idempotent_response(record, fingerprint, headers):
+    """Response for a request whose key was already claimed"""
+    if record.get('fingerprint') != fingerprint:
+        return {
+            'statusCode': 422,
+            'headers': headers,
+            'body': json.dumps({
+                'success': False,
+                'error': 'Idempotency-Key was already used for a different message',
+                'code': 'IDEMPOTENCY_KEY_REUSED'
+            })
+        }
+
+    if record.get('status') != storage.IdempotencyRepository.COMPLETED:
+        return {
+            'statusCode': 409,
+            'headers': headers,
+            'body': json.dumps({
+                'success': False,
+                'error': 'A request with this Idempotency-Key is still in progress',
+                'code': 'IDEMPOTENCY_IN_PROGRESS'
+            })
+        }
 
+    # Replay the first response as it was sent
+    return {
+        'statusCode': int(record['statusCode']),
+        'headers': dict(headers, **{'Idempotent-Replayed': 'true'}),
+        'body': record['responseBody']
+    }
 
-def get_user_by_email(email):
-    """Retrieve user from DynamoDB by email"""
-    try:
-        response = users_table.get_item(Key={'email': email.lower()})
-        return response.get('Item')
-    except Exception as e:
-        print(f"Error retrieving user: {str(e)}")
-        return None
 
+def create_message(user_id, username, content, clearance_level, parent_id=None, duplicate_of=None,
+                   board_id=boards.DEFAULT_BOARD_ID):
+    """
+    Create a new message on board_id (or a reply to parent_id) in storage
 
-def create_message(user_id, username, content, clearance_level):
-    """Create a new message in DynamoDB"""
+    Replies live on their parent's board and do not carry boardId, which
+    keeps them out of board-index. duplicate_of flags the message for
+    moderators as a near-duplicate of that earlier message.
+    """
     message_id = f"msg-{uuid.uuid4()}"
     timestamp = datetime.utcnow().isoformat()
     
@@ -81,24 +100,68 @@ def create_message(user_id, username, content, clearance_level):
         'clearanceLevel': clearance_level
     }
     
+    if parent_id:
+        message_item['parentId'] = parent_id
+    else:
+        message_item['boardId'] = board_id
+    
+    if duplicate_of:
+        message_item['flagged'] = 'near-duplicate'
+        message_item['duplicateOf'] = duplicate_of
+    
+    # Format once here so every read serves the stored HTML
+    with instrumentation.span('render'):
+        message_item.update(rendering.render_message(content))
+    
     try:
-        messages_table.put_item(Item=message_item)
+        if parent_id:
+            # Also bumps the parent's replyCount
+            storage.messages().add_reply(message_item)
+        else:
+            storage.messages().put(message_item)
         return message_item
+    except storage.ConditionFailed:
+        raise
     except Exception as e:
         print(f"Error creating message: {str(e)}")
         raise
 
 
+def record_stats(message):
+    """Count a posted message in the board statistics (best effort)"""
+    try:
+        storage.stats().record_post(message['userId'], message['timestamp'], bool(message.get('parentId')))
+    except Exception as e:
+        print(f"Error recording stats: {str(e)}")
+
+
+def record_change(message, board_id):
+    """Log a posted message for delta sync (best effort)"""
+    entry = {'type': 'post', 'messageId': message['messageId'], 'message': message}
+    if message.get('parentId'):
+        entry['parentId'] = message['parentId']
+    try:
+        storage.changes().append(board_id, [entry], message['timestamp'])
+    except Exception as e:
+        print(f"Error recording change: {str(e)}")
+
+
+@instrumentation.instrumented('POST /messages')
 def lambda_handler(event, context):
     """
     Main Lambda handler to post a message
     
     Expected headers:
     Authorization: Bearer <jwt_token>
+    Idempotency-Key: <client-generated key> (optional; retries with the same
+    key replay the first response instead of posting again)
     
     Expected body:
     {
-        "content": "Message content here"
+        "content": "Message content here",
+        "boardId": "herd" (optional; the board to post on, default the herd board),
+        "parentId": "msg-..." (optional; posts a reply to that top-level message,
+                    on its board)
     }
     """
     
@@ -106,7 +169,7 @@ def lambda_handler(event, context):
     headers = {
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Headers': 'Content-Type,Authorization',
+        'Access-Control-Allow-Headers': 'Content-Type,Authorization,Idempotency-Key',
         'Access-Control-Allow-Methods': 'POST,OPTIONS'
     }
     
@@ -121,7 +184,7 @@ def lambda_handler(event, context):
     try:
         # Extract and verify token
         request_headers = event.get('headers', {})
-        token = extract_token_from_header(request_headers)
+        token = auth.extract_token_from_header(request_headers)
         
         if not token:
             return {
@@ -134,36 +197,36 @@ def lambda_handler(event, context):
                 })
             }
         
-        # Check if token is blacklisted
-        if is_token_blacklisted(token):
+        # Verify token
+        is_valid, payload = auth.verify_token(token)
+        
+        if not is_valid:
             return {
                 'statusCode': 401,
                 'headers': headers,
                 'body': json.dumps({
                     'success': False,
-                    'error': 'Token has been invalidated',
-                    'code': 'TOKEN_BLACKLISTED'
+                    'error': payload.get('error', 'Invalid token'),
+                    'code': 'INVALID_TOKEN'
                 })
             }
         
-        # Verify token
-        is_valid, payload = verify_token(token)
+        # Only a genuine token costs reads: check revocation and load the
+        # user together, in one round trip
+        email = payload.get('email')
+        blacklisted, user = auth.lookup_token_and_user(token, email)
         
-        if not is_valid:
+        if blacklisted:
             return {
                 'statusCode': 401,
                 'headers': headers,
                 'body': json.dumps({
                     'success': False,
-                    'error': payload.get('error', 'Invalid token'),
-                    'code': 'INVALID_TOKEN'
+                    'error': 'Token has been invalidated',
+                    'code': 'TOKEN_BLACKLISTED'
                 })
             }
         
-        # Get user info from token
-        email = payload.get('email')
-        user = get_user_by_email(email)
-        
         if not user:
             return {
                 'statusCode': 404,
@@ -214,25 +277,195 @@ def lambda_handler(event, context):
                 })
             }
         
+        # Checked before anything is read or written: a blocked post costs nothing
+        blocked = moderation.blocked_term(content)
+        
+        if blocked:
+            print(f"Blocked message from {user.get('userId')}: matched '{blocked}'")
+            instrumentation.record_count('moderation.blocked')
+            return {
+                'statusCode': 422,
+                'headers': headers,
+                'body': json.dumps({
+                    'success': False,
+                    'error': 'Message contains language that is not allowed on the board',
+                    'code': 'CONTENT_BLOCKED'
+                })
+            }
+        
+        parent_id = body.get('parentId')
+        parent = None
+        clearance_level = user.get('clearanceLevel', 'LEVEL 1')
+        
+        if parent_id is not None:
+            if not isinstance(parent_id, str) or not parent_id:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({
+                        'success': False,
+                        'error': 'parentId must be a message ID',
+                        'code': 'INVALID_PARENT'
+                    })
+                }
+            
+            parent = storage.messages().get(parent_id)
+            
+            if not parent:
+                return {
+                    'statusCode': 404,
+                    'headers': headers,
+                    'body': json.dumps({
+                        'success': False,
+                        'error': 'Parent message not found',
+                        'code': 'PARENT_NOT_FOUND'
+                    })
+                }
+            
+            # Threads are one level deep
+            if parent.get('parentId'):
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({
+                        'success': False,
+                        'error': 'Replies can only be posted to top-level messages',
+                        'code': 'INVALID_PARENT'
+                    })
+                }
+        
+        # Replies go on their parent's board; boards above the caller's
+        # clearance (and threads on them) are reported as missing
+        board_id = boards.board_of(parent) if parent else body.get('boardId') or boards.DEFAULT_BOARD_ID
+        board = boards.readable(board_id, clearance_level) if isinstance(board_id, str) else None
+        
+        if not board:
+            return {
+                'statusCode': 404,
+                'headers': headers,
+                'body': json.dumps({
+                    'success': False,
+                    'error': 'Parent message not found' if parent else 'Board not found',
+                    'code': 'PARENT_NOT_FOUND' if parent else 'BOARD_NOT_FOUND'
+                })
+            }
+        
+        if not boards.can_post(board, clearance_level):
+            return {
+                'statusCode': 403,
+                'headers': headers,
+                'body': json.dumps({
+                    'success': False,
+                    'error': 'Your clearance does not allow posting on this board',
+                    'code': 'BOARD_READ_ONLY'
+                })
+            }
+        
+        idempotency_key = extract_idempotency_key(request_headers)
+        
+        if idempotency_key is not None and not 0 < len(idempotency_key) <= MAX_IDEMPOTENCY_KEY_LENGTH:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({
+                    'success': False,
+                    'error': f'Idempotency-Key must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} characters',
+                    'code': 'INVALID_IDEMPOTENCY_KEY'
+                })
+            }
+        
+        # Claim the key before writing, so concurrent retries write at most once
+        if idempotency_key:
+            record_key = f"{user.get('userId')}#{idempotency_key}"
+            fingerprint = content_fingerprint(content, parent_id, None if parent else board_id)
+            now = int(time.time())
+            existing = storage.idempotency().claim(
+                record_key, fingerprint, datetime.utcnow().isoformat(), now + IDEMPOTENCY_TTL_SECONDS,
+                now + IDEMPOTENCY_LOCK_SECONDS
+            )
+            if existing is not None:
+                return idempotent_response(existing, fingerprint, headers)
+        
+        # Near-duplicates of several recent posts are a spam wave: reject;
+        # a single one is posted but flagged for moderators
+        verdict = spam.check(content)
+        
+        if verdict.rejected:
+            print(f"Rejected near-duplicate from {user.get('userId')}: {verdict.matches} recent matches")
+            instrumentation.record_count('spam.rejected')
+            if idempotency_key:
+                storage.idempotency().release(record_key)
+            return {
+                'statusCode': 422,
+                'headers': headers,
+                'body': json.dumps({
+                    'success': False,
+                    'error': 'This message repeats recent posts too closely',
+                    'code': 'DUPLICATE_CONTENT'
+                })
+            }
+        
+        if verdict.flagged:
+            instrumentation.record_count('spam.flagged')
+        
         # Create message
         username = user.get('username', user.get('email', 'Anonymous_Cow'))
-        clearance_level = user.get('clearanceLevel', 'LEVEL 1')
         
-        message = create_message(
-            user.get('userId'),
-            username,
-            content,
-            clearance_level
+        try:
+            message = create_message(
+                user.get('userId'),
+                username,
+                content,
+                clearance_level,
+                parent_id,
+                verdict.duplicate_of if verdict.flagged else None,
+                board_id
+            )
+        except storage.ConditionFailed:
+            if idempotency_key:
+                storage.idempotency().release(record_key)
+            # The parent was deleted while the reply was being written
+            return {
+                'statusCode': 404,
+                'headers': headers,
+                'body': json.dumps({
+                    'success': False,
+                    'error': 'Parent message not found',
+                    'code': 'PARENT_NOT_FOUND'
+                })
+            }
+        except Exception:
+            if idempotency_key:
+                # Nothing was posted; let a retry with the same key try again
+                storage.idempotency().release(record_key)
+            raise
+        
+        spam.remember(verdict, message['messageId'], message['userId'], message['timestamp'])
+        # Independent best-effort writes, issued together
+        storage.concurrently(
+            lambda: record_stats(message),
+            lambda: record_change(message, board_id)
         )
         
         # Success response
-        return {
-            'statusCode': 201,
-            'headers': headers,
-            'body': json.dumps({
+        with instrumentation.span('serialize'):
+            response_body = json.dumps({
                 'success': True,
                 'message': message
             })
+        
+        if idempotency_key:
+            try:
+                storage.idempotency().complete(record_key, 201, response_body)
+            except Exception as e:
+                # The message is posted; retries get 409 until the lease
+                # lapses, then post it again
+                print(f"Error recording idempotent response: {str(e)}")
+        
+        return {
+            'statusCode': 201,
+            'headers': headers,
+            'body': response_body
         }
         
     except json.JSONDecodeError:
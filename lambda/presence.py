@@ -0,0 +1,117 @@
+"""
+AWS Lambda function for "cows in the pasture now"
+Records heartbeats from signed-in clients and serves the online count from windowed counters
+"""
+
+import json
+import os
+import time
+import threading
+import auth
+import instrumentation
+import storage
+
+# How long each container reuses the online count before reading the counters again
+PRESENCE_CACHE_SECONDS = float(os.environ.get('PRESENCE_CACHE_SECONDS', '5'))
+
+# CORS headers
+HEADERS = auth.cors_headers('GET,POST,OPTIONS')
+
+# (expires at, count) shared by every request this container serves
+_count_cache = {'expires': 0.0, 'count': None}
+_count_lock = threading.Lock()
+
+
+def online_count(now=None):
+    """The online count, read from storage at most once per PRESENCE_CACHE_SECONDS"""
+    now = now or time.time()
+    if _count_cache['count'] is not None and now < _count_cache['expires']:
+        instrumentation.record_count('presence.cache_hits')
+        return _count_cache['count']
+
+    with _count_lock:
+        # Another request may have refreshed it while this one waited
+        if _count_cache['count'] is not None and now < _count_cache['expires']:
+            return _count_cache['count']
+        count = storage.presence().online_count(now)
+        _count_cache['count'] = count
+        _count_cache['expires'] = now + PRESENCE_CACHE_SECONDS
+        return count
+
+
+def success_response(body):
+    with instrumentation.span('serialize'):
+        response_body = json.dumps({'success': True, **body})
+
+    return {
+        'statusCode': 200,
+        'headers': HEADERS,
+        'body': response_body
+    }
+
+
+@instrumentation.instrumented('POST /presence')
+def heartbeat(event, context):
+    try:
+        # Heartbeats are frequent, so the user item is not read; the token's userId is enough
+        payload, error = auth.authenticate_token(event, HEADERS)
+        if error:
+            return error
+
+        user_id = payload.get('userId')
+
+        if not user_id:
+            return auth.error_response(HEADERS, 401, 'Invalid token', 'INVALID_TOKEN')
+
+        now = time.time()
+        storage.presence().heartbeat(user_id, now)
+
+        return success_response({
+            'online': online_count(now),
+            # Heartbeat twice per window so a late request does not drop the cow
+            'heartbeatSeconds': storage.PRESENCE_WINDOW_SECONDS // 2
+        })
+
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return auth.error_response(HEADERS, 500, 'Internal server error', 'INTERNAL_ERROR')
+
+
+@instrumentation.instrumented('GET /presence')
+def get_online_count(event, context):
+    try:
+        _, error = auth.authenticate_token(event, HEADERS)
+        if error:
+            return error
+
+        return success_response({'online': online_count()})
+
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return auth.error_response(HEADERS, 500, 'Internal server error', 'INTERNAL_ERROR')
+
+
+def lambda_handler(event, context):
+    """
+    Main Lambda handler for presence
+
+    Expected headers:
+    Authorization: Bearer <jwt_token>
+
+    POST records a heartbeat for the caller and returns the online count;
+    GET returns the online count only. Counts may be a few seconds old.
+    """
+    method = event.get('httpMethod')
+
+    # Handle OPTIONS request for CORS
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': HEADERS,
+            'body': json.dumps({'message': 'OK'})
+        }
+
+    if method == 'POST':
+        return heartbeat(event, context)
+
+    return get_online_count(event, context)
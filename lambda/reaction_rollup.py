@@ -0,0 +1,94 @@
+"""
+AWS Lambda function that rolls moo counter shards up into message totals
+Runs on a schedule: finds messages whose shards changed since the last run and stores their mooCount
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+import boards
+import instrumentation
+import storage
+
+# Re-read a little before the previous run started, to cover clock skew between writers
+OVERLAP_SECONDS = int(os.environ.get('ROLLUP_OVERLAP_SECONDS', '5'))
+
+
+def rollup():
+    """Recompute mooCount for every message with shard updates since the watermark"""
+    reactions = storage.reactions()
+    messages = storage.messages()
+
+    started = datetime.utcnow()
+    watermark = reactions.watermark() or ''
+    changed = reactions.changed_since(watermark)
+
+    updated, missing = [], 0
+    for message_id in changed:
+        message = messages.set_moo_count(message_id, reactions.total(message_id))
+        if message:
+            updated.append(message)
+        else:
+            # Deleted or archived since it was mooed
+            missing += 1
+
+    record_changes(updated)
+    reactions.set_watermark((started - timedelta(seconds=OVERLAP_SECONDS)).isoformat())
+    return {'messages': len(changed), 'updated': len(updated), 'missing': missing, 'since': watermark}
+
+
+def record_changes(updated):
+    """
+    Log the new moo counts as edits for delta sync (best effort)
+
+    Replies are logged on their parent's board, read in one batch; each
+    board's edits take one counter update.
+    """
+    try:
+        parents = storage.messages().get_many({m['parentId'] for m in updated if m.get('parentId')}, ['boardId'])
+        parent_boards = {parent_id: boards.board_of(parent) for parent_id, parent in parents.items()}
+
+        by_board = {}
+        for message in updated:
+            parent_id = message.get('parentId')
+            board_id = parent_boards.get(parent_id) if parent_id else boards.board_of(message)
+            if board_id is None:
+                # The thread was deleted while its reply was being mooed
+                continue
+            entry = {'type': 'edit', 'messageId': message['messageId'], 'fields': {'mooCount': message['mooCount']}}
+            if parent_id:
+                entry['parentId'] = parent_id
+            by_board.setdefault(board_id, []).append(entry)
+
+        for board_id, entries in by_board.items():
+            storage.changes().append(board_id, entries)
+    except Exception as e:
+        print(f"Error recording changes: {str(e)}")
+
+
+@instrumentation.instrumented('SCHEDULED reaction_rollup')
+def lambda_handler(event, context):
+    """
+    Main Lambda handler for the reaction rollup
+
+    Invoked by an EventBridge schedule; each run costs reads in proportion to
+    the messages mooed since the last one, not to the size of the board.
+    """
+    try:
+        result = rollup()
+        print(f"Rolled up moos for {result['updated']} messages")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'success': True, **result})
+        }
+
+    except Exception as e:
+        print(f"Reaction rollup failed: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({
+                'success': False,
+                'error': 'Reaction rollup failed',
+                'code': 'INTERNAL_ERROR'
+            })
+        }
@@ -0,0 +1,79 @@
+"""
+Write-time processing of message content
+Escapes, linkifies and extracts mentions once when a message is posted, so reads serve stored HTML
+"""
+
+import re
+import html
+
+# Bump when the rendered output changes; messages stored with an older version
+# are re-rendered on read until they are rewritten
+RENDER_VERSION = 1
+
+URL_PATTERN = re.compile(r'https?://[^\s<>"\']+', re.IGNORECASE)
+# @name not preceded by a word character or @, so emails are not mentions
+MENTION_PATTERN = re.compile(r'(?<![\w@])@([A-Za-z0-9_][A-Za-z0-9_.-]{0,31})')
+TRAILING_PUNCTUATION = '.,!?;:)]}\'"'
+
+MAX_LINKS = 10
+MAX_MENTIONS = 20
+
+
+def _trim_url(match_text):
+    """Drop trailing punctuation that ends a sentence rather than the URL"""
+    url = match_text.rstrip(TRAILING_PUNCTUATION)
+    # Keep a closing parenthesis that balances one inside the URL
+    while match_text[len(url):].startswith(')') and url.count('(') > url.count(')'):
+        url += ')'
+    return url
+
+
+def _render_text(text, mentions):
+    """Escape plain text, wrapping @mentions"""
+    parts, position = [], 0
+    for match in MENTION_PATTERN.finditer(text):
+        name = match.group(1).rstrip('.-')
+        end = match.start() + 1 + len(name)
+        parts.append(html.escape(text[position:match.start()]))
+        parts.append(f'<span class="mention">@{html.escape(name)}</span>')
+        if name.lower() not in (m.lower() for m in mentions) and len(mentions) < MAX_MENTIONS:
+            mentions.append(name)
+        position = end
+    parts.append(html.escape(text[position:]))
+    return ''.join(parts)
+
+
+def render_message(content):
+    """
+    Process raw message content
+
+    Returns the attributes stored next to content: renderedContent (HTML safe
+    to insert as-is), the links and mentions found in it, and renderVersion.
+    """
+    links, mentions, parts = [], [], []
+    position = 0
+    for match in URL_PATTERN.finditer(content):
+        url = _trim_url(match.group(0))
+        parts.append(_render_text(content[position:match.start()], mentions))
+        escaped = html.escape(url)
+        parts.append(f'<a href="{escaped}" rel="nofollow noopener noreferrer" target="_blank">{escaped}</a>')
+        if url not in links and len(links) < MAX_LINKS:
+            links.append(url)
+        # Trailing punctuation is rendered as text with what follows
+        position = match.start() + len(url)
+    parts.append(_render_text(content[position:], mentions))
+
+    rendered = ''.join(parts).replace('\r\n', '\n').replace('\n', '<br>')
+    return {
+        'renderedContent': rendered,
+        'links': links,
+        'mentions': mentions,
+        'renderVersion': RENDER_VERSION
+    }
+
+
+def rendered_content(item):
+    """The stored rendering of a message, or a fresh one for messages written before it existed"""
+    if item.get('renderedContent') is not None and int(item.get('renderVersion') or 0) == RENDER_VERSION:
+        return item['renderedContent']
+    return render_message(item.get('content') or '')['renderedContent']
@@ -0,0 +1,129 @@
+"""
+AWS Lambda function that moves old messages out of the hot Messages table
+Runs on a schedule: archives messages past the retention age, then deletes them from DynamoDB
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+import archive
+import instrumentation
+import storage
+
+# Messages older than this many days move to the archive
+RETENTION_DAYS = int(os.environ.get('RETENTION_DAYS', '30'))
+SCAN_PAGE_SIZE = int(os.environ.get('RETENTION_SCAN_PAGE_SIZE', '500'))
+
+
+def old_message_ids(messages, cutoff):
+    """
+    day -> IDs of the messages posted before cutoff that are archived on their own
+
+    Only IDs are kept from the scan, so memory grows with the number of old
+    messages rather than their size. Old replies go with their thread when
+    its top-level message is archived and stay while it is still in the
+    table; only orphans (whose parent is gone) are archived by themselves.
+    """
+    days, replies = {}, []
+    for batch in messages.older_than(cutoff, SCAN_PAGE_SIZE):
+        for message in batch:
+            day = message['timestamp'][:10]
+            if message.get('parentId'):
+                replies.append((day, message['messageId'], message['parentId']))
+            else:
+                days.setdefault(day, []).append(message['messageId'])
+
+    live = set(messages.get_many({parent_id for _, _, parent_id in replies}, ['messageId']))
+    for day, reply_id, parent_id in replies:
+        if parent_id not in live:
+            days.setdefault(day, []).append(reply_id)
+    return days
+
+
+def archive_thread(messages, store, parent):
+    """
+    Delete an archived top-level message and its replies, writing the replies to its thread segment
+
+    Returns the replies. Messages without replies get no thread segment.
+    """
+    replies = messages.all_replies(parent['messageId'])
+    if replies:
+        store.write_thread(parent, replies)
+    messages.delete(parent['messageId'], count_reply=False)
+    # Replies posted after the read above are archived too; none can follow
+    # once the parent is gone
+    archived = {reply['messageId'] for reply in replies}
+    late = [reply for reply in messages.delete_replies(parent['messageId']) if reply['messageId'] not in archived]
+    if late:
+        store.write_thread(parent, late)
+    return replies + late
+
+
+def archive_before(cutoff):
+    """Archive and delete every message posted before cutoff (ISO 8601), a day at a time; returns counts"""
+    messages = storage.messages()
+    store = archive.get_archive()
+
+    archived, deleted, segments = 0, 0, []
+    for day, message_ids in sorted(old_message_ids(messages, cutoff).items()):
+        day_messages = list(messages.get_many(message_ids).values())
+        top_level = [message for message in day_messages if not message.get('parentId')]
+        # Replies left behind by a run that failed part way rejoin their
+        # thread; any other orphan is kept in the day's segments
+        threads = {
+            message['parentId']: store.thread(message['parentId']) for message in day_messages if message.get('parentId')
+        }
+        rejoining = {message['messageId'] for message in day_messages if threads.get(message.get('parentId'))}
+        for reply in day_messages:
+            if reply['messageId'] in rejoining:
+                store.write_thread(threads[reply['parentId']][0], [reply])
+
+        # Segments are written before anything is deleted, and messages already
+        # archived are not written again, so a failed run is safe to repeat
+        segments += store.write([message for message in day_messages if message['messageId'] not in rejoining])
+
+        for message in day_messages:
+            try:
+                if message.get('parentId'):
+                    messages.delete(message['messageId'], count_reply=False)
+                    removed = 1
+                else:
+                    removed = 1 + len(archive_thread(messages, store, message))
+                archived += removed
+                deleted += removed
+            except Exception as e:
+                print(f"Error archiving message {message['messageId']}: {str(e)}")
+
+    return {'archived': archived, 'deleted': deleted, 'segments': segments}
+
+
+@instrumentation.instrumented('SCHEDULED retention')
+def lambda_handler(event, context):
+    """
+    Main Lambda handler for the retention job
+
+    Invoked by an EventBridge schedule. An optional "retentionDays" in the
+    event overrides RETENTION_DAYS for a one-off run.
+    """
+    retention_days = int((event or {}).get('retentionDays', RETENTION_DAYS))
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).isoformat()
+
+    try:
+        result = archive_before(cutoff)
+        print(f"Archived {result['archived']} messages older than {cutoff} "
+              f"into {len(result['segments'])} segments")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'success': True, 'cutoff': cutoff, **result})
+        }
+
+    except Exception as e:
+        print(f"Retention run failed: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({
+                'success': False,
+                'error': 'Retention run failed',
+                'code': 'INTERNAL_ERROR'
+            })
+        }
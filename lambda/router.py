@@ -0,0 +1,140 @@
+"""
+AWS Lambda function that hosts every API route in one container
+Dispatches API Gateway proxy events by method and path to the existing handlers
+"""
+
+import re
+import json
+import importlib
+import threading
+import instrumentation
+
+# (method, resource) -> handler module; resources match api-spec-template.yaml
+ROUTES = {
+    ('POST', '/auth/signin'): 'signin',
+    ('POST', '/auth/signup'): 'signup',
+    ('POST', '/auth/signout'): 'signout',
+    ('GET', '/auth/me'): 'get_current_user',
+    ('GET', '/messages'): 'get_messages',
+    ('POST', '/messages'): 'post_message',
+    ('GET', '/messages/changes'): 'get_changes',
+    ('DELETE', '/messages/{messageId}'): 'delete_message',
+    ('GET', '/messages/{messageId}/replies'): 'get_replies',
+    ('POST', '/messages/{messageId}/moo'): 'moo_message',
+    ('DELETE', '/messages/{messageId}/moo'): 'moo_message',
+    ('GET', '/presence'): 'presence',
+    ('POST', '/presence'): 'presence',
+    ('GET', '/stats'): 'get_stats',
+    ('GET', '/boards'): 'get_boards',
+    ('GET', '/admin/registrations'): 'admin_registrations',
+    ('POST', '/admin/registrations'): 'admin_registrations',
+}
+
+# Per-route counters for the life of this container
+ROUTE_METRICS = {}
+_metrics_lock = threading.Lock()
+
+
+def _compile(resource):
+    """Turn '/messages/{messageId}' into a regex capturing messageId"""
+    pattern = re.sub(r'\\\{(\w+)\\\}', r'(?P<\1>[^/]+)', re.escape(resource))
+    return re.compile(f'^{pattern}/?$')
+
+
+RESOURCE_PATTERNS = [(resource, _compile(resource)) for resource in sorted({r for _, r in ROUTES})]
+
+
+def resolve(method, resource=None, path=None):
+    """Find the resource, handler module and path parameters for a request"""
+    if resource is None or not any(resource == r for r, _ in RESOURCE_PATTERNS):
+        resource, params = None, None
+        for candidate, pattern in RESOURCE_PATTERNS:
+            match = pattern.match(path or '')
+            if match:
+                resource, params = candidate, match.groupdict()
+                break
+        if resource is None:
+            return None, None, None
+    else:
+        params = None
+    return resource, ROUTES.get((method, resource)), params
+
+
+def allowed_methods(resource):
+    """Methods served on a resource, as sent in CORS preflight responses"""
+    return sorted(m for m, r in ROUTES if r == resource) + ['OPTIONS']
+
+
+def load_handler(module_name):
+    """Import a route's handler on its first request; later requests reuse the module"""
+    return importlib.import_module(module_name).lambda_handler
+
+
+def record(route, status_code, duration_ms, cold):
+    """Update the container's per-route counters"""
+    with _metrics_lock:
+        metrics = ROUTE_METRICS.setdefault(route, {
+            'invocations': 0, 'errors': 0, 'coldStarts': 0, 'totalMs': 0.0, 'maxMs': 0.0
+        })
+        metrics['invocations'] += 1
+        metrics['errors'] += 1 if status_code >= 500 else 0
+        metrics['coldStarts'] += 1 if cold else 0
+        metrics['totalMs'] += duration_ms
+        metrics['maxMs'] = max(metrics['maxMs'], duration_ms)
+        return dict(metrics)
+
+
+def lambda_handler(event, context):
+    """
+    Main Lambda handler routing every API request
+
+    Uses event['resource'] when API Gateway provides it and falls back to
+    matching event['path'] against the known resources.
+    """
+    method = (event.get('httpMethod') or 'GET').upper()
+    resource, module_name, path_params = resolve(method, event.get('resource'), event.get('path'))
+    route = f'{method} {resource or event.get("path")}'
+
+    # The handlers' own instrumentation defers to this request, so each
+    # invocation still produces exactly one metrics line
+    with instrumentation.request(route, context) as metrics:
+        response = dispatch(event, context, method, resource, module_name, path_params)
+        metrics.status_code = response['statusCode']
+
+    record(route, response['statusCode'], metrics.duration_ms, metrics.cold_start)
+    return response
+
+
+def dispatch(event, context, method, resource, module_name, path_params):
+    """Produce the response for a resolved request"""
+    if resource is None or (module_name is None and method != 'OPTIONS'):
+        return {
+            'statusCode': 404 if resource is None else 405,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Headers': 'Content-Type,Authorization,Idempotency-Key',
+            },
+            'body': json.dumps({
+                'success': False,
+                'error': 'Route not found' if resource is None else 'Method not allowed',
+                'code': 'ROUTE_NOT_FOUND' if resource is None else 'METHOD_NOT_ALLOWED'
+            })
+        }
+
+    if method == 'OPTIONS':
+        # Answer preflights here so they never import (or warm up) a handler
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Headers': 'Content-Type,Authorization,Idempotency-Key',
+                'Access-Control-Allow-Methods': ','.join(allowed_methods(resource))
+            },
+            'body': json.dumps({'message': 'OK'})
+        }
+
+    if path_params and not event.get('pathParameters'):
+        event = dict(event, pathParameters=path_params, resource=resource)
+    return load_handler(module_name)(event, context)
@@ -0,0 +1,284 @@
+"""
+Long-running HTTP server hosting every API route outside Lambda
+Translates requests into API Gateway proxy events and dispatches them through router.py
+
+Usage:
+    STORAGE_BACKEND=sqlite SQLITE_PATH=/var/lib/cows/cows.db python server.py --port 8080
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import base64
+import signal
+import argparse
+import threading
+from types import SimpleNamespace
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+
+import clients
+import instrumentation
+import router
+
+SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('SERVER_PORT', '8080'))
+# Requests handled at once; each worker thread keeps its own storage connection
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '32'))
+# Threads for hedged reads and for fanned-out writes, shared by every worker (default: SERVER_THREADS)
+SERVER_HEDGE_WORKERS = int(os.environ.get('SERVER_HEDGE_WORKERS', '0')) or None
+SERVER_BATCH_WORKERS = int(os.environ.get('SERVER_BATCH_WORKERS', '0')) or None
+# How long an idle keep-alive connection may hold a worker
+SERVER_IDLE_SECONDS = float(os.environ.get('SERVER_IDLE_SECONDS', '5'))
+# Optional path prefix, e.g. 'prod' so clients built for API Gateway work unchanged
+SERVER_STAGE = os.environ.get('SERVER_STAGE', '').strip('/')
+# API Gateway's payload limit
+SERVER_MAX_BODY_BYTES = int(os.environ.get('SERVER_MAX_BODY_BYTES', str(10 * 1024 * 1024)))
+SERVER_ACCESS_LOG = os.environ.get('SERVER_ACCESS_LOG', 'false').lower() == 'true'
+
+API_SPEC = os.environ.get('API_SPEC', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'terraform', 'api-spec-template.yaml'
+))
+
+PATH_LINE = re.compile(r'^  (/\S*):\s*$')
+METHOD_LINE = re.compile(r'^    (get|post|put|patch|delete):\s*$')
+URI_LINE = re.compile(r'functions/\$\{(\w+?)(?:_lambda)?_arn\}/invocations')
+
+
+def spec_routes(path):
+    """
+    (method, resource) -> handler module for every operation in the API spec
+
+    The template is read line by line, relying on its fixed layout (paths at
+    two spaces, methods at four), so no YAML parser is needed; the handler is
+    taken from the operation's integration URI.
+    """
+    routes = {}
+    resource = method = None
+    with open(path) as f:
+        for line in f:
+            match = PATH_LINE.match(line)
+            if match:
+                resource, method = match.group(1), None
+                continue
+            match = METHOD_LINE.match(line)
+            if match and resource:
+                method = match.group(1).upper()
+                continue
+            match = URI_LINE.search(line)
+            if match and resource and method:
+                routes[(method, resource)] = match.group(1)
+    return routes
+
+
+def check_routes(path=API_SPEC):
+    """Differences between the API spec and router.ROUTES, as readable lines"""
+    if not os.path.exists(path):
+        print(f"API spec not found at {path}; serving router.ROUTES unchecked")
+        return []
+    spec = spec_routes(path)
+    problems = []
+    for route, module_name in sorted(spec.items()):
+        if router.ROUTES.get(route) != module_name:
+            problems.append(f"{route[0]} {route[1]}: spec uses {module_name}, router has {router.ROUTES.get(route)}")
+    for route in sorted(set(router.ROUTES) - set(spec)):
+        problems.append(f"{route[0]} {route[1]}: in router.ROUTES but not in the spec")
+    return problems
+
+
+def warm_up(threads=SERVER_THREADS, hedge_workers=SERVER_HEDGE_WORKERS, batch_workers=SERVER_BATCH_WORKERS):
+    """Import every handler and open storage before the first request, as a cold start would"""
+    import storage
+    # Every worker may hedge a read or fan out writes at once
+    hedge_workers = hedge_workers or max(storage.HEDGE_WORKERS, threads)
+    batch_workers = batch_workers or max(storage.BATCH_WORKERS, threads)
+    storage.set_worker_counts(hedge=hedge_workers, batch=batch_workers)
+    # Let botocore keep a kept-alive connection for every thread that may use one
+    clients.set_max_pool_connections(max(clients.MAX_POOL_CONNECTIONS, threads + hedge_workers + batch_workers))
+    start = time.perf_counter()
+    for module_name in sorted(set(router.ROUTES.values())):
+        router.load_handler(module_name)
+    backend = storage.get_backend()
+    # DynamoDB tables created before the pool was resized hold the old client
+    backend.reset()
+    # Builds the DynamoDB resource, or opens SQLite and creates its tables
+    for schema in vars(storage).values():
+        if isinstance(schema, storage.TableSchema):
+            backend.table(schema)
+    instrumentation.warmed()
+    print(f"Warmed {len(set(router.ROUTES.values()))} handlers in {(time.perf_counter() - start) * 1000.0:.0f} ms")
+
+
+def to_event(method, target, headers, body, client_ip):
+    """Build the API Gateway REST (v1) proxy event, and a Lambda-like context, for one HTTP request"""
+    url = urlsplit(target)
+    path = url.path or '/'
+    if SERVER_STAGE and (path == f'/{SERVER_STAGE}' or path.startswith(f'/{SERVER_STAGE}/')):
+        path = path[len(SERVER_STAGE) + 1:] or '/'
+
+    single_headers, multi_headers = {}, {}
+    for name, value in headers.items():
+        single_headers[name] = value
+        multi_headers.setdefault(name, []).append(value)
+
+    query, multi_query = {}, {}
+    for name, value in parse_qsl(url.query, keep_blank_values=True):
+        query[name] = value
+        multi_query.setdefault(name, []).append(value)
+
+    is_base64 = False
+    if body:
+        try:
+            body = body.decode('utf-8')
+        except UnicodeDecodeError:
+            body, is_base64 = base64.b64encode(body).decode('ascii'), True
+    else:
+        body = None
+
+    request_id = str(uuid.uuid4())
+    return {
+        'resource': None,
+        'path': path,
+        'httpMethod': method,
+        'headers': single_headers,
+        'multiValueHeaders': multi_headers,
+        'queryStringParameters': query or None,
+        'multiValueQueryStringParameters': multi_query or None,
+        'pathParameters': None,
+        'stageVariables': None,
+        'requestContext': {
+            'httpMethod': method,
+            'path': url.path,
+            'stage': SERVER_STAGE or None,
+            'requestId': request_id,
+            'requestTimeEpoch': int(time.time() * 1000),
+            'identity': {'sourceIp': client_ip},
+        },
+        'body': body,
+        'isBase64Encoded': is_base64,
+    }, SimpleNamespace(aws_request_id=request_id)
+
+
+def error_body(status_code, error, code):
+    return {
+        'statusCode': status_code,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'success': False, 'error': error, 'code': code})
+    }
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """Turns each HTTP request into a proxy event and writes the handler's response back"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'CowsWithAK'
+    timeout = SERVER_IDLE_SECONDS
+
+    def handle_any(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > SERVER_MAX_BODY_BYTES:
+            self.close_connection = True
+            return self.send(error_body(413, 'Request body too large', 'PAYLOAD_TOO_LARGE'))
+
+        body = self.rfile.read(length) if length else b''
+        event, context = to_event(self.command, self.path, self.headers, body, self.client_address[0])
+        try:
+            response = router.lambda_handler(event, context)
+        except Exception as e:
+            print(f"Unexpected error: {str(e)}")
+            response = error_body(500, 'Internal server error', 'INTERNAL_ERROR')
+        self.send(response)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_OPTIONS = handle_any
+
+    def send(self, response):
+        body = response.get('body') or ''
+        body = base64.b64decode(body) if response.get('isBase64Encoded') else body.encode('utf-8')
+
+        self.send_response(response.get('statusCode', 200))
+        for name, value in (response.get('headers') or {}).items():
+            self.send_header(name, str(value))
+        for name, values in (response.get('multiValueHeaders') or {}).items():
+            for value in values:
+                self.send_header(name, str(value))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if SERVER_ACCESS_LOG:
+            super().log_message(format, *args)
+
+
+class PooledHTTPServer(HTTPServer):
+    """
+    HTTPServer that hands connections to a fixed pool of worker threads
+
+    A thread per connection would open (and leak) a SQLite connection for
+    every request; a fixed pool keeps one per worker for the life of the
+    process, next to botocore's shared connection pool.
+    """
+
+    request_queue_size = 128
+
+    def __init__(self, address, handler_class, threads=SERVER_THREADS):
+        super().__init__(address, handler_class)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the Cows with a K API without Lambda')
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS)
+    parser.add_argument('--hedge-workers', type=int, default=SERVER_HEDGE_WORKERS,
+                        help='Threads for hedged reads (default: --threads)')
+    parser.add_argument('--batch-workers', type=int, default=SERVER_BATCH_WORKERS,
+                        help='Threads for fanned-out writes (default: --threads)')
+    parser.add_argument('--spec', default=API_SPEC, help='API spec whose routes must match router.ROUTES')
+    args = parser.parse_args(argv)
+
+    problems = check_routes(args.spec)
+    if problems:
+        for problem in problems:
+            print(f"Route mismatch: {problem}")
+        return 1
+
+    warm_up(args.threads, args.hedge_workers, args.batch_workers)
+    httpd = PooledHTTPServer((args.host, args.port), RequestHandler, threads=args.threads)
+
+    # shutdown() waits for serve_forever() to return, so it cannot run on the signal's thread
+    def stop(signum, frame):
+        threading.Thread(target=httpd.shutdown).start()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f"Serving {len(router.ROUTES)} routes on http://{args.host}:{args.port} with {args.threads} threads")
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
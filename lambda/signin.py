@@ -4,21 +4,15 @@ Authenticates users and returns JWT tokens
 """
 
 import json
-import boto3
 import hashlib
 import hmac
 import base64
 import os
 from datetime import datetime, timedelta
-import jwt
+import auth
+import instrumentation
+import storage
 
-# AWS Clients
-dynamodb = boto3.resource('dynamodb')
-users_table = dynamodb.Table(os.environ.get('USERS_TABLE', 'CowsWithAK-Users'))
-
-# JWT Configuration
-JWT_SECRET = os.environ.get('JWT_SECRET', 'moo-secret-key-change-in-production')
-JWT_ALGORITHM = 'HS256'
 TOKEN_EXPIRY_HOURS = 24
 
 
@@ -37,6 +31,7 @@ def hash_password(password, salt=None):
     return salt, pwd_hash
 
 
+@instrumentation.timed('auth.password_verify')
 def verify_password(stored_password, stored_salt, provided_password):
     """Verify a stored password against provided password"""
     salt = base64.b64decode(stored_salt)
@@ -46,8 +41,12 @@ def verify_password(stored_password, stored_salt, provided_password):
     return hmac.compare_digest(stored_hash, pwd_hash)
 
 
+@instrumentation.timed('auth.jwt_sign')
 def generate_jwt_token(user_data):
     """Generate JWT token for authenticated user"""
+    # Deferred: PyJWT is only needed once the password has been verified
+    import jwt
+
     payload = {
         'userId': user_data['userId'],
         'email': user_data['email'],
@@ -56,17 +55,15 @@ def generate_jwt_token(user_data):
         'iat': datetime.utcnow()
     }
     
-    token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    token = jwt.encode(payload, auth.JWT_SECRET, algorithm=auth.JWT_ALGORITHM)
     return token
 
 
+@instrumentation.timed('auth.user_fetch')
 def get_user_by_email(email):
-    """Retrieve user from DynamoDB by email"""
+    """Retrieve user from storage by email"""
     try:
-        response = users_table.get_item(
-            Key={'email': email.lower()}
-        )
-        return response.get('Item')
+        return storage.users().get(email)
     except Exception as e:
         print(f"Error retrieving user: {str(e)}")
         return None
@@ -75,17 +72,12 @@ def get_user_by_email(email):
 def update_last_login(email):
     """Update user's last login timestamp"""
     try:
-        users_table.update_item(
-            Key={'email': email.lower()},
-            UpdateExpression='SET lastLogin = :timestamp',
-            ExpressionAttributeValues={
-                ':timestamp': datetime.utcnow().isoformat()
-            }
-        )
+        storage.users().record_login(email, datetime.utcnow().isoformat())
     except Exception as e:
         print(f"Error updating last login: {str(e)}")
 
 
+@instrumentation.instrumented('POST /auth/signin')
 def lambda_handler(event, context):
     """
     Main Lambda handler for user sign-in
@@ -191,15 +183,18 @@ def lambda_handler(event, context):
         }
         
         # Success response
-        return {
-            'statusCode': 200,
-            'headers': headers,
-            'body': json.dumps({
+        with instrumentation.span('serialize'):
+            response_body = json.dumps({
                 'success': True,
                 'message': 'Authentication successful',
                 'token': token,
                 'user': user_data
             })
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': response_body
         }
         
     except json.JSONDecodeError:
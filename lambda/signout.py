@@ -4,30 +4,10 @@ Invalidates JWT tokens by adding them to a blacklist
 """
 
 import json
-import boto3
-import os
 from datetime import datetime, timedelta
-import jwt
-
-# AWS Clients
-dynamodb = boto3.resource('dynamodb')
-blacklist_table = dynamodb.Table(os.environ.get('BLACKLIST_TABLE', 'CowsWithAK-TokenBlacklist'))
-
-# JWT Configuration
-JWT_SECRET = os.environ.get('JWT_SECRET', 'moo-secret-key-change-in-production')
-JWT_ALGORITHM = 'HS256'
-
-
-def verify_token(token):
-    """Verify JWT token and extract payload"""
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return True, payload
-    except jwt.ExpiredSignatureError:
-        return False, {'error': 'Token has expired'}
-    except jwt.InvalidTokenError:
-        return False, {'error': 'Invalid token'}
-
+import auth
+import instrumentation
+import storage
 
 def blacklist_token(token, exp_timestamp):
     """Add token to blacklist table"""
@@ -35,34 +15,14 @@ def blacklist_token(token, exp_timestamp):
         # Calculate TTL (DynamoDB will auto-delete after expiry)
         ttl = int(exp_timestamp) + (24 * 60 * 60)  # Add 24 hours buffer
         
-        blacklist_table.put_item(
-            Item={
-                'token': token,
-                'blacklistedAt': datetime.utcnow().isoformat(),
-                'ttl': ttl
-            }
-        )
+        storage.blacklist().revoke(token, datetime.utcnow().isoformat(), ttl)
         return True
     except Exception as e:
         print(f"Error blacklisting token: {str(e)}")
         return False
 
 
-def extract_token_from_header(headers):
-    """Extract Bearer token from Authorization header"""
-    auth_header = headers.get('Authorization') or headers.get('authorization')
-    
-    if not auth_header:
-        return None
-    
-    parts = auth_header.split()
-    
-    if len(parts) != 2 or parts[0].lower() != 'bearer':
-        return None
-    
-    return parts[1]
-
-
+@instrumentation.instrumented('POST /auth/signout')
 def lambda_handler(event, context):
     """
     Main Lambda handler for user sign-out
@@ -90,7 +50,7 @@ def lambda_handler(event, context):
     try:
         # Extract token from Authorization header
         request_headers = event.get('headers', {})
-        token = extract_token_from_header(request_headers)
+        token = auth.extract_token_from_header(request_headers)
         
         if not token:
             return {
@@ -104,7 +64,7 @@ def lambda_handler(event, context):
             }
         
         # Verify token
-        is_valid, payload = verify_token(token)
+        is_valid, payload = auth.verify_token(token)
         
         if not is_valid:
             return {
@@ -125,13 +85,16 @@ def lambda_handler(event, context):
             print("Warning: Failed to blacklist token, but proceeding with signout")
         
         # Success response
-        return {
-            'statusCode': 200,
-            'headers': headers,
-            'body': json.dumps({
+        with instrumentation.span('serialize'):
+            response_body = json.dumps({
                 'success': True,
                 'message': 'Successfully signed out. Return to the pasture safely.'
             })
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': response_body
         }
         
     except Exception as e:
@@ -4,17 +4,14 @@ Creates new user accounts pending council approval
 """
 
 import json
-import boto3
 import hashlib
 import base64
 import os
 import uuid
 from datetime import datetime
-
-# AWS Clients
-dynamodb = boto3.resource('dynamodb')
-ses = boto3.client('ses')
-users_table = dynamodb.Table(os.environ.get('USERS_TABLE', 'CowsWithAK-Users'))
+import clients
+import instrumentation
+import storage
 
 # Configuration
 ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL', 'admin@cowswithak.com')
@@ -55,20 +52,13 @@ def validate_password(password):
     return True, ""
 
 
-def user_exists(email):
-    """Check if user already exists"""
-    try:
-        response = users_table.get_item(
-            Key={'email': email.lower()}
-        )
-        return 'Item' in response
-    except Exception as e:
-        print(f"Error checking user existence: {str(e)}")
-        return False
-
-
 def create_user(email, password, first_name, last_name, cow_name, profile_picture, answers):
-    """Create new user in DynamoDB"""
+    """
+    Create new user in storage, reserving their cow name
+
+    Raises storage.TransactionCanceled if the email or cow name is taken;
+    nothing is written in that case.
+    """
     user_id = f"user-{uuid.uuid4()}"
     salt, pwd_hash = hash_password(password)
     
@@ -82,6 +72,8 @@ def create_user(email, password, first_name, last_name, cow_name, profile_pictur
         'passwordHash': pwd_hash,
         'passwordSalt': salt,
         'status': 'pending',
+        # Puts the user on the sparse pending-index until an admin reviews them
+        'pendingStatus': 'pending',
         'clearanceLevel': 'LEVEL 1',
         'answers': answers,
         'createdAt': datetime.utcnow().isoformat(),
@@ -95,8 +87,10 @@ def create_user(email, password, first_name, last_name, cow_name, profile_pictur
         user_item['profilePictureType'] = profile_picture.get('type', '')
     
     try:
-        users_table.put_item(Item=user_item)
+        storage.users().register(user_item)
         return user_id
+    except storage.TransactionCanceled:
+        raise
     except Exception as e:
         print(f"Error creating user: {str(e)}")
         raise
@@ -129,7 +123,7 @@ Please review and approve/reject this registration in the admin console.
 -- The Bovine Council System
 """
         
-        ses.send_email(
+        clients.ses().send_email(
             Source=SES_SENDER,
             Destination={'ToAddresses': [ADMIN_EMAIL]},
             Message={
@@ -144,6 +138,7 @@ Please review and approve/reject this registration in the admin console.
         return False
 
 
+@instrumentation.instrumented('POST /auth/signup')
 def lambda_handler(event, context):
     """
     Main Lambda handler for user sign-up
@@ -238,46 +233,53 @@ def lambda_handler(event, context):
                 })
             }
         
-        # Check if user already exists
-        if user_exists(email):
+        # Validate security answers
+        if not answers or len(answers) < 4:
             return {
-                'statusCode': 409,
+                'statusCode': 400,
                 'headers': headers,
                 'body': json.dumps({
                     'success': False,
-                    'error': 'A cow with this email is already grazing in our pasture',
-                    'code': 'USER_EXISTS'
+                    'error': 'All security questions must be answered',
+                    'code': 'INCOMPLETE_ANSWERS'
                 })
             }
         
-        # Validate security answers
-        if not answers or len(answers) < 4:
+        # Create user; the email and cow name are claimed in the same write,
+        # so two signups racing for either cannot both succeed
+        try:
+            user_id = create_user(email, password, first_name, last_name, cow_name, profile_picture, answers)
+        except storage.TransactionCanceled as e:
+            if 0 in e.failed:
+                error = 'A cow with this email is already grazing in our pasture'
+            else:
+                error = 'Another cow already goes by that name'
             return {
-                'statusCode': 400,
+                'statusCode': 409,
                 'headers': headers,
                 'body': json.dumps({
                     'success': False,
-                    'error': 'All security questions must be answered',
-                    'code': 'INCOMPLETE_ANSWERS'
+                    'error': error,
+                    'code': 'USER_EXISTS'
                 })
             }
         
-        # Create user
-        user_id = create_user(email, password, first_name, last_name, cow_name, profile_picture, answers)
-        
         # Send notification to admin
         send_admin_notification(email, first_name, last_name, cow_name, answers)
         
         # Success response
-        return {
-            'statusCode': 201,
-            'headers': headers,
-            'body': json.dumps({
+        with instrumentation.span('serialize'):
+            response_body = json.dumps({
                 'success': True,
                 'message': 'Registration received. The Council will review your answers.',
                 'userId': user_id,
                 'debugInfo': f'Email sent via AWS SES to {ADMIN_EMAIL}'
             })
+        
+        return {
+            'statusCode': 201,
+            'headers': headers,
+            'body': response_body
         }
         
     except json.JSONDecodeError:
@@ -0,0 +1,228 @@
+"""
+Near-duplicate detection for posted messages
+Compares each message's MinHash signature with recent ones through a banded (LSH) index,
+held per container and in the shared Fingerprints table
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+import instrumentation
+import moderation
+import storage
+
+SPAM_FILTER = os.environ.get('SPAM_FILTER', 'true').lower() == 'true'
+
+# Messages posted within the window are compared; older fingerprints expire
+SPAM_WINDOW_SECONDS = int(os.environ.get('SPAM_WINDOW_SECONDS', '900'))
+# Estimated Jaccard similarity of character 4-grams at which two messages are near-duplicates
+SPAM_SIMILARITY = float(os.environ.get('SPAM_SIMILARITY', '0.5'))
+# Near-duplicates already posted in the window at which a message is flagged / rejected
+SPAM_FLAG_MATCHES = int(os.environ.get('SPAM_FLAG_MATCHES', '1'))
+SPAM_REJECT_MATCHES = int(os.environ.get('SPAM_REJECT_MATCHES', '3'))
+# Short messages ("moo!") repeat legitimately and are not checked
+SPAM_MIN_CHARS = int(os.environ.get('SPAM_MIN_CHARS', '24'))
+# How long a post waits for the shared index before deciding on the container's alone
+SPAM_CHECK_BUDGET_MS = float(os.environ.get('SPAM_CHECK_BUDGET_MS', '25'))
+SPAM_MEMORY_SIZE = int(os.environ.get('SPAM_MEMORY_SIZE', '5000'))
+# Newest entries read per band from the shared index
+SPAM_BAND_LIMIT = 25
+
+SHINGLE = 4
+# 16 MinHash values in 8 bands of 2: messages with similarity 0.5 share a band
+# 90% of the time, 0.7 over 99%, unrelated ones (under 0.05) about 2%
+SIGNATURE_SIZE = 16
+BANDS = 8
+ROWS = SIGNATURE_SIZE // BANDS
+
+# A recent message: signature is a tuple of SIGNATURE_SIZE ints
+Entry = namedtuple('Entry', ['message_id', 'user_id', 'signature', 'posted'])
+
+# Outcome of a check; duplicate_of is the closest earlier message, if any
+Verdict = namedtuple('Verdict', ['signature', 'bands', 'matches', 'duplicate_of', 'flagged', 'rejected'])
+
+CLEAN = Verdict(None, (), 0, None, False, False)
+
+
+def _hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def signature(content):
+    """
+    MinHash signature of content's character 4-grams, or None if it is too short
+
+    Content is folded like the banned-term filter, so case, accents,
+    look-alikes and punctuation do not make spam look new. One hash per
+    4-gram is split into SIGNATURE_SIZE bins (one-permutation hashing); an
+    empty bin borrows from the next full one so short messages still compare.
+    """
+    folded, _ = moderation.fold(content)
+    if len(folded) < max(SPAM_MIN_CHARS, SHINGLE):
+        return None
+    bins = [None] * SIGNATURE_SIZE
+    for gram in {folded[i:i + SHINGLE] for i in range(len(folded) - SHINGLE + 1)}:
+        h = _hash(gram)
+        slot, value = h % SIGNATURE_SIZE, h // SIGNATURE_SIZE
+        if bins[slot] is None or value < bins[slot]:
+            bins[slot] = value
+    for slot in range(SIGNATURE_SIZE):
+        if bins[slot] is None:
+            offset = 1
+            while bins[(slot + offset) % SIGNATURE_SIZE] is None:
+                offset += 1
+            # Distinct per borrowing slot, identical for identical inputs
+            bins[slot] = _hash(f'{bins[(slot + offset) % SIGNATURE_SIZE]}#{offset}')
+    return tuple(bins)
+
+
+def band_keys(sig):
+    """One key per band of rows; near-duplicates are very likely to share one"""
+    return tuple(
+        f'{band}#{_hash(",".join(str(v) for v in sig[band * ROWS:(band + 1) * ROWS])):016x}'
+        for band in range(BANDS)
+    )
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity: the share of equal signature values"""
+    return sum(1 for x, y in zip(a, b) if x == y) / SIGNATURE_SIZE
+
+
+def encode(sig):
+    return '.'.join(f'{v:x}' for v in sig)
+
+
+def decode(text):
+    return tuple(int(v, 16) for v in text.split('.'))
+
+
+class MemoryIndex:
+    """The container's recent fingerprints, banded like the shared index"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        # message_id -> (Entry, band keys), oldest first
+        self._entries = OrderedDict()
+        self._bands = {}
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        while self._entries:
+            message_id, (entry, keys) = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and entry.posted > now - SPAM_WINDOW_SECONDS:
+                return
+            del self._entries[message_id]
+            for key in keys:
+                members = self._bands.get(key)
+                if members:
+                    members.discard(message_id)
+                    if not members:
+                        del self._bands[key]
+
+    def add(self, entry, keys):
+        with self._lock:
+            self._entries[entry.message_id] = (entry, keys)
+            for key in keys:
+                self._bands.setdefault(key, set()).add(entry.message_id)
+            self._evict(entry.posted)
+
+    def candidates(self, keys, now):
+        """Entries in the window sharing at least one band"""
+        with self._lock:
+            self._evict(now)
+            ids = set()
+            for key in keys:
+                ids.update(self._bands.get(key, ()))
+            return [self._entries[i][0] for i in ids]
+
+
+_memory = MemoryIndex(SPAM_MEMORY_SIZE)
+
+
+def _shared_candidates(keys, now):
+    """Entries from the shared index, or None if it did not answer within the budget"""
+    from concurrent.futures import wait
+
+    since = (datetime.utcfromtimestamp(now) - timedelta(seconds=SPAM_WINDOW_SECONDS)).isoformat()
+    repository = storage.fingerprints()
+    query = instrumentation.bind(repository.recent)
+    futures = [storage.batch_executor().submit(query, key, since, SPAM_BAND_LIMIT) for key in keys]
+    done, pending = wait(futures, timeout=SPAM_CHECK_BUDGET_MS / 1000.0)
+    if pending:
+        # Decide on the container's index alone; the reads finish in the background
+        instrumentation.record_count('spam.store_timeouts')
+        return None
+    entries = []
+    for future in done:
+        for item in future.result():
+            posted = datetime.fromisoformat(item['entry'].split('#', 1)[0])
+            entries.append(Entry(
+                item['messageId'], item.get('userId'), decode(item['signature']),
+                (posted - datetime(1970, 1, 1)).total_seconds()
+            ))
+    return entries
+
+
+def _verdict(sig, keys, entries):
+    scored = {}
+    for entry in entries:
+        score = similarity(sig, entry.signature)
+        if score >= SPAM_SIMILARITY:
+            scored[entry.message_id] = max(score, scored.get(entry.message_id, 0.0))
+    closest = max(scored, key=scored.get) if scored else None
+    return Verdict(
+        sig, keys, len(scored), closest,
+        len(scored) >= SPAM_FLAG_MATCHES, len(scored) >= SPAM_REJECT_MATCHES
+    )
+
+
+def check(content, now=None):
+    """
+    How many near-duplicates of content were posted in the window
+
+    The container's index is checked first; the shared one is only read when
+    that is not already enough to reject, and only for SPAM_CHECK_BUDGET_MS.
+    Errors reading the shared index never block a post.
+    """
+    if not SPAM_FILTER:
+        return CLEAN
+    now = now or time.time()
+    with instrumentation.span('spam.signature'):
+        sig = signature(content)
+    if sig is None:
+        return CLEAN
+    keys = band_keys(sig)
+
+    verdict = _verdict(sig, keys, _memory.candidates(keys, now))
+    if verdict.rejected:
+        return verdict
+
+    try:
+        with instrumentation.span('spam.shared_index'):
+            shared = _shared_candidates(keys, now)
+    except Exception as e:
+        print(f"Error reading fingerprints: {str(e)}")
+        shared = None
+    if shared is None:
+        return verdict
+    return _verdict(sig, keys, _memory.candidates(keys, now) + shared)
+
+
+def remember(verdict, message_id, user_id, posted_at, now=None):
+    """Add a posted message to both indexes (best effort for the shared one)"""
+    if verdict.signature is None:
+        return
+    now = now or time.time()
+    _memory.add(Entry(message_id, user_id, verdict.signature, now), verdict.bands)
+    try:
+        storage.fingerprints().add(
+            verdict.bands, encode(verdict.signature), message_id, user_id,
+            posted_at, int(now) + SPAM_WINDOW_SECONDS
+        )
+    except Exception as e:
+        print(f"Error storing fingerprint: {str(e)}")
@@ -0,0 +1,2142 @@
+"""
+Storage layer for the Cows with a K Lambda functions
+Repositories for users, messages, reactions, presence, fingerprints, revoked tokens and idempotency keys
+over pluggable table backends (DynamoDB in AWS, in-memory or SQLite for local runs and load testing)
+"""
+
+import os
+import json
+import math
+import time
+import zlib
+import bisect
+import random
+import threading
+import unicodedata
+from collections import namedtuple
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import instrumentation
+
+# Backend selection: dynamodb (default), memory or sqlite
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'dynamodb')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'cowswithak.db')
+
+# Hedged reads: if a GetItem has not answered after HEDGE_DELAY_MS, send a second one
+HEDGED_READS = os.environ.get('HEDGED_READS', 'true').lower() == 'true'
+HEDGE_DELAY_MS = float(os.environ.get('HEDGE_DELAY_MS', '20'))
+# Threads sending the second read of a hedge, shared by every request in the process
+HEDGE_WORKERS = int(os.environ.get('HEDGE_WORKERS', '8'))
+
+# Independent reads in one request (e.g. token blacklist and user on the auth
+# path) are issued together; false runs them one after another for comparison
+PARALLEL_READS = os.environ.get('PARALLEL_READS', 'true').lower() == 'true'
+
+# Counter items per message for moo reactions; only ever raise this, since
+# totals are summed over shards 0..REACTION_SHARD_COUNT-1
+REACTION_SHARD_COUNT = int(os.environ.get('REACTION_SHARD_COUNT', '10'))
+
+# Presence: a user is online if they sent a heartbeat in the current or previous
+# window; each window's count is spread over PRESENCE_SHARD_COUNT counter items
+PRESENCE_WINDOW_SECONDS = int(os.environ.get('PRESENCE_WINDOW_SECONDS', '60'))
+PRESENCE_SHARD_COUNT = int(os.environ.get('PRESENCE_SHARD_COUNT', '4'))
+
+# Board statistics: totals and daily rollups are spread over STATS_SHARD_COUNT
+# counter items each (only ever raise this); daily items expire after
+# STATS_HISTORY_DAYS
+STATS_SHARD_COUNT = int(os.environ.get('STATS_SHARD_COUNT', '4'))
+STATS_HISTORY_DAYS = int(os.environ.get('STATS_HISTORY_DAYS', '90'))
+
+# How long the change log keeps posts, edits and delete tombstones; clients
+# that have not synced for longer reload the board
+CHANGE_RETENTION_SECONDS = int(os.environ.get('CHANGE_RETENTION_SECONDS', str(7 * 24 * 3600)))
+
+# BatchGetItem takes at most 100 keys per call; unprocessed keys are retried with backoff
+BATCH_GET_SIZE = 100
+BATCH_GET_RETRIES = int(os.environ.get('BATCH_GET_RETRIES', '5'))
+
+# Concurrent conditional writes for batch operations (DynamoDB has no conditional batch update)
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', '8'))
+
+
+class ConditionFailed(Exception):
+    """Raised when a conditional write does not match the stored item"""
+
+
+class InvalidStartKey(Exception):
+    """Raised when a pagination key names an item outside the partition being read"""
+
+
+class TransactionCanceled(ConditionFailed):
+    """
+    Raised when a condition in a transaction fails; nothing was written
+
+    failed holds the positions of the operations whose conditions failed.
+    """
+
+    def __init__(self, message, failed=()):
+        super().__init__(message)
+        self.failed = tuple(failed)
+
+
+# One page of scan/query results; last_key is None when there are no more items
+Page = namedtuple('Page', ['items', 'last_key'])
+
+# A conditional put in a transaction (see transact_write)
+TransactPut = namedtuple('TransactPut', ['schema', 'item', 'conditions'])
+
+
+class TableSchema:
+    """Key layout, secondary indexes and TTL attribute of a logical table"""
+
+    def __init__(self, name, hash_key, range_key=None, indexes=None, ttl_attribute=None):
+        self.name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        # index name -> (hash attribute, range attribute or None)
+        self.indexes = indexes or {}
+        self.ttl_attribute = ttl_attribute
+        # Short name used in metrics, e.g. CowsWithAK-Users -> Users
+        self.label = name.rsplit('-', 1)[-1]
+
+    def key_attributes(self, index=None):
+        """Attributes that make up the (index) key, in sort order"""
+        if index is None:
+            return [a for a in (self.hash_key, self.range_key) if a]
+        hash_attr, range_attr = self.indexes[index]
+        return [a for a in (hash_attr, range_attr) if a]
+
+    def key_of(self, item):
+        """Extract the primary key of an item"""
+        return {a: item[a] for a in self.key_attributes()}
+
+
+# pending-index is sparse: only users awaiting review carry pendingStatus
+USERS = TableSchema(
+    os.environ.get('USERS_TABLE', 'CowsWithAK-Users'),
+    'email',
+    indexes={'pending-index': ('pendingStatus', 'createdAt')}
+)
+
+# One item per cow name in use, keyed by its normalized form, so names stay unique
+COW_NAMES = TableSchema(
+    os.environ.get('COW_NAMES_TABLE', 'CowsWithAK-CowNames'),
+    'cowNameKey'
+)
+
+BLACKLIST = TableSchema(
+    os.environ.get('BLACKLIST_TABLE', 'CowsWithAK-TokenBlacklist'),
+    'token',
+    ttl_attribute='ttl'
+)
+
+# Both indexes are sparse: only top-level messages carry boardId (one
+# partition per board), and only replies carry parentId
+MESSAGES = TableSchema(
+    os.environ.get('MESSAGES_TABLE', 'CowsWithAK-Messages'),
+    'messageId',
+    indexes={
+        'board-index': ('boardId', 'timestamp'),
+        'parent-index': ('parentId', 'timestamp')
+    }
+)
+
+# One item per board: name, description and the clearance needed to read and post
+BOARDS = TableSchema(
+    os.environ.get('BOARDS_TABLE', 'CowsWithAK-Boards'),
+    'boardId'
+)
+
+IDEMPOTENCY = TableSchema(
+    os.environ.get('IDEMPOTENCY_TABLE', 'CowsWithAK-Idempotency'),
+    'idempotencyKey',
+    ttl_attribute='ttl'
+)
+
+# One item per (message, user) that has mooed; the key is <messageId>#<userId>
+REACTIONS = TableSchema(
+    os.environ.get('REACTIONS_TABLE', 'CowsWithAK-Reactions'),
+    'reactionId'
+)
+
+# Moo counter shards, <messageId>#<shard>; dirty-index is keyed by shard number
+# so the index spreads writes the same way the shards do
+REACTION_SHARDS = TableSchema(
+    os.environ.get('REACTION_SHARDS_TABLE', 'CowsWithAK-ReactionShards'),
+    'shardId',
+    indexes={'dirty-index': ('shard', 'updatedAt')}
+)
+
+# user#<userId> per cow seen recently, plus window#<window>#<shard> counters;
+# both expire by TTL
+PRESENCE = TableSchema(
+    os.environ.get('PRESENCE_TABLE', 'CowsWithAK-Presence'),
+    'presenceId',
+    ttl_attribute='ttl'
+)
+
+# Recent message fingerprints for near-duplicate detection, one item per LSH
+# band: band is <n>#<band hash>, entry is <timestamp>#<messageId>
+FINGERPRINTS = TableSchema(
+    os.environ.get('FINGERPRINTS_TABLE', 'CowsWithAK-Fingerprints'),
+    'band',
+    range_key='entry',
+    ttl_attribute='ttl'
+)
+
+# Board statistics counters: total#<shard>, day#<YYYY-MM-DD>#<shard> and
+# user#<userId>; daily items expire by TTL
+STATS = TableSchema(
+    os.environ.get('STATS_TABLE', 'CowsWithAK-Stats'),
+    'statId',
+    ttl_attribute='ttl'
+)
+
+# Per-board change log: entries at seq 1, 2, ... expire by TTL; seq 0 holds
+# the board's counter
+CHANGES = TableSchema(
+    os.environ.get('CHANGES_TABLE', 'CowsWithAK-Changes'),
+    'boardId',
+    range_key='seq',
+    ttl_attribute='ttl'
+)
+
+
+# ============================================
+# Conditions
+# ============================================
+
+def attribute_exists(name):
+    """Condition: the stored item has the attribute"""
+    return ('exists', name, None)
+
+
+def attribute_not_exists(name):
+    """Condition: the stored item (if any) lacks the attribute"""
+    return ('not_exists', name, None)
+
+
+def equals(name, value):
+    """Condition: the stored attribute equals value"""
+    return ('eq', name, value)
+
+
+def not_equals(name, value):
+    """Condition: the stored attribute is missing or differs from value"""
+    return ('ne', name, value)
+
+
+def less_than(name, value):
+    """Condition: the stored attribute exists and is less than value"""
+    return ('lt', name, value)
+
+
+def matches(item, conditions):
+    """Evaluate a list of conditions (AND) against a stored item or None"""
+    item = item or {}
+    for op, name, value in conditions or []:
+        if op == 'exists' and name not in item:
+            return False
+        if op == 'not_exists' and name in item:
+            return False
+        if op == 'eq' and (name not in item or item[name] != to_storable(value)):
+            return False
+        if op == 'ne' and name in item and item[name] == to_storable(value):
+            return False
+        if op == 'lt' and (name not in item or not item[name] < to_storable(value)):
+            return False
+    return True
+
+
+def in_range(value, condition):
+    """Evaluate a range key condition such as ('>', 5) or ('begins_with', 'a')"""
+    if condition is None:
+        return True
+    if value is None:
+        return False
+    op, operands = condition[0], [to_storable(v) for v in condition[1:]]
+    if op == 'begins_with':
+        return isinstance(value, str) and value.startswith(operands[0])
+    if op == 'between':
+        return operands[0] <= value <= operands[1]
+    return {
+        '=': value == operands[0],
+        '<': value < operands[0],
+        '<=': value <= operands[0],
+        '>': value > operands[0],
+        '>=': value >= operands[0],
+    }[op]
+
+
+# ============================================
+# Item helpers
+# ============================================
+
+def to_storable(value):
+    """Normalize numbers to Decimal (as DynamoDB returns them) and copy containers"""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, int):
+        return Decimal(value)
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {k: to_storable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_storable(v) for v in value]
+    return value
+
+
+def copy_item(value):
+    """Deep copy an item so callers never share state with the store"""
+    if isinstance(value, dict):
+        return {k: copy_item(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [copy_item(v) for v in value]
+    return value
+
+
+def sort_value(value):
+    """Order numbers before strings, like a typed DynamoDB key"""
+    if value is None:
+        return (0, '')
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return (1, Decimal(value))
+    return (2, str(value))
+
+
+def apply_update(item, set_values=None, add_values=None, remove=None):
+    """Apply SET / ADD / REMOVE actions to an item in place"""
+    for name, value in (set_values or {}).items():
+        item[name] = to_storable(value)
+    for name, value in (add_values or {}).items():
+        item[name] = item.get(name, Decimal(0)) + to_storable(value)
+    for name in remove or []:
+        item.pop(name, None)
+    return item
+
+
+def segment_of(hash_value, total_segments):
+    """Parallel scan segment of an item, from its hash key (local backends)"""
+    return zlib.crc32(str(hash_value).encode('utf-8')) % total_segments
+
+
+def item_size(value, name=''):
+    """Approximate DynamoDB item size in bytes (attribute names plus values)"""
+    size = len(name.encode('utf-8'))
+    if isinstance(value, dict):
+        return size + 3 + sum(item_size(v, k) + 1 for k, v in value.items())
+    if isinstance(value, list):
+        return size + 3 + sum(item_size(v) + 1 for v in value)
+    if isinstance(value, str):
+        return size + len(value.encode('utf-8'))
+    if isinstance(value, (bytes, bytearray)):
+        return size + len(value)
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return size + len(str(value).lstrip('-').replace('.', '')) // 2 + 2
+    return size + 1
+
+
+def read_units(size, consistent=False):
+    """Read capacity for one read of size bytes: 4 KB units, halved when eventually consistent"""
+    units = max(1, math.ceil(size / 4096))
+    return float(units) if consistent else units / 2.0
+
+
+def write_units(size):
+    """Write capacity for one write of size bytes, in 1 KB units"""
+    return float(max(1, math.ceil(size / 1024)))
+
+
+def json_default(value):
+    """JSON encoder fallback for the Decimals DynamoDB returns"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+# ============================================
+# Table backends
+# ============================================
+
+class Table:
+    """Operations every backend table supports"""
+
+    def __init__(self, schema):
+        self.schema = schema
+
+    def record_capacity(self, read=0.0, write=0.0):
+        """Charge capacity units to the current request"""
+        instrumentation.record_capacity(self.schema.label, read, write)
+
+    def is_expired(self, item, now=None):
+        """True when the item's TTL attribute is in the past"""
+        ttl_attr = self.schema.ttl_attribute
+        if not item or not ttl_attr or item.get(ttl_attr) is None:
+            return False
+        return int(item[ttl_attr]) <= (now or time.time())
+
+    def unique_keys(self, keys):
+        """Primary keys from keys without duplicates, in their original order"""
+        unique = {}
+        for key in keys:
+            key = self.schema.key_of(to_storable(key))
+            unique.setdefault(tuple(sort_value(v) for v in key.values()), key)
+        return list(unique.values())
+
+    def project(self, item, attributes):
+        """The key and named attributes of item, or all of it when attributes is None"""
+        if attributes is None:
+            return item
+        return {a: item[a] for a in self.schema.key_attributes() + list(attributes) if a in item}
+
+    def complete_start_key(self, start_key, index):
+        """Fill in index key attributes missing from a pagination key"""
+        if not start_key or index is None:
+            return start_key
+        needed = self.schema.key_attributes(index)
+        if all(a in start_key for a in needed):
+            return start_key
+        item = self.get_item(self.schema.key_of(start_key))
+        if not item:
+            return None
+        return {a: item[a] for a in self.schema.key_attributes() + needed if a in item}
+
+    def get_item(self, key, consistent=False, hedge=False):
+        raise NotImplementedError
+
+    def batch_get_item(self, keys, attributes=None):
+        """
+        The items that exist among keys, in no particular order
+
+        Duplicate keys are read once. With attributes, only those and the key
+        are returned; capacity is still charged on whole items, as DynamoDB does.
+        """
+        raise NotImplementedError
+
+    def put_item(self, item, conditions=None):
+        raise NotImplementedError
+
+    def update_item(self, key, set_values=None, add_values=None, remove=None, conditions=None):
+        raise NotImplementedError
+
+    def delete_item(self, key, conditions=None):
+        raise NotImplementedError
+
+    def scan(self, limit=None, start_key=None, index=None, segment=None, total_segments=None,
+             filters=None):
+        """
+        One page of the table or index
+
+        With segment and total_segments, only that slice of a parallel scan;
+        each segment is paginated independently. Filters are conditions applied
+        after limit, as DynamoDB's FilterExpression is: a page can come back
+        short, or even empty, with a last_key.
+        """
+        raise NotImplementedError
+
+    def query(self, hash_value, index=None, range_condition=None, forward=True,
+              limit=None, start_key=None, filters=None):
+        raise NotImplementedError
+
+
+class DynamoDBTable(Table):
+    """
+    Table backed by the client of a boto3 DynamoDB resource
+
+    Every call goes through the resource's client rather than a Table
+    resource: the client is thread-safe, so hedges and fan-outs can share it
+    from pool threads, and it still converts Python values and condition
+    expressions to and from DynamoDB types.
+    """
+
+    def __init__(self, schema, resource):
+        super().__init__(schema)
+        self._client = resource.meta.client
+
+    def _condition_expression(self, conditions):
+        from boto3.dynamodb.conditions import Attr
+
+        expression = None
+        for op, name, value in conditions:
+            clause = {
+                'exists': lambda: Attr(name).exists(),
+                'not_exists': lambda: Attr(name).not_exists(),
+                'eq': lambda: Attr(name).eq(value),
+                'ne': lambda: Attr(name).ne(value),
+                'lt': lambda: Attr(name).lt(value),
+            }[op]()
+            expression = clause if expression is None else expression & clause
+        return expression
+
+    def _key_condition(self, hash_attr, hash_value, range_attr, range_condition):
+        from boto3.dynamodb.conditions import Key
+
+        expression = Key(hash_attr).eq(hash_value)
+        if range_condition:
+            op, operands = range_condition[0], range_condition[1:]
+            key = Key(range_attr)
+            clause = {
+                '=': lambda: key.eq(*operands),
+                '<': lambda: key.lt(*operands),
+                '<=': lambda: key.lte(*operands),
+                '>': lambda: key.gt(*operands),
+                '>=': lambda: key.gte(*operands),
+                'between': lambda: key.between(*operands),
+                'begins_with': lambda: key.begins_with(*operands),
+            }[op]()
+            expression = expression & clause
+        return expression
+
+    WRITE_OPERATIONS = ('put_item', 'update_item', 'delete_item')
+
+    def _call(self, method, **kwargs):
+        kwargs['ReturnConsumedCapacity'] = 'TOTAL'
+        try:
+            response = getattr(self._client, method)(TableName=self.schema.name, **kwargs)
+        except self._client.exceptions.ConditionalCheckFailedException as e:
+            # A failed condition still consumes write capacity; at least one unit
+            self.record_capacity(write=1.0)
+            raise ConditionFailed(str(e))
+        consumed = response.get('ConsumedCapacity') or {}
+        total = float(consumed.get('CapacityUnits', 0.0))
+        if method in self.WRITE_OPERATIONS:
+            self.record_capacity(write=float(consumed.get('WriteCapacityUnits', total)))
+        else:
+            self.record_capacity(read=float(consumed.get('ReadCapacityUnits', total)))
+        return response
+
+    def get_item(self, key, consistent=False, hedge=False):
+        if hedge and HEDGED_READS:
+            response = self._hedged_get(key, consistent)
+        else:
+            response = self._call('get_item', Key=key, ConsistentRead=consistent)
+        item = response.get('Item')
+        return None if self.is_expired(item) else item
+
+    def _hedged_get(self, key, consistent):
+        """GetItem that races a second request when the first is slower than HEDGE_DELAY_MS"""
+        from concurrent.futures import wait, FIRST_COMPLETED
+
+        executor = hedge_executor()
+        call = instrumentation.bind(self._call)
+        primary = executor.submit(call, 'get_item', Key=key, ConsistentRead=consistent)
+        done, _ = wait([primary], timeout=HEDGE_DELAY_MS / 1000.0)
+        if done and primary.exception() is None:
+            return primary.result()
+
+        instrumentation.record_count('storage.hedged_reads')
+        pending = {primary, executor.submit(call, 'get_item', Key=key, ConsistentRead=consistent)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The slower request finishes in the background; its result is discarded
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def batch_get_item(self, keys, attributes=None):
+        keys = self.unique_keys(keys)
+        request = {}
+        if attributes is not None:
+            # Always project the key, so an empty projection is never sent
+            names = list(dict.fromkeys(self.schema.key_attributes() + list(attributes)))
+            request['ProjectionExpression'] = ', '.join(f'#p{i}' for i in range(len(names)))
+            request['ExpressionAttributeNames'] = {f'#p{i}': name for i, name in enumerate(names)}
+
+        client = self._client
+        items = []
+        for start in range(0, len(keys), BATCH_GET_SIZE):
+            pending = {self.schema.name: dict(request, Keys=keys[start:start + BATCH_GET_SIZE])}
+            for attempt in range(BATCH_GET_RETRIES + 1):
+                response = client.batch_get_item(RequestItems=pending, ReturnConsumedCapacity='TOTAL')
+                for consumed in response.get('ConsumedCapacity') or []:
+                    self.record_capacity(read=float(consumed.get('CapacityUnits', 0.0)))
+                items.extend(response.get('Responses', {}).get(self.schema.name, []))
+                pending = response.get('UnprocessedKeys') or {}
+                if not pending:
+                    break
+                if attempt == BATCH_GET_RETRIES:
+                    raise RuntimeError(f'BatchGetItem left keys unprocessed in {self.schema.name}')
+                # Throttled partitions: back off before asking for the rest
+                instrumentation.record_count('storage.batch_get_retries')
+                time.sleep(min(0.05 * 2 ** attempt, 1.0) * random.random())
+        now = time.time()
+        return [self.project(item, attributes) for item in items if not self.is_expired(item, now)]
+
+    def put_item(self, item, conditions=None):
+        kwargs = {'Item': to_storable(item)}
+        if conditions:
+            kwargs['ConditionExpression'] = self._condition_expression(conditions)
+        self._call('put_item', **kwargs)
+
+    def update_item(self, key, set_values=None, add_values=None, remove=None, conditions=None):
+        names, values, set_parts, add_parts = {}, {}, [], []
+        for i, (name, value) in enumerate((set_values or {}).items()):
+            names[f'#s{i}'] = name
+            values[f':s{i}'] = to_storable(value)
+            set_parts.append(f'#s{i} = :s{i}')
+        for i, (name, value) in enumerate((add_values or {}).items()):
+            names[f'#a{i}'] = name
+            values[f':a{i}'] = to_storable(value)
+            add_parts.append(f'#a{i} :a{i}')
+        remove_parts = []
+        for i, name in enumerate(remove or []):
+            names[f'#r{i}'] = name
+            remove_parts.append(f'#r{i}')
+
+        clauses = []
+        if set_parts:
+            clauses.append('SET ' + ', '.join(set_parts))
+        if add_parts:
+            clauses.append('ADD ' + ', '.join(add_parts))
+        if remove_parts:
+            clauses.append('REMOVE ' + ', '.join(remove_parts))
+
+        kwargs = {
+            'Key': key,
+            'UpdateExpression': ' '.join(clauses),
+            'ExpressionAttributeNames': names,
+            'ReturnValues': 'ALL_NEW'
+        }
+        if values:
+            kwargs['ExpressionAttributeValues'] = values
+        if conditions:
+            kwargs['ConditionExpression'] = self._condition_expression(conditions)
+        return self._call('update_item', **kwargs).get('Attributes', {})
+
+    def delete_item(self, key, conditions=None):
+        kwargs = {'Key': key, 'ReturnValues': 'ALL_OLD'}
+        if conditions:
+            kwargs['ConditionExpression'] = self._condition_expression(conditions)
+        return self._call('delete_item', **kwargs).get('Attributes')
+
+    def _page(self, response):
+        now = time.time()
+        items = [i for i in response.get('Items', []) if not self.is_expired(i, now)]
+        return Page(items, response.get('LastEvaluatedKey'))
+
+    def scan(self, limit=None, start_key=None, index=None, segment=None, total_segments=None,
+             filters=None):
+        kwargs = {}
+        if limit:
+            kwargs['Limit'] = limit
+        if index:
+            kwargs['IndexName'] = index
+        if total_segments:
+            kwargs['Segment'] = segment
+            kwargs['TotalSegments'] = total_segments
+        if filters:
+            kwargs['FilterExpression'] = self._condition_expression(filters)
+        start_key = self.complete_start_key(start_key, index)
+        if start_key:
+            kwargs['ExclusiveStartKey'] = start_key
+        return self._page(self._call('scan', **kwargs))
+
+    def query(self, hash_value, index=None, range_condition=None, forward=True,
+              limit=None, start_key=None, filters=None):
+        hash_attr, range_attr = (
+            self.schema.indexes[index] if index else (self.schema.hash_key, self.schema.range_key)
+        )
+        kwargs = {
+            'KeyConditionExpression': self._key_condition(
+                hash_attr, hash_value, range_attr, range_condition
+            ),
+            'ScanIndexForward': forward
+        }
+        if limit:
+            kwargs['Limit'] = limit
+        if index:
+            kwargs['IndexName'] = index
+        if filters:
+            kwargs['FilterExpression'] = self._condition_expression(filters)
+        start_key = self.complete_start_key(start_key, index)
+        if start_key:
+            kwargs['ExclusiveStartKey'] = start_key
+        return self._page(self._call('query', **kwargs))
+
+
+class MemoryTable(Table):
+    """Table held in a dict, for tests, benchmarks and local runs"""
+
+    def __init__(self, schema):
+        super().__init__(schema)
+        self._items = {}
+        self._lock = threading.RLock()
+        # index name (None for the base table) -> sorted list of order tuples
+        self._orderings = {}
+
+    def _storage_key(self, key):
+        return tuple(sort_value(key.get(a)) for a in self.schema.key_attributes())
+
+    def _order(self, item, index):
+        """Sort position: index key (if any) followed by the primary key"""
+        attrs = self.schema.key_attributes()
+        if index is not None:
+            attrs = self.schema.key_attributes(index) + attrs
+        return tuple(sort_value(item.get(a)) for a in attrs)
+
+    def _indexed(self, item, index):
+        # Sparse indexes only hold items that have the index key
+        return item is not None and all(a in item for a in self.schema.key_attributes(index))
+
+    def _ordering(self, index):
+        """Sorted once on first use, then kept sorted by _write"""
+        ordering = self._orderings.get(index)
+        if ordering is None:
+            ordering = sorted(
+                self._order(item, index) for item in self._items.values() if self._indexed(item, index)
+            )
+            self._orderings[index] = ordering
+        return ordering
+
+    def _write(self, storage_key, item):
+        previous = self._items.get(storage_key)
+        if item is None:
+            self._items.pop(storage_key, None)
+        else:
+            self._items[storage_key] = item
+        # Move the item within each ordering built so far, so a write costs
+        # O(log n) to find plus a list shift, not a re-sort on the next read
+        for index, ordering in self._orderings.items():
+            if self._indexed(previous, index):
+                order = self._order(previous, index)
+                position = bisect.bisect_left(ordering, order)
+                if position < len(ordering) and ordering[position] == order:
+                    del ordering[position]
+            if self._indexed(item, index):
+                bisect.insort(ordering, self._order(item, index))
+
+    def _current(self, storage_key):
+        item = self._items.get(storage_key)
+        return None if self.is_expired(item) else item
+
+    def get_item(self, key, consistent=False, hedge=False):
+        with self._lock:
+            item = self._current(self._storage_key(key))
+            self.record_capacity(read=read_units(item_size(item) if item else 0, consistent))
+            return copy_item(item)
+
+    def batch_get_item(self, keys, attributes=None):
+        items = []
+        with self._lock:
+            for key in self.unique_keys(keys):
+                item = self._current(self._storage_key(key))
+                # Billed per item, like a GetItem each
+                self.record_capacity(read=read_units(item_size(item) if item else 0))
+                if item is not None:
+                    items.append(self.project(copy_item(item), attributes))
+        return items
+
+    def _check(self, current, conditions, new_item=None):
+        """Charge the write (DynamoDB bills the larger of old and new) and evaluate conditions"""
+        self.record_capacity(write=write_units(max(
+            item_size(current) if current else 0, item_size(new_item) if new_item else 0
+        )))
+        if not matches(current, conditions):
+            raise ConditionFailed('The conditional request failed')
+
+    def put_item(self, item, conditions=None):
+        item = to_storable(item)
+        storage_key = self._storage_key(item)
+        with self._lock:
+            self._check(self._current(storage_key), conditions, item)
+            self._write(storage_key, item)
+
+    def update_item(self, key, set_values=None, add_values=None, remove=None, conditions=None):
+        key = to_storable(key)
+        storage_key = self._storage_key(key)
+        with self._lock:
+            current = self._current(storage_key)
+            item = apply_update(copy_item(current) or dict(key), set_values, add_values, remove)
+            self._check(current, conditions, item)
+            self._write(storage_key, item)
+            return copy_item(item)
+
+    def delete_item(self, key, conditions=None):
+        storage_key = self._storage_key(to_storable(key))
+        with self._lock:
+            current = self._current(storage_key)
+            self._check(current, conditions)
+            self._write(storage_key, None)
+            return copy_item(current)
+
+    def _page(self, ordering, position, step, limit, index, accept=None, partition=None,
+              filters=None):
+        """Walk the ordering from position, stopping at limit or the end of the partition"""
+        key_length = len(self.schema.key_attributes())
+        now = time.time()
+        items, last_key, size, evaluated = [], None, 0, 0
+        while 0 <= position < len(ordering):
+            order = ordering[position]
+            if partition is not None and order[0] != partition:
+                break
+            position += step
+            item = self._items[order[-key_length:]]
+            if self.is_expired(item, now) or (accept and not accept(item)):
+                continue
+            # Filtered items count towards limit and are billed, as in DynamoDB
+            evaluated += 1
+            size += item_size(item)
+            if matches(item, filters):
+                items.append(copy_item(item))
+            if limit and evaluated >= limit:
+                if 0 <= position < len(ordering):
+                    attrs = self.schema.key_attributes()
+                    if index is not None:
+                        attrs = attrs + self.schema.key_attributes(index)
+                    last_key = {a: item[a] for a in attrs if a in item}
+                break
+        # Scans and queries are billed on the total size read, not per item
+        self.record_capacity(read=read_units(size))
+        return Page(items, last_key)
+
+    def _start(self, ordering, start_key, index, forward):
+        start_key = self.complete_start_key(start_key, index)
+        if not start_key:
+            return None
+        order = self._order(to_storable(start_key), index)
+        if forward:
+            return bisect.bisect_right(ordering, order)
+        return bisect.bisect_left(ordering, order) - 1
+
+    def scan(self, limit=None, start_key=None, index=None, segment=None, total_segments=None,
+             filters=None):
+        accept = None
+        if total_segments:
+            hash_key = self.schema.hash_key
+
+            def accept(item):
+                return segment_of(item[hash_key], total_segments) == segment
+
+        with self._lock:
+            ordering = self._ordering(index)
+            start = self._start(ordering, start_key, index, True)
+            return self._page(ordering, start or 0, 1, limit, index, accept, filters=filters)
+
+    def query(self, hash_value, index=None, range_condition=None, forward=True,
+              limit=None, start_key=None, filters=None):
+        range_attr = self.schema.indexes[index][1] if index else self.schema.range_key
+        partition = sort_value(to_storable(hash_value))
+
+        def accept(item):
+            return in_range(item.get(range_attr), range_condition)
+
+        with self._lock:
+            ordering = self._ordering(index)
+            start = self._start(ordering, start_key, index, forward) if start_key else None
+            if start is None:
+                # Jump straight to the partition instead of walking the whole table
+                if forward:
+                    start = bisect.bisect_left(ordering, (partition,))
+                else:
+                    start = bisect.bisect_left(ordering, (partition, (3, ''))) - 1
+            return self._page(
+                ordering, start, 1 if forward else -1, limit, index, accept, partition, filters
+            )
+
+
+class SQLiteTable(Table):
+    """Table stored as JSON rows in a SQLite database file"""
+
+    def __init__(self, schema, backend):
+        super().__init__(schema)
+        self._backend = backend
+        self._name = schema.name.replace('"', '')
+        with self._backend.connection() as conn:
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{self._name}" ('
+                'pk NOT NULL, sk NOT NULL DEFAULT \'\', item TEXT NOT NULL, expires INTEGER, '
+                'PRIMARY KEY (pk, sk))'
+            )
+            for index, (hash_attr, range_attr) in schema.indexes.items():
+                columns = ', '.join(self._json_path(a) for a in (hash_attr, range_attr) if a)
+                conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{self._name}-{index}" '
+                    f'ON "{self._name}" ({columns})'
+                )
+
+    @staticmethod
+    def _json_path(attribute):
+        return f"json_extract(item, '$.\"{attribute}\"')"
+
+    @staticmethod
+    def _column_value(value):
+        if isinstance(value, Decimal):
+            return json_default(value)
+        return value
+
+    def _key_values(self, key):
+        pk = self._column_value(key[self.schema.hash_key])
+        sk = self._column_value(key[self.schema.range_key]) if self.schema.range_key else ''
+        return pk, sk
+
+    def _load(self, row):
+        return json.loads(row, parse_float=Decimal, parse_int=Decimal)
+
+    def _alive(self):
+        return '(expires IS NULL OR expires > ?)', int(time.time())
+
+    def _select_current(self, conn, key):
+        alive, now = self._alive()
+        row = conn.execute(
+            f'SELECT item FROM "{self._name}" WHERE pk = ? AND sk = ? AND {alive}',
+            self._key_values(key) + (now,)
+        ).fetchone()
+        return self._load(row[0]) if row else None
+
+    def _store(self, conn, item):
+        ttl_attr = self.schema.ttl_attribute
+        expires = int(item[ttl_attr]) if ttl_attr and item.get(ttl_attr) is not None else None
+        conn.execute(
+            f'INSERT OR REPLACE INTO "{self._name}" (pk, sk, item, expires) VALUES (?, ?, ?, ?)',
+            self._key_values(item) + (json.dumps(item, default=json_default), expires)
+        )
+
+    def get_item(self, key, consistent=False, hedge=False):
+        with self._backend.connection() as conn:
+            item = self._select_current(conn, key)
+        self.record_capacity(read=read_units(item_size(item) if item else 0, consistent))
+        return item
+
+    def batch_get_item(self, keys, attributes=None):
+        keys = self.unique_keys(keys)
+        alive, now = self._alive()
+        items = []
+        with self._backend.connection() as conn:
+            for start in range(0, len(keys), BATCH_GET_SIZE):
+                chunk = keys[start:start + BATCH_GET_SIZE]
+                params = [v for key in chunk for v in self._key_values(key)]
+                rows = conn.execute(
+                    f'SELECT item FROM "{self._name}" WHERE (pk, sk) IN '
+                    f'(VALUES {", ".join("(?, ?)" for _ in chunk)}) AND {alive}',
+                    params + [now]
+                ).fetchall()
+                items.extend(self._load(row[0]) for row in rows)
+        for item in items:
+            self.record_capacity(read=read_units(item_size(item)))
+        return [self.project(item, attributes) for item in items]
+
+    def _check(self, current, conditions, new_item=None):
+        """Charge the write (DynamoDB bills the larger of old and new) and evaluate conditions"""
+        self.record_capacity(write=write_units(max(
+            item_size(current) if current else 0, item_size(new_item) if new_item else 0
+        )))
+        if not matches(current, conditions):
+            raise ConditionFailed('The conditional request failed')
+
+    def put_item(self, item, conditions=None):
+        item = to_storable(item)
+        with self._backend.transaction() as conn:
+            self._check(self._select_current(conn, item), conditions, item)
+            self._store(conn, item)
+
+    def update_item(self, key, set_values=None, add_values=None, remove=None, conditions=None):
+        key = to_storable(key)
+        with self._backend.transaction() as conn:
+            current = self._select_current(conn, key)
+            item = apply_update(copy_item(current) or dict(key), set_values, add_values, remove)
+            self._check(current, conditions, item)
+            self._store(conn, item)
+            return item
+
+    def delete_item(self, key, conditions=None):
+        with self._backend.transaction() as conn:
+            current = self._select_current(conn, key)
+            self._check(current, conditions)
+            conn.execute(
+                f'DELETE FROM "{self._name}" WHERE pk = ? AND sk = ?', self._key_values(key)
+            )
+            return current
+
+    def _ordering_columns(self, index):
+        columns = ['pk', 'sk']
+        if index is not None:
+            hash_attr, range_attr = self.schema.indexes[index]
+            columns = [self._json_path(a) for a in (hash_attr, range_attr) if a] + columns
+        return columns
+
+    def _ordering_values(self, start_key, index):
+        values = list(self._key_values(start_key))
+        if index is not None:
+            hash_attr, range_attr = self.schema.indexes[index]
+            values = [self._column_value(start_key.get(a)) for a in (hash_attr, range_attr) if a] + values
+        return values
+
+    def _select_page(self, where, params, index, forward, limit, start_key, filters=None):
+        alive, now = self._alive()
+        columns = self._ordering_columns(index)
+        clauses = list(where) + [alive]
+        params = list(params) + [now]
+        start_key = self.complete_start_key(start_key, index)
+        if start_key:
+            clauses.append(f"({', '.join(columns)}) {'>' if forward else '<'} "
+                           f"({', '.join('?' for _ in columns)})")
+            params.extend(self._ordering_values(to_storable(start_key), index))
+        direction = 'ASC' if forward else 'DESC'
+        sql = (
+            f'SELECT item FROM "{self._name}" WHERE {" AND ".join(clauses)} '
+            f'ORDER BY {", ".join(f"{c} {direction}" for c in columns)}'
+        )
+        if limit:
+            # Fetch one extra row to learn whether another page exists
+            sql += f' LIMIT {int(limit) + 1}'
+        with self._backend.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        items = [self._load(row[0]) for row in rows]
+        self.record_capacity(read=read_units(sum(item_size(i) for i in items[:limit or None])))
+        last_key = None
+        if limit and len(items) > limit:
+            items = items[:limit]
+            attrs = self.schema.key_attributes()
+            if index is not None:
+                attrs = attrs + self.schema.key_attributes(index)
+            last_key = {a: items[-1][a] for a in attrs if a in items[-1]}
+        if filters:
+            items = [i for i in items if matches(i, filters)]
+        return Page(items, last_key)
+
+    def scan(self, limit=None, start_key=None, index=None, segment=None, total_segments=None,
+             filters=None):
+        where, params = [], []
+        if index is not None:
+            # Sparse indexes only hold items that have the index key
+            where = [f'{self._json_path(a)} IS NOT NULL' for a in self.schema.key_attributes(index)]
+        if total_segments:
+            where.append('segment_of(pk, ?) = ?')
+            params.extend([total_segments, segment])
+        return self._select_page(where, params, index, True, limit, start_key, filters)
+
+    def query(self, hash_value, index=None, range_condition=None, forward=True,
+              limit=None, start_key=None, filters=None):
+        hash_attr, range_attr = (
+            self.schema.indexes[index] if index else (self.schema.hash_key, self.schema.range_key)
+        )
+        hash_column = self._json_path(hash_attr) if index else 'pk'
+        range_column = (self._json_path(range_attr) if index else 'sk') if range_attr else None
+        where, params = [f'{hash_column} = ?'], [self._column_value(to_storable(hash_value))]
+        if range_condition:
+            op, operands = range_condition[0], [self._column_value(to_storable(v)) for v in range_condition[1:]]
+            if op == 'begins_with':
+                where.append(f'substr({range_column}, 1, ?) = ?')
+                params.extend([len(operands[0]), operands[0]])
+            elif op == 'between':
+                where.append(f'{range_column} BETWEEN ? AND ?')
+                params.extend(operands)
+            else:
+                where.append(f'{range_column} {op} ?')
+                params.append(operands[0])
+        return self._select_page(where, params, index, forward, limit, start_key, filters)
+
+
+class TracedTable:
+    """Times every call on a table as a storage span of the current request"""
+
+    OPERATIONS = ('get_item', 'batch_get_item', 'put_item', 'update_item', 'delete_item', 'scan', 'query')
+
+    def __init__(self, table):
+        self._table = table
+        self.schema = table.schema
+        self._span_names = {op: f'storage.{table.schema.label}.{op}' for op in self.OPERATIONS}
+
+    def __getattr__(self, name):
+        attr = getattr(self._table, name)
+        span_name = self._span_names.get(name)
+        if span_name is None:
+            return attr
+
+        def traced(*args, **kwargs):
+            with instrumentation.span(span_name):
+                return attr(*args, **kwargs)
+        return traced
+
+
+# ============================================
+# Backends
+# ============================================
+
+class Backend:
+    """Creates and memoizes one (traced) table object per schema"""
+
+    def __init__(self):
+        self._tables = {}
+        self._tables_lock = threading.Lock()
+
+    def table(self, schema):
+        table = self._tables.get(schema.name)
+        if table is None:
+            with self._tables_lock:
+                table = self._tables.get(schema.name)
+                if table is None:
+                    table = self._tables[schema.name] = TracedTable(self.create_table(schema))
+        return table
+
+    def create_table(self, schema):
+        raise NotImplementedError
+
+    def transact_write(self, puts):
+        raise NotImplementedError
+
+    def reset(self):
+        """Pick up clients rebuilt since the tables were created; local tables hold none"""
+
+
+class DynamoDBBackend(Backend):
+    """Tables in DynamoDB"""
+
+    def __init__(self, resource=None):
+        super().__init__()
+        self._resource = resource
+        self._shared_resource = resource is None
+
+    def reset(self):
+        """Drop the tables and the shared resource, so both are built again on next use"""
+        with self._tables_lock:
+            self._tables.clear()
+            if self._shared_resource:
+                self._resource = None
+
+    def create_table(self, schema):
+        if self._resource is None:
+            # Deferred so importing a handler never constructs boto3 objects
+            import clients
+            self._resource = clients.dynamodb()
+        return DynamoDBTable(schema, self._resource)
+
+    def transact_write(self, puts):
+        tables = [self.table(put.schema) for put in puts]
+        client = self._resource.meta.client
+        transact_items = []
+        for table, put in zip(tables, puts):
+            request = {'TableName': put.schema.name, 'Item': to_storable(put.item)}
+            if put.conditions:
+                request['ConditionExpression'] = table._condition_expression(put.conditions)
+            transact_items.append({'Put': request})
+        try:
+            response = client.transact_write_items(
+                TransactItems=transact_items, ReturnConsumedCapacity='TOTAL'
+            )
+        except client.exceptions.TransactionCanceledException as e:
+            reasons = e.response.get('CancellationReasons') or []
+            failed = [i for i, r in enumerate(reasons) if r.get('Code') == 'ConditionalCheckFailed']
+            if not failed:
+                # Conflicting transactions or throttling, not a failed condition
+                raise
+            for table in tables:
+                table.record_capacity(write=2.0)
+            raise TransactionCanceled(str(e), failed)
+        labels = {put.schema.name: table for table, put in zip(tables, puts)}
+        for consumed in response.get('ConsumedCapacity') or []:
+            table = labels.get(consumed.get('TableName'))
+            if table:
+                table.record_capacity(write=float(consumed.get('CapacityUnits', 0.0)))
+
+
+class MemoryBackend(Backend):
+    """Tables in process memory; contents are lost when the process exits"""
+
+    def create_table(self, schema):
+        return MemoryTable(schema)
+
+    def transact_write(self, puts):
+        tables = [self.table(put.schema) for put in puts]
+        items = [to_storable(put.item) for put in puts]
+        # Lock every table involved, in a fixed order so transactions cannot deadlock
+        locks = {table.schema.name: table._lock for table in tables}
+        for name in sorted(locks):
+            locks[name].acquire()
+        try:
+            failed = []
+            for i, (table, put, item) in enumerate(zip(tables, puts, items)):
+                current = table._current(table._storage_key(item))
+                # Transactional writes cost twice as much as plain ones
+                table.record_capacity(write=2 * write_units(max(
+                    item_size(current) if current else 0, item_size(item)
+                )))
+                if not matches(current, put.conditions):
+                    failed.append(i)
+            if failed:
+                raise TransactionCanceled('Transaction cancelled', failed)
+            for table, item in zip(tables, items):
+                table._write(table._storage_key(item), item)
+        finally:
+            for name in sorted(locks, reverse=True):
+                locks[name].release()
+
+
+class SQLiteBackend(Backend):
+    """Tables in a single SQLite database file, one connection per thread"""
+
+    def __init__(self, path=None):
+        super().__init__()
+        self.path = path or SQLITE_PATH
+        self._local = threading.local()
+        # SQLite allows one writer at a time; serialize read-modify-write sections
+        self._write_lock = threading.RLock()
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            import sqlite3
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.create_function('segment_of', 2, segment_of, deterministic=True)
+            self._local.conn = conn
+        return conn
+
+    def transaction(self):
+        return _Transaction(self.connection(), self._write_lock)
+
+    def create_table(self, schema):
+        return SQLiteTable(schema, self)
+
+    def transact_write(self, puts):
+        tables = [self.table(put.schema) for put in puts]
+        items = [to_storable(put.item) for put in puts]
+        with self.transaction() as conn:
+            failed = []
+            for i, (table, put, item) in enumerate(zip(tables, puts, items)):
+                current = table._select_current(conn, item)
+                table.record_capacity(write=2 * write_units(max(
+                    item_size(current) if current else 0, item_size(item)
+                )))
+                if not matches(current, put.conditions):
+                    failed.append(i)
+            if failed:
+                raise TransactionCanceled('Transaction cancelled', failed)
+            for table, item in zip(tables, items):
+                table._store(conn, item)
+
+
+class _Transaction:
+    """Context manager running a read-modify-write as one immediate transaction"""
+
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.lock.release()
+        return False
+
+
+_hedge_executor = None
+_batch_executor = None
+_hedge_lock = threading.Lock()
+# Set on the batch pool's own threads, so fan-outs nested in one run in place
+_batch_worker = threading.local()
+
+
+def _mark_batch_worker():
+    _batch_worker.active = True
+
+
+def hedge_executor():
+    """Thread pool shared by hedged reads, created on first use"""
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_lock:
+            if _hedge_executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='hedge')
+    return _hedge_executor
+
+
+def batch_executor():
+    """Thread pool for fanning out independent writes, created on first use"""
+    global _batch_executor
+    if _batch_executor is None:
+        with _hedge_lock:
+            if _batch_executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _batch_executor = ThreadPoolExecutor(
+                    max_workers=BATCH_WORKERS, thread_name_prefix='batch', initializer=_mark_batch_worker
+                )
+    return _batch_executor
+
+
+def set_worker_counts(hedge=None, batch=None):
+    """
+    Size the hedge and batch pools, e.g. to a server's worker count
+
+    Pools already created finish what they were given and are replaced on
+    next use, so the sizes apply whenever this is called.
+    """
+    global HEDGE_WORKERS, BATCH_WORKERS, _hedge_executor, _batch_executor
+    retired = []
+    with _hedge_lock:
+        if hedge:
+            HEDGE_WORKERS = hedge
+            retired.append(_hedge_executor)
+            _hedge_executor = None
+        if batch:
+            BATCH_WORKERS = batch
+            retired.append(_batch_executor)
+            _batch_executor = None
+    for executor in retired:
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+def fan_out(function, items):
+    """
+    function(item) for each of items at the same time; results in order
+
+    The first item runs on the calling thread and the rest on the batch pool.
+    On one of the pool's own threads (a fan-out inside a concurrently() call)
+    they all run in place instead: a worker waiting on work queued behind it
+    in its own pool deadlocks once every worker does the same.
+    """
+    items = list(items)
+    if len(items) < 2 or getattr(_batch_worker, 'active', False):
+        return [function(item) for item in items]
+    call = instrumentation.bind(function)
+    futures = [batch_executor().submit(call, item) for item in items[1:]]
+    first = function(items[0])
+    return [first] + [future.result() for future in futures]
+
+
+def concurrently(*calls):
+    """
+    Run independent reads at the same time and return their results in order
+
+    The request waits for the slowest read instead of the sum of them.
+    """
+    if not PARALLEL_READS:
+        return [call() for call in calls]
+    return fan_out(lambda call: call(), calls)
+
+
+BACKENDS = {
+    'dynamodb': DynamoDBBackend,
+    'memory': MemoryBackend,
+    'sqlite': SQLiteBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+# When the Stats counters began, once a container has seen it; it never moves later
+_counting_since = {}
+
+
+def transact_write(puts):
+    """
+    Apply several conditional puts, possibly to different tables, all or none
+
+    Raises TransactionCanceled, naming the failed positions, if any condition
+    does not hold. One round trip (TransactWriteItems on DynamoDB).
+    """
+    with instrumentation.span('storage.transact_write'):
+        get_backend().transact_write(puts)
+
+
+def get_backend():
+    """Return the process-wide backend, creating it from STORAGE_BACKEND on first use"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if STORAGE_BACKEND not in BACKENDS:
+                    raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+                _backend = BACKENDS[STORAGE_BACKEND]()
+    return _backend
+
+
+def set_backend(backend):
+    """Replace the process-wide backend (local runs, benchmarks)"""
+    global _backend
+    _backend = backend
+    _counting_since.clear()
+
+
+# ============================================
+# Repositories
+# ============================================
+
+class UserRepository:
+    """Users keyed by lower-cased email, with their cow names reserved in a second table"""
+
+    # What the registration queue shows; pending-index projects only these, so
+    # listing it never reads profile pictures or password hashes
+    PENDING_ATTRIBUTES = (
+        'email', 'userId', 'username', 'firstName', 'lastName', 'cowName', 'answers',
+        'status', 'clearanceLevel', 'createdAt', 'profilePictureName', 'profilePictureType'
+    )
+
+    def __init__(self, table):
+        self.table = table
+
+    @staticmethod
+    def cow_name_key(cow_name):
+        """The form a cow name is unique in: NFKC, case-folded, single spaces"""
+        return ' '.join(unicodedata.normalize('NFKC', cow_name).casefold().split())
+
+    def register(self, user_item):
+        """
+        Create a user and reserve their cow name in one transaction
+
+        Raises TransactionCanceled if the email is already registered
+        (failed contains 0) or the cow name is taken (failed contains 1).
+        """
+        user_item = dict(user_item, email=user_item['email'].lower())
+        transact_write([
+            TransactPut(self.table.schema, user_item, [attribute_not_exists('email')]),
+            TransactPut(COW_NAMES, {
+                'cowNameKey': self.cow_name_key(user_item['cowName']),
+                'cowName': user_item['cowName'],
+                'email': user_item['email'],
+                'createdAt': user_item.get('createdAt')
+            }, [attribute_not_exists('cowNameKey')])
+        ])
+
+    def get(self, email, hedge=False):
+        return self.table.get_item({'email': email.lower()}, hedge=hedge)
+
+    def get_many(self, emails, attributes=None):
+        """email -> user for those of emails that exist, read in one batch"""
+        keys = [{'email': email.lower()} for email in emails]
+        if not keys:
+            return {}
+        return {user['email']: user for user in self.table.batch_get_item(keys, attributes)}
+
+    def put(self, user_item):
+        self.table.put_item(user_item)
+
+    def record_login(self, email, timestamp):
+        self.table.update_item({'email': email.lower()}, set_values={'lastLogin': timestamp})
+
+    def list_pending(self, limit, created_at=None, email=None):
+        """
+        One page of users awaiting review, oldest signup first
+
+        Continue after the user identified by (created_at, email) from the
+        previous page; both are needed because that user may have been reviewed since.
+        """
+        start_key = None
+        if created_at and email:
+            start_key = {'email': email.lower(), 'pendingStatus': 'pending', 'createdAt': created_at}
+        page = self.table.query('pending', index='pending-index', limit=limit, start_key=start_key)
+        items = [{a: item[a] for a in self.PENDING_ATTRIBUTES if a in item} for item in page.items]
+        return Page(items, page.last_key)
+
+    def review(self, email, status, reviewed_by, reviewed_at, clearance_level=None):
+        """
+        Move a pending user to status and drop them from pending-index
+
+        Raises ConditionFailed if the user does not exist or is no longer pending.
+        """
+        set_values = {'status': status, 'reviewedBy': reviewed_by, 'reviewedAt': reviewed_at}
+        if clearance_level:
+            set_values['clearanceLevel'] = clearance_level
+        self.table.update_item(
+            {'email': email.lower()},
+            set_values=set_values,
+            remove=['pendingStatus'],
+            conditions=[attribute_exists('email'), equals('status', 'pending')]
+        )
+
+    def review_many(self, emails, status, reviewed_by, reviewed_at, clearance_level=None):
+        """
+        Review several users with concurrent conditional updates
+
+        Returns email -> 'updated', 'not_pending' or 'error'; one user failing
+        does not stop the others.
+        """
+        def review_one(email):
+            try:
+                self.review(email, status, reviewed_by, reviewed_at, clearance_level)
+                return 'updated'
+            except ConditionFailed:
+                return 'not_pending'
+            except Exception as e:
+                print(f"Error reviewing {email}: {str(e)}")
+                return 'error'
+
+        emails = list(dict.fromkeys(e.lower() for e in emails))
+        return dict(zip(emails, fan_out(review_one, emails)))
+
+
+class TokenBlacklistRepository:
+    """Revoked JWTs, expired by TTL"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def is_revoked(self, token, hedge=False):
+        return self.table.get_item({'token': token}, hedge=hedge) is not None
+
+    def revoke(self, token, blacklisted_at, ttl):
+        self.table.put_item({'token': token, 'blacklistedAt': blacklisted_at, 'ttl': ttl})
+
+
+class MessageRepository:
+    """Message board posts keyed by messageId"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def get(self, message_id):
+        return self.table.get_item({'messageId': message_id})
+
+    def get_many(self, message_ids, attributes=None):
+        """messageId -> message for those of message_ids that exist, read in one batch"""
+        keys = [{'messageId': message_id} for message_id in message_ids]
+        if not keys:
+            return {}
+        return {message['messageId']: message for message in self.table.batch_get_item(keys, attributes)}
+
+    def put(self, message_item):
+        self.table.put_item(message_item)
+
+    def delete(self, message_id, count_reply=True):
+        """
+        Delete a message; returns it, or None if it was already gone
+
+        With count_reply=False a reply's parent keeps its replyCount, for
+        retention, which may already have archived the parent.
+        """
+        removed = self.table.delete_item({'messageId': message_id})
+        if removed and removed.get('parentId') and count_reply:
+            self._count_reply(removed['parentId'], -1)
+        return removed
+
+    def delete_replies(self, parent_id, page_size=100):
+        """
+        Delete every reply in a deleted message's thread; returns the replies removed
+
+        Pages of parent-index are deleted concurrently. The parent is already
+        gone, so no replyCount is adjusted, and a reply racing in is removed
+        by add_reply itself.
+        """
+        removed, last_key = [], None
+        while True:
+            page = self.replies(parent_id, page_size, last_key)
+            deleted = fan_out(lambda reply: self.table.delete_item({'messageId': reply['messageId']}), page.items)
+            removed.extend(reply for reply in deleted if reply)
+            if not page.last_key:
+                return removed
+            last_key = page.last_key['messageId']
+
+    def all_replies(self, parent_id, page_size=100):
+        """Every reply in a thread, oldest first"""
+        replies, last_key = [], None
+        while True:
+            page = self.replies(parent_id, page_size, last_key)
+            replies.extend(page.items)
+            if not page.last_key:
+                return replies
+            last_key = page.last_key['messageId']
+
+    def _count_reply(self, parent_id, amount):
+        """Adjust a thread's replyCount; ConditionFailed if the parent is gone"""
+        self.table.update_item(
+            {'messageId': parent_id},
+            add_values={'replyCount': amount},
+            conditions=[attribute_exists('messageId')]
+        )
+
+    def add_reply(self, reply_item):
+        """Store a reply and count it on its parent; ConditionFailed if the parent is gone"""
+        self.table.put_item(reply_item)
+        try:
+            self._count_reply(reply_item['parentId'], 1)
+        except ConditionFailed:
+            # The parent was deleted in between: do not leave an orphaned reply
+            self.table.delete_item({'messageId': reply_item['messageId']})
+            raise
+
+    def board_page(self, board_id, limit, last_key=None):
+        """
+        One page of a board's top-level messages, newest first, paginated by messageId
+
+        A single Query on the board's partition of board-index, so it costs in
+        proportion to the page, not to the board or the rest of the table.
+        """
+        start_key = self._start_key(last_key, 'board-index', board_id)
+        return self.table.query(board_id, index='board-index', forward=False, limit=limit, start_key=start_key)
+
+    def replies(self, parent_id, limit, last_key=None):
+        """One page of a thread's replies, oldest first, paginated by messageId"""
+        start_key = self._start_key(last_key, 'parent-index', parent_id)
+        return self.table.query(parent_id, index='parent-index', limit=limit, start_key=start_key)
+
+    def _start_key(self, last_key, index, partition):
+        """
+        The full index key to continue after message last_key on partition
+
+        None (start over) if that message is gone; InvalidStartKey if it is
+        not on partition, so a cursor cannot read another thread or board.
+        """
+        if not last_key:
+            return None
+        item = self.get(last_key)
+        if not item:
+            return None
+        hash_attr, _ = self.table.schema.indexes[index]
+        if item.get(hash_attr) != partition:
+            raise InvalidStartKey(last_key)
+        return {a: item[a] for a in self.table.schema.key_attributes() + self.table.schema.key_attributes(index)}
+
+    def set_moo_count(self, message_id, count):
+        """Store a rolled-up reaction total; returns the updated message, or None if it is gone"""
+        try:
+            return self.table.update_item(
+                {'messageId': message_id},
+                set_values={'mooCount': count},
+                conditions=[attribute_exists('messageId')]
+            )
+        except ConditionFailed:
+            return None
+
+    def older_than(self, timestamp, page_size=500):
+        """Yield pages of messages posted before timestamp (ISO 8601), scanning the whole table"""
+        start_key = None
+        while True:
+            page = self.table.scan(limit=page_size, start_key=start_key)
+            old = [item for item in page.items if item.get('timestamp', '') < timestamp]
+            if old:
+                yield old
+            if not page.last_key:
+                return
+            start_key = page.last_key
+
+
+class BoardRepository:
+    """Board definitions; a handful of items, read whole and cached by boards.py"""
+
+    def __init__(self, table):
+        self.table = table
+
+    def all(self):
+        boards, start_key = [], None
+        while True:
+            page = self.table.scan(start_key=start_key)
+            boards.extend(page.items)
+            start_key = page.last_key
+            if not start_key:
+                return boards
+
+    def put(self, board_item):
+        self.table.put_item(board_item)
+
+
+class IdempotencyRepository:
+    """First response per client-supplied idempotency key, expired by TTL"""
+
+    IN_PROGRESS = 'IN_PROGRESS'
+    COMPLETED = 'COMPLETED'
+
+    def __init__(self, table):
+        self.table = table
+
+    def claim(self, key, fingerprint, created_at, ttl, lock_expires):
+        """
+        Reserve a key for the request about to run
+
+        Returns None when this caller now owns the key, otherwise the record
+        left by the first request with that key. The claim is a lease until
+        lock_expires (epoch seconds): a request that died holding it, before
+        storing its response, stops blocking retries once it runs out.
+        """
+        record = {
+            'idempotencyKey': key,
+            'status': self.IN_PROGRESS,
+            'fingerprint': fingerprint,
+            'createdAt': created_at,
+            'lockExpires': lock_expires,
+            'ttl': ttl
+        }
+        for _ in range(3):
+            try:
+                self.table.put_item(record, conditions=[attribute_not_exists('idempotencyKey')])
+                return None
+            except ConditionFailed:
+                existing = self.table.get_item({'idempotencyKey': key}, consistent=True)
+            now = int(time.time())
+            if existing is not None:
+                abandoned = (
+                    existing.get('status') == self.IN_PROGRESS
+                    and existing.get('fingerprint') == fingerprint
+                    and int(existing.get('lockExpires', now + 1)) <= now
+                )
+                if not abandoned:
+                    return existing
+                # Take over the lapsed lease; conditional, so only one retry wins
+                try:
+                    self.table.put_item(record, conditions=[
+                        equals('status', self.IN_PROGRESS), less_than('lockExpires', now + 1)
+                    ])
+                    return None
+                except ConditionFailed:
+                    continue
+            # The record has expired but TTL has not deleted it yet: take it over,
+            # still conditionally so only one of several retries wins
+            try:
+                self.table.put_item(record, conditions=[less_than('ttl', int(time.time()) + 1)])
+                return None
+            except ConditionFailed:
+                continue
+        # Lost every race to a request that keeps claiming and releasing the key
+        return {'idempotencyKey': key, 'status': self.IN_PROGRESS, 'fingerprint': fingerprint}
+
+    def complete(self, key, status_code, body):
+        """Store the response to replay for later requests with the key"""
+        self.table.update_item(
+            {'idempotencyKey': key},
+            set_values={'status': self.COMPLETED, 'statusCode': status_code, 'responseBody': body},
+            conditions=[equals('status', self.IN_PROGRESS)]
+        )
+
+    def release(self, key):
+        """Forget a claim whose request failed, so a retry can run it again"""
+        self.table.delete_item({'idempotencyKey': key}, conditions=[equals('status', self.IN_PROGRESS)])
+
+
+class ReactionRepository:
+    """
+    Per-user moo reactions with sharded counters
+
+    A reaction is one conditional put (so each user counts once) plus an
+    atomic ADD on one of REACTION_SHARD_COUNT counter items chosen at random,
+    so a popular message spreads its writes over that many keys. The rollup
+    job sums the shards into the message's mooCount.
+    """
+
+    WATERMARK_KEY = {'shardId': 'rollup#watermark'}
+
+    def __init__(self, reactions_table, shards_table):
+        self.reactions = reactions_table
+        self.shards = shards_table
+
+    def _bump(self, message_id, amount, updated_at):
+        shard = random.randrange(REACTION_SHARD_COUNT)
+        self.shards.update_item(
+            {'shardId': f'{message_id}#{shard}'},
+            set_values={'messageId': message_id, 'shard': shard, 'updatedAt': updated_at},
+            add_values={'count': amount}
+        )
+
+    def add(self, message_id, user_id, created_at):
+        """Record a moo; False if the user had already mooed the message"""
+        reaction_id = f'{message_id}#{user_id}'
+        try:
+            self.reactions.put_item(
+                {'reactionId': reaction_id, 'messageId': message_id, 'userId': user_id, 'createdAt': created_at},
+                conditions=[attribute_not_exists('reactionId')]
+            )
+        except ConditionFailed:
+            return False
+        try:
+            self._bump(message_id, 1, created_at)
+        except Exception:
+            # Undo the dedupe record so a retry can count the moo
+            self.reactions.delete_item({'reactionId': reaction_id})
+            raise
+        return True
+
+    def remove(self, message_id, user_id, updated_at):
+        """Take a moo back; False if the user had not mooed the message"""
+        try:
+            removed = self.reactions.delete_item(
+                {'reactionId': f'{message_id}#{user_id}'}, conditions=[attribute_exists('reactionId')]
+            )
+        except ConditionFailed:
+            return False
+        try:
+            self._bump(message_id, -1, updated_at)
+        except Exception:
+            # Put the reaction back so the moo still counts and a retry can take it
+            try:
+                self.reactions.put_item(removed, conditions=[attribute_not_exists('reactionId')])
+            except ConditionFailed:
+                # Mooed again meanwhile; that moo was counted on its own
+                pass
+            raise
+        return True
+
+    def has_reacted(self, message_id, user_id):
+        return self.reactions.get_item({'reactionId': f'{message_id}#{user_id}'}) is not None
+
+    def total(self, message_id):
+        """Sum of every counter shard of a message, read in one batch"""
+        keys = [{'shardId': f'{message_id}#{shard}'} for shard in range(REACTION_SHARD_COUNT)]
+        total = sum(int(item.get('count', 0)) for item in self.shards.batch_get_item(keys, ['count']))
+        return max(total, 0)
+
+    def changed_since(self, timestamp, page_size=500):
+        """Message IDs whose shards were updated after timestamp (ISO 8601)"""
+        message_ids = set()
+        for shard in range(REACTION_SHARD_COUNT):
+            start_key = None
+            while True:
+                page = self.shards.query(
+                    shard, index='dirty-index', range_condition=('>', timestamp),
+                    limit=page_size, start_key=start_key
+                )
+                message_ids.update(item['messageId'] for item in page.items)
+                start_key = page.last_key
+                if not start_key:
+                    break
+        return message_ids
+
+    def watermark(self):
+        item = self.shards.get_item(self.WATERMARK_KEY, consistent=True)
+        return item.get('watermark') if item else None
+
+    def set_watermark(self, timestamp):
+        self.shards.put_item(dict(self.WATERMARK_KEY, watermark=timestamp))
+
+
+class PresenceRepository:
+    """
+    Who is online, counted per time window
+
+    A heartbeat marks the user's presence item with the current window; only
+    the first heartbeat in a window succeeds, and it adds one to a random
+    counter shard of that window. Counting online users is then a read of a
+    few counters, never a scan, however many users there are.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    @staticmethod
+    def window_of(now):
+        return int(now // PRESENCE_WINDOW_SECONDS)
+
+    def heartbeat(self, user_id, now):
+        """Record that user_id is online at now (epoch seconds); True if counted in a new window"""
+        window = self.window_of(now)
+        try:
+            self.table.update_item(
+                {'presenceId': f'user#{user_id}'},
+                set_values={
+                    'userId': user_id,
+                    'window': window,
+                    'lastSeen': int(now),
+                    # Gone once heartbeats stop for two windows
+                    'ttl': int(now) + 2 * PRESENCE_WINDOW_SECONDS
+                },
+                conditions=[not_equals('window', window)]
+            )
+        except ConditionFailed:
+            # Already counted in this window
+            return False
+        shard = random.randrange(PRESENCE_SHARD_COUNT)
+        self.table.update_item(
+            {'presenceId': f'window#{window}#{shard}'},
+            set_values={'ttl': (window + 3) * PRESENCE_WINDOW_SECONDS},
+            add_values={'count': 1}
+        )
+        return True
+
+    def window_count(self, window):
+        """Users counted in one window, summed over its shards"""
+        total = 0
+        for shard in range(PRESENCE_SHARD_COUNT):
+            item = self.table.get_item({'presenceId': f'window#{window}#{shard}'})
+            if item:
+                total += int(item.get('count', 0))
+        return total
+
+    def online_count(self, now):
+        """
+        Users seen in the current or previous window
+
+        Heartbeating users are counted once per window, so the larger of the
+        two windows is used; the current one alone would undercount just after
+        a window starts.
+        """
+        window = self.window_of(now)
+        return max(self.window_count(window - 1), self.window_count(window))
+
+
+class FingerprintRepository:
+    """
+    Banded index of recent message fingerprints
+
+    Each posted message is stored once under every one of its band keys, so
+    messages sharing any band are found with one Query per band. Entries
+    expire by TTL once they are older than the detection window.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def recent(self, band, since, limit):
+        """Newest entries under band posted after since (ISO 8601)"""
+        page = self.table.query(band, range_condition=('>', since), forward=False, limit=limit)
+        return page.items
+
+    def add(self, bands, signature, message_id, user_id, posted_at, ttl):
+        """Store a message's fingerprint under each of its bands, concurrently"""
+        def put(band):
+            self.table.put_item({
+                'band': band,
+                'entry': f'{posted_at}#{message_id}',
+                'messageId': message_id,
+                'userId': user_id,
+                'signature': signature,
+                'ttl': ttl
+            })
+
+        fan_out(put, bands)
+
+
+class StatsRepository:
+    """
+    Board statistics kept as atomic counters, so reading them never scans
+
+    Board-wide totals and per-day rollups are each spread over
+    STATS_SHARD_COUNT items, one chosen at random per change, and summed on
+    read; a user's post count is a single item, since one cow cannot post fast
+    enough to make it hot. All of them are read with one BatchGetItem.
+
+    Messages posted before counting began were never counted, so deleting
+    them uncounts nothing; the start is kept in the since item.
+    """
+
+    SINCE_ID = 'since'
+
+    def __init__(self, table):
+        self.table = table
+
+    def counting_since(self):
+        """When the first counted message was posted (ISO 8601), or None before then"""
+        if 'since' not in _counting_since:
+            item = self.table.get_item({'statId': self.SINCE_ID})
+            if item:
+                _counting_since['since'] = item['since']
+        return _counting_since.get('since')
+
+    def _start_counting(self, timestamp):
+        """Make sure counting is recorded as starting no later than timestamp"""
+        since = self.counting_since()
+        while since is None or timestamp < since:
+            conditions = [equals('since', since)] if since else [attribute_not_exists('statId')]
+            try:
+                self.table.put_item({'statId': self.SINCE_ID, 'since': timestamp}, conditions=conditions)
+                since = timestamp
+            except ConditionFailed:
+                since = (self.table.get_item({'statId': self.SINCE_ID}) or {}).get('since')
+        _counting_since['since'] = since
+
+    def _counted(self, messages):
+        """The messages posted since counting began"""
+        since = self.counting_since()
+        return [message for message in messages if since is not None and message['timestamp'] >= since]
+
+    @staticmethod
+    def day_of(timestamp):
+        """The UTC day (YYYY-MM-DD) of an ISO 8601 timestamp"""
+        return timestamp[:10]
+
+    @staticmethod
+    def day_ttl(day):
+        expires = datetime.strptime(day, '%Y-%m-%d') + timedelta(days=STATS_HISTORY_DAYS + 1)
+        return int((expires - datetime(1970, 1, 1)).total_seconds())
+
+    def _add(self, changes):
+        """Apply {statId: (add_values, set_values)} concurrently"""
+        def update(stat_id):
+            add_values, set_values = changes[stat_id]
+            self.table.update_item({'statId': stat_id}, set_values=set_values or None, add_values=add_values)
+
+        fan_out(update, changes)
+
+    def _board_changes(self, day, add_values, day_values):
+        """Changes to one random shard of the totals and of day's rollup"""
+        shard = random.randrange(STATS_SHARD_COUNT)
+        return {
+            f'total#{shard}': (add_values, None),
+            f'day#{day}#{shard}': (day_values, {'ttl': self.day_ttl(day)})
+        }
+
+    def record_post(self, user_id, timestamp, reply=False):
+        """Count a message posted by user_id at timestamp (ISO 8601)"""
+        self._start_counting(timestamp)
+        totals = {'messages': 1, 'replies': 1} if reply else {'messages': 1}
+        changes = self._board_changes(self.day_of(timestamp), totals, {'posts': 1})
+        changes[f'user#{user_id}'] = ({'posts': 1}, {'userId': user_id, 'lastPostAt': timestamp})
+        self._add(changes)
+
+    def record_delete(self, user_id, timestamp, reply=False):
+        """Uncount a deleted message that user_id posted at timestamp, if it was counted"""
+        since = self.counting_since()
+        if since is None or timestamp < since:
+            return
+        totals = {'messages': -1, 'replies': -1} if reply else {'messages': -1}
+        changes = self._board_changes(self.day_of(timestamp), totals, {'posts': -1})
+        changes[f'user#{user_id}'] = ({'posts': -1}, {'userId': user_id})
+        self._add(changes)
+
+    def record_deletes(self, messages):
+        """
+        Uncount many deleted messages (e.g. a thread's replies) at once
+
+        Counts are summed first, so each total, day and user is one update
+        however many messages go.
+        """
+        messages = self._counted(messages)
+        if not messages:
+            return
+        shard = random.randrange(STATS_SHARD_COUNT)
+        replies = sum(1 for message in messages if message.get('parentId'))
+        changes = {f'total#{shard}': ({'messages': -len(messages), 'replies': -replies}, None)}
+        for message in messages:
+            day = self.day_of(message['timestamp'])
+            day_values, _ = changes.setdefault(f'day#{day}#{shard}', ({'posts': 0}, {'ttl': self.day_ttl(day)}))
+            day_values['posts'] -= 1
+            user_id = message['userId']
+            user_values, _ = changes.setdefault(f'user#{user_id}', ({'posts': 0}, {'userId': user_id}))
+            user_values['posts'] -= 1
+        self._add(changes)
+
+    def add_to_totals(self, add_values):
+        """Adjust the board totals outside any day's rollup, e.g. from a backfill"""
+        shard = random.randrange(STATS_SHARD_COUNT)
+        self._add({f'total#{shard}': (add_values, None)})
+
+    def record_approvals(self, count, timestamp):
+        """Count cows whose signup was approved at timestamp"""
+        if count:
+            self._add(self._board_changes(self.day_of(timestamp), {'cows': count}, {'newCows': count}))
+
+    def read(self, days=(), user_ids=(), totals=True):
+        """
+        Totals, rollups for each of days (YYYY-MM-DD) and post counts of user_ids
+
+        Returns (totals or None, {day: rollup}, {userId: posts}); counters that
+        were never written read as zero, and none reads below it.
+        """
+        shards = range(STATS_SHARD_COUNT)
+        keys = [{'statId': f'total#{shard}'} for shard in shards] if totals else []
+        keys += [{'statId': f'day#{day}#{shard}'} for day in days for shard in shards]
+        keys += [{'statId': f'user#{user_id}'} for user_id in user_ids]
+        if not keys:
+            return None, {}, {}
+        items = {item['statId']: item for item in self.table.batch_get_item(keys)}
+
+        def summed(prefix, names):
+            values = dict.fromkeys(names, 0)
+            for shard in shards:
+                item = items.get(f'{prefix}#{shard}') or {}
+                for name in names:
+                    values[name] += int(item.get(name, 0))
+            return {name: max(0, value) for name, value in values.items()}
+
+        totals = summed('total', ('messages', 'replies', 'cows')) if totals else None
+        rollups = {day: summed(f'day#{day}', ('posts', 'newCows')) for day in days}
+        posts = {
+            user_id: max(0, int((items.get(f'user#{user_id}') or {}).get('posts', 0))) for user_id in user_ids
+        }
+        return totals, rollups, posts
+
+
+class ChangeRepository:
+    """
+    Append-only log of each board's posts, edits and deletes, expired by TTL
+
+    A board's entries share one partition, sorted by seq. Sequence numbers
+    come from an atomic counter at seq 0 of the same partition, so they are
+    unique and increasing. Entries are written after the change they record,
+    so every seq below the counter belongs to a change already made; an entry
+    can still land shortly after a higher one, which readers allow for.
+    """
+
+    COUNTER_SEQ = 0
+
+    def __init__(self, table):
+        self.table = table
+
+    def head(self, board_id):
+        """(last seq handed out on board_id, when it was handed out); (0, None) before the first change"""
+        counter = self.table.get_item({'boardId': board_id, 'seq': self.COUNTER_SEQ}) or {}
+        return int(counter.get('latest', 0)), counter.get('changedAt')
+
+    def latest(self, board_id):
+        """The last seq handed out on board_id (0 before the first change)"""
+        return self.head(board_id)[0]
+
+    def append(self, board_id, entries, changed_at=None):
+        """
+        Log entries (dicts with type and messageId) on board_id, in order
+
+        One counter update reserves a seq for every entry, then the entries
+        are written concurrently. Returns the seqs used.
+        """
+        if not entries:
+            return []
+        changed_at = changed_at or datetime.utcnow().isoformat()
+        counter = self.table.update_item(
+            {'boardId': board_id, 'seq': self.COUNTER_SEQ},
+            set_values={'changedAt': changed_at},
+            add_values={'latest': len(entries)}
+        )
+        first = int(counter['latest']) - len(entries) + 1
+        ttl = int(time.time()) + CHANGE_RETENTION_SECONDS
+
+        def put(offset):
+            self.table.put_item(dict(
+                entries[offset], boardId=board_id, seq=first + offset, changedAt=changed_at, ttl=ttl
+            ))
+
+        fan_out(put, range(len(entries)))
+        return list(range(first, first + len(entries)))
+
+    def after(self, board_id, seq, limit):
+        """One page of entries logged on board_id after seq, oldest first"""
+        return self.table.query(board_id, range_condition=('>', max(int(seq), self.COUNTER_SEQ)), limit=limit)
+
+
+def users():
+    return UserRepository(get_backend().table(USERS))
+
+
+def blacklist():
+    return TokenBlacklistRepository(get_backend().table(BLACKLIST))
+
+
+def messages():
+    return MessageRepository(get_backend().table(MESSAGES))
+
+
+def boards():
+    return BoardRepository(get_backend().table(BOARDS))
+
+
+def idempotency():
+    return IdempotencyRepository(get_backend().table(IDEMPOTENCY))
+
+
+def reactions():
+    backend = get_backend()
+    return ReactionRepository(backend.table(REACTIONS), backend.table(REACTION_SHARDS))
+
+
+def presence():
+    return PresenceRepository(get_backend().table(PRESENCE))
+
+
+def fingerprints():
+    return FingerprintRepository(get_backend().table(FINGERPRINTS))
+
+
+def stats():
+    return StatsRepository(get_backend().table(STATS))
+
+
+def changes():
+    return ChangeRepository(get_backend().table(CHANGES))
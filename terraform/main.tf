@@ -31,6 +31,29 @@ resource "aws_dynamodb_table" "users" {
     type = "S"
   }
 
+  attribute {
+    name = "pendingStatus"
+    type = "S"
+  }
+
+  attribute {
+    name = "createdAt"
+    type = "S"
+  }
+
+  # Sparse: only users awaiting review carry pendingStatus. Profile pictures and
+  # password hashes are left out so reading the queue stays cheap.
+  global_secondary_index {
+    name               = "pending-index"
+    hash_key           = "pendingStatus"
+    range_key          = "createdAt"
+    projection_type    = "INCLUDE"
+    non_key_attributes = [
+      "userId", "username", "firstName", "lastName", "cowName", "answers",
+      "status", "clearanceLevel", "profilePictureName", "profilePictureType"
+    ]
+  }
+
   tags = {
     Name        = "${var.project_name}-Users"
     Project     = var.project_name
@@ -75,9 +98,30 @@ resource "aws_dynamodb_table" "messages" {
     type = "S"
   }
 
+  attribute {
+    name = "parentId"
+    type = "S"
+  }
+
+  attribute {
+    name = "boardId"
+    type = "S"
+  }
+
+  # Sparse: only top-level messages carry boardId, so a board's feed is one
+  # Query on its own partition, newest first
+  global_secondary_index {
+    name            = "board-index"
+    hash_key        = "boardId"
+    range_key       = "timestamp"
+    projection_type = "ALL"
+  }
+
+  # Sparse: only replies carry parentId, so a thread is one Query
   global_secondary_index {
-    name            = "timestamp-index"
-    hash_key        = "timestamp"
+    name            = "parent-index"
+    hash_key        = "parentId"
+    range_key       = "timestamp"
     projection_type = "ALL"
   }
 
@@ -88,6 +132,292 @@ resource "aws_dynamodb_table" "messages" {
   }
 }
 
+# First response per Idempotency-Key on POST /messages, expired by TTL
+resource "aws_dynamodb_table" "idempotency" {
+  name           = "${var.project_name}-Idempotency"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "idempotencyKey"
+
+  attribute {
+    name = "idempotencyKey"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "ttl"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-Idempotency"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+# One item per user per mooed message, for deduplication
+resource "aws_dynamodb_table" "reactions" {
+  name           = "${var.project_name}-Reactions"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "reactionId"
+
+  attribute {
+    name = "reactionId"
+    type = "S"
+  }
+
+  tags = {
+    Name        = "${var.project_name}-Reactions"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+# Moo counters split over shards (<messageId>#<n>) so one popular message
+# spreads its writes over many keys
+resource "aws_dynamodb_table" "reaction_shards" {
+  name           = "${var.project_name}-ReactionShards"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "shardId"
+
+  attribute {
+    name = "shardId"
+    type = "S"
+  }
+
+  attribute {
+    name = "shard"
+    type = "N"
+  }
+
+  attribute {
+    name = "updatedAt"
+    type = "S"
+  }
+
+  # Shards changed since the last rollup, partitioned by shard number
+  global_secondary_index {
+    name               = "dirty-index"
+    hash_key           = "shard"
+    range_key          = "updatedAt"
+    projection_type    = "INCLUDE"
+    non_key_attributes = ["messageId"]
+  }
+
+  tags = {
+    Name        = "${var.project_name}-ReactionShards"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+# Presence items and per-window online counters, both expired by TTL
+resource "aws_dynamodb_table" "presence" {
+  name           = "${var.project_name}-Presence"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "presenceId"
+
+  attribute {
+    name = "presenceId"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "ttl"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-Presence"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+# Recent message fingerprints for near-duplicate detection, one item per
+# LSH band; expired by TTL once they leave the detection window
+resource "aws_dynamodb_table" "fingerprints" {
+  name           = "${var.project_name}-Fingerprints"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "band"
+  range_key      = "entry"
+
+  attribute {
+    name = "band"
+    type = "S"
+  }
+
+  attribute {
+    name = "entry"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "ttl"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-Fingerprints"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+# Reserved cow names, keyed by their case-folded form; written in the same
+# transaction as the user so no two cows share a name
+resource "aws_dynamodb_table" "cow_names" {
+  name           = "${var.project_name}-CowNames"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "cowNameKey"
+
+  attribute {
+    name = "cowNameKey"
+    type = "S"
+  }
+
+  tags = {
+    Name        = "${var.project_name}-CowNames"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+# Message boards and the clearance needed to read and post on each; items
+# come from var.boards
+resource "aws_dynamodb_table" "boards" {
+  name           = "${var.project_name}-Boards"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "boardId"
+
+  attribute {
+    name = "boardId"
+    type = "S"
+  }
+
+  tags = {
+    Name        = "${var.project_name}-Boards"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+resource "aws_dynamodb_table_item" "board" {
+  for_each   = var.boards
+  table_name = aws_dynamodb_table.boards.name
+  hash_key   = aws_dynamodb_table.boards.hash_key
+
+  item = jsonencode({
+    boardId            = { S = each.key }
+    name               = { S = each.value.name }
+    description        = { S = each.value.description }
+    clearanceLevel     = { S = each.value.clearance_level }
+    postClearanceLevel = { S = coalesce(each.value.post_clearance_level, each.value.clearance_level) }
+  })
+}
+
+# Board statistics counters: sharded totals, sharded daily rollups (expired
+# by TTL) and per-user post counts
+resource "aws_dynamodb_table" "stats" {
+  name           = "${var.project_name}-Stats"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "statId"
+
+  attribute {
+    name = "statId"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "ttl"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-Stats"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+# Per-board change log for delta sync: posts, edits and delete tombstones
+# at seq 1, 2, ... (expired by TTL) and the board's counter at seq 0
+resource "aws_dynamodb_table" "changes" {
+  name           = "${var.project_name}-Changes"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "boardId"
+  range_key      = "seq"
+
+  attribute {
+    name = "boardId"
+    type = "S"
+  }
+
+  attribute {
+    name = "seq"
+    type = "N"
+  }
+
+  ttl {
+    attribute_name = "ttl"
+    enabled        = true
+  }
+
+  tags = {
+    Name        = "${var.project_name}-Changes"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+# ============================================
+# S3 Bucket for the Message Archive
+# ============================================
+
+# Messages older than retention_days, as gzipped NDJSON segments per day
+resource "aws_s3_bucket" "archive" {
+  bucket = "${lower(var.project_name)}-archive-${var.environment}"
+
+  tags = {
+    Name        = "${var.project_name}-archive"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+resource "aws_s3_bucket_public_access_block" "archive" {
+  bucket = aws_s3_bucket.archive.id
+
+  block_public_acls       = true
+  block_public_policy     = true
+  ignore_public_acls      = true
+  restrict_public_buckets = true
+}
+
+# Old segments are rarely paged into; move them to cheaper storage classes
+resource "aws_s3_bucket_lifecycle_configuration" "archive" {
+  bucket = aws_s3_bucket.archive.id
+
+  rule {
+    id     = "tier-old-segments"
+    status = "Enabled"
+
+    filter {
+      prefix = "messages/"
+    }
+
+    transition {
+      days          = 30
+      storage_class = "STANDARD_IA"
+    }
+
+    transition {
+      days          = 180
+      storage_class = "GLACIER_IR"
+    }
+  }
+}
+
 # ============================================
 # IAM Role for Lambda Functions
 # ============================================
@@ -135,7 +465,9 @@ resource "aws_iam_role_policy" "lambda_policy" {
         Effect = "Allow"
         Action = [
           "dynamodb:GetItem",
+          "dynamodb:BatchGetItem",
           "dynamodb:PutItem",
+          "dynamodb:ConditionCheckItem",
           "dynamodb:UpdateItem",
           "dynamodb:DeleteItem",
           "dynamodb:Query",
@@ -143,9 +475,32 @@ resource "aws_iam_role_policy" "lambda_policy" {
         ]
         Resource = [
           aws_dynamodb_table.users.arn,
+          "${aws_dynamodb_table.users.arn}/index/*",
           aws_dynamodb_table.token_blacklist.arn,
           aws_dynamodb_table.messages.arn,
-          "${aws_dynamodb_table.messages.arn}/index/*"
+          "${aws_dynamodb_table.messages.arn}/index/*",
+          aws_dynamodb_table.idempotency.arn,
+          aws_dynamodb_table.reactions.arn,
+          aws_dynamodb_table.reaction_shards.arn,
+          "${aws_dynamodb_table.reaction_shards.arn}/index/*",
+          aws_dynamodb_table.presence.arn,
+          aws_dynamodb_table.fingerprints.arn,
+          aws_dynamodb_table.cow_names.arn,
+          aws_dynamodb_table.stats.arn,
+          aws_dynamodb_table.boards.arn,
+          aws_dynamodb_table.changes.arn
+        ]
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject",
+          "s3:ListBucket"
+        ]
+        Resource = [
+          aws_s3_bucket.archive.arn,
+          "${aws_s3_bucket.archive.arn}/*"
         ]
       },
       {
@@ -183,21 +538,23 @@ resource "aws_lambda_layer_version" "dependencies" {
 # Lambda Functions
 # ============================================
 
-# Sign In Lambda
-data "archive_file" "signin_lambda" {
+# All handlers share one package so they can import the storage layer
+data "archive_file" "lambda_code" {
   type        = "zip"
-  source_file = "${path.module}/../lambda/signin.py"
-  output_path = "${path.module}/signin.zip"
+  source_dir  = "${path.module}/../lambda"
+  output_path = "${path.module}/lambda-code.zip"
+  excludes    = ["README.md", "requirements.txt", "__pycache__"]
 }
 
+# Sign In Lambda
 resource "aws_lambda_function" "signin" {
-  filename         = data.archive_file.signin_lambda.output_path
+  filename         = data.archive_file.lambda_code.output_path
   function_name    = "${var.project_name}-signin"
   role            = aws_iam_role.lambda_role.arn
   handler         = "signin.lambda_handler"
   runtime         = "python3.11"
   timeout         = 30
-  source_code_hash = data.archive_file.signin_lambda.output_base64sha256
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
 
   layers = [aws_lambda_layer_version.dependencies.arn]
 
@@ -216,28 +573,23 @@ resource "aws_lambda_function" "signin" {
 }
 
 # Sign Up Lambda
-data "archive_file" "signup_lambda" {
-  type        = "zip"
-  source_file = "${path.module}/../lambda/signup.py"
-  output_path = "${path.module}/signup.zip"
-}
-
 resource "aws_lambda_function" "signup" {
-  filename         = data.archive_file.signup_lambda.output_path
+  filename         = data.archive_file.lambda_code.output_path
   function_name    = "${var.project_name}-signup"
   role            = aws_iam_role.lambda_role.arn
   handler         = "signup.lambda_handler"
   runtime         = "python3.11"
   timeout         = 30
-  source_code_hash = data.archive_file.signup_lambda.output_base64sha256
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
 
   layers = [aws_lambda_layer_version.dependencies.arn]
 
   environment {
     variables = {
-      USERS_TABLE = aws_dynamodb_table.users.name
-      ADMIN_EMAIL = var.admin_email
-      SES_SENDER  = var.ses_sender
+      USERS_TABLE     = aws_dynamodb_table.users.name
+      COW_NAMES_TABLE = aws_dynamodb_table.cow_names.name
+      ADMIN_EMAIL     = var.admin_email
+      SES_SENDER      = var.ses_sender
     }
   }
 
@@ -249,20 +601,14 @@ resource "aws_lambda_function" "signup" {
 }
 
 # Sign Out Lambda
-data "archive_file" "signout_lambda" {
-  type        = "zip"
-  source_file = "${path.module}/../lambda/signout.py"
-  output_path = "${path.module}/signout.zip"
-}
-
 resource "aws_lambda_function" "signout" {
-  filename         = data.archive_file.signout_lambda.output_path
+  filename         = data.archive_file.lambda_code.output_path
   function_name    = "${var.project_name}-signout"
   role            = aws_iam_role.lambda_role.arn
   handler         = "signout.lambda_handler"
   runtime         = "python3.11"
   timeout         = 30
-  source_code_hash = data.archive_file.signout_lambda.output_base64sha256
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
 
   layers = [aws_lambda_layer_version.dependencies.arn]
 
@@ -281,20 +627,14 @@ resource "aws_lambda_function" "signout" {
 }
 
 # Get Current User Lambda
-data "archive_file" "get_current_user_lambda" {
-  type        = "zip"
-  source_file = "${path.module}/../lambda/get_current_user.py"
-  output_path = "${path.module}/get_current_user.zip"
-}
-
 resource "aws_lambda_function" "get_current_user" {
-  filename         = data.archive_file.get_current_user_lambda.output_path
+  filename         = data.archive_file.lambda_code.output_path
   function_name    = "${var.project_name}-get-current-user"
   role            = aws_iam_role.lambda_role.arn
   handler         = "get_current_user.lambda_handler"
   runtime         = "python3.11"
   timeout         = 30
-  source_code_hash = data.archive_file.get_current_user_lambda.output_base64sha256
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
 
   layers = [aws_lambda_layer_version.dependencies.arn]
 
@@ -314,27 +654,25 @@ resource "aws_lambda_function" "get_current_user" {
 }
 
 # Get Messages Lambda
-data "archive_file" "get_messages_lambda" {
-  type        = "zip"
-  source_file = "${path.module}/../lambda/get_messages.py"
-  output_path = "${path.module}/get_messages.zip"
-}
-
 resource "aws_lambda_function" "get_messages" {
-  filename         = data.archive_file.get_messages_lambda.output_path
+  filename         = data.archive_file.lambda_code.output_path
   function_name    = "${var.project_name}-get-messages"
   role            = aws_iam_role.lambda_role.arn
   handler         = "get_messages.lambda_handler"
   runtime         = "python3.11"
   timeout         = 30
-  source_code_hash = data.archive_file.get_messages_lambda.output_base64sha256
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
 
   layers = [aws_lambda_layer_version.dependencies.arn]
 
   environment {
     variables = {
+      USERS_TABLE     = aws_dynamodb_table.users.name
       MESSAGES_TABLE  = aws_dynamodb_table.messages.name
       BLACKLIST_TABLE = aws_dynamodb_table.token_blacklist.name
+      ARCHIVE_BUCKET  = aws_s3_bucket.archive.id
+      BOARDS_TABLE    = aws_dynamodb_table.boards.name
+      CHANGES_TABLE   = aws_dynamodb_table.changes.name
       JWT_SECRET      = var.jwt_secret
     }
   }
@@ -347,29 +685,28 @@ resource "aws_lambda_function" "get_messages" {
 }
 
 # Post Message Lambda
-data "archive_file" "post_message_lambda" {
-  type        = "zip"
-  source_file = "${path.module}/../lambda/post_message.py"
-  output_path = "${path.module}/post_message.zip"
-}
-
 resource "aws_lambda_function" "post_message" {
-  filename         = data.archive_file.post_message_lambda.output_path
+  filename         = data.archive_file.lambda_code.output_path
   function_name    = "${var.project_name}-post-message"
   role            = aws_iam_role.lambda_role.arn
   handler         = "post_message.lambda_handler"
   runtime         = "python3.11"
   timeout         = 30
-  source_code_hash = data.archive_file.post_message_lambda.output_base64sha256
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
 
   layers = [aws_lambda_layer_version.dependencies.arn]
 
   environment {
     variables = {
-      MESSAGES_TABLE  = aws_dynamodb_table.messages.name
-      USERS_TABLE     = aws_dynamodb_table.users.name
-      BLACKLIST_TABLE = aws_dynamodb_table.token_blacklist.name
-      JWT_SECRET      = var.jwt_secret
+      MESSAGES_TABLE     = aws_dynamodb_table.messages.name
+      USERS_TABLE        = aws_dynamodb_table.users.name
+      BLACKLIST_TABLE    = aws_dynamodb_table.token_blacklist.name
+      IDEMPOTENCY_TABLE  = aws_dynamodb_table.idempotency.name
+      FINGERPRINTS_TABLE = aws_dynamodb_table.fingerprints.name
+      STATS_TABLE        = aws_dynamodb_table.stats.name
+      BOARDS_TABLE       = aws_dynamodb_table.boards.name
+      CHANGES_TABLE      = aws_dynamodb_table.changes.name
+      JWT_SECRET         = var.jwt_secret
     }
   }
 
@@ -381,20 +718,14 @@ resource "aws_lambda_function" "post_message" {
 }
 
 # Delete Message Lambda
-data "archive_file" "delete_message_lambda" {
-  type        = "zip"
-  source_file = "${path.module}/../lambda/delete_message.py"
-  output_path = "${path.module}/delete_message.zip"
-}
-
 resource "aws_lambda_function" "delete_message" {
-  filename         = data.archive_file.delete_message_lambda.output_path
+  filename         = data.archive_file.lambda_code.output_path
   function_name    = "${var.project_name}-delete-message"
   role            = aws_iam_role.lambda_role.arn
   handler         = "delete_message.lambda_handler"
   runtime         = "python3.11"
   timeout         = 30
-  source_code_hash = data.archive_file.delete_message_lambda.output_base64sha256
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
 
   layers = [aws_lambda_layer_version.dependencies.arn]
 
@@ -403,6 +734,8 @@ resource "aws_lambda_function" "delete_message" {
       MESSAGES_TABLE  = aws_dynamodb_table.messages.name
       USERS_TABLE     = aws_dynamodb_table.users.name
       BLACKLIST_TABLE = aws_dynamodb_table.token_blacklist.name
+      STATS_TABLE     = aws_dynamodb_table.stats.name
+      CHANGES_TABLE   = aws_dynamodb_table.changes.name
       JWT_SECRET      = var.jwt_secret
     }
   }
@@ -414,22 +747,369 @@ resource "aws_lambda_function" "delete_message" {
   }
 }
 
+# Get Replies Lambda
+resource "aws_lambda_function" "get_replies" {
+  filename         = data.archive_file.lambda_code.output_path
+  function_name    = "${var.project_name}-get-replies"
+  role            = aws_iam_role.lambda_role.arn
+  handler         = "get_replies.lambda_handler"
+  runtime         = "python3.11"
+  timeout         = 30
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
+
+  layers = [aws_lambda_layer_version.dependencies.arn]
+
+  environment {
+    variables = {
+      USERS_TABLE     = aws_dynamodb_table.users.name
+      MESSAGES_TABLE  = aws_dynamodb_table.messages.name
+      BLACKLIST_TABLE = aws_dynamodb_table.token_blacklist.name
+      BOARDS_TABLE    = aws_dynamodb_table.boards.name
+      ARCHIVE_BUCKET  = aws_s3_bucket.archive.id
+      JWT_SECRET      = var.jwt_secret
+    }
+  }
+
+  tags = {
+    Name        = "${var.project_name}-get-replies"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+# Moo Reactions Lambda
+resource "aws_lambda_function" "moo_message" {
+  filename         = data.archive_file.lambda_code.output_path
+  function_name    = "${var.project_name}-moo-message"
+  role            = aws_iam_role.lambda_role.arn
+  handler         = "moo_message.lambda_handler"
+  runtime         = "python3.11"
+  timeout         = 30
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
+
+  layers = [aws_lambda_layer_version.dependencies.arn]
+
+  environment {
+    variables = {
+      MESSAGES_TABLE        = aws_dynamodb_table.messages.name
+      USERS_TABLE           = aws_dynamodb_table.users.name
+      BLACKLIST_TABLE       = aws_dynamodb_table.token_blacklist.name
+      REACTIONS_TABLE       = aws_dynamodb_table.reactions.name
+      REACTION_SHARDS_TABLE = aws_dynamodb_table.reaction_shards.name
+      REACTION_SHARD_COUNT  = var.reaction_shard_count
+      BOARDS_TABLE          = aws_dynamodb_table.boards.name
+      JWT_SECRET            = var.jwt_secret
+    }
+  }
+
+  tags = {
+    Name        = "${var.project_name}-moo-message"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+# Presence Lambda
+resource "aws_lambda_function" "presence" {
+  filename         = data.archive_file.lambda_code.output_path
+  function_name    = "${var.project_name}-presence"
+  role            = aws_iam_role.lambda_role.arn
+  handler         = "presence.lambda_handler"
+  runtime         = "python3.11"
+  timeout         = 30
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
+
+  layers = [aws_lambda_layer_version.dependencies.arn]
+
+  environment {
+    variables = {
+      PRESENCE_TABLE  = aws_dynamodb_table.presence.name
+      BLACKLIST_TABLE = aws_dynamodb_table.token_blacklist.name
+      JWT_SECRET      = var.jwt_secret
+    }
+  }
+
+  tags = {
+    Name        = "${var.project_name}-presence"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+# Board Statistics Lambda
+resource "aws_lambda_function" "get_stats" {
+  filename         = data.archive_file.lambda_code.output_path
+  function_name    = "${var.project_name}-get-stats"
+  role            = aws_iam_role.lambda_role.arn
+  handler         = "get_stats.lambda_handler"
+  runtime         = "python3.11"
+  timeout         = 30
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
+
+  layers = [aws_lambda_layer_version.dependencies.arn]
+
+  environment {
+    variables = {
+      STATS_TABLE     = aws_dynamodb_table.stats.name
+      BLACKLIST_TABLE = aws_dynamodb_table.token_blacklist.name
+      JWT_SECRET      = var.jwt_secret
+    }
+  }
+
+  tags = {
+    Name        = "${var.project_name}-get-stats"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+# List Boards Lambda
+resource "aws_lambda_function" "get_boards" {
+  filename         = data.archive_file.lambda_code.output_path
+  function_name    = "${var.project_name}-get-boards"
+  role            = aws_iam_role.lambda_role.arn
+  handler         = "get_boards.lambda_handler"
+  runtime         = "python3.11"
+  timeout         = 30
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
+
+  layers = [aws_lambda_layer_version.dependencies.arn]
+
+  environment {
+    variables = {
+      BOARDS_TABLE    = aws_dynamodb_table.boards.name
+      BLACKLIST_TABLE = aws_dynamodb_table.token_blacklist.name
+      JWT_SECRET      = var.jwt_secret
+    }
+  }
+
+  tags = {
+    Name        = "${var.project_name}-get-boards"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+# Delta Sync Lambda
+resource "aws_lambda_function" "get_changes" {
+  filename         = data.archive_file.lambda_code.output_path
+  function_name    = "${var.project_name}-get-changes"
+  role            = aws_iam_role.lambda_role.arn
+  handler         = "get_changes.lambda_handler"
+  runtime         = "python3.11"
+  timeout         = 30
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
+
+  layers = [aws_lambda_layer_version.dependencies.arn]
+
+  environment {
+    variables = {
+      CHANGES_TABLE   = aws_dynamodb_table.changes.name
+      USERS_TABLE     = aws_dynamodb_table.users.name
+      BOARDS_TABLE    = aws_dynamodb_table.boards.name
+      BLACKLIST_TABLE = aws_dynamodb_table.token_blacklist.name
+      JWT_SECRET      = var.jwt_secret
+    }
+  }
+
+  tags = {
+    Name        = "${var.project_name}-get-changes"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+# Admin Registrations Lambda
+resource "aws_lambda_function" "admin_registrations" {
+  filename         = data.archive_file.lambda_code.output_path
+  function_name    = "${var.project_name}-admin-registrations"
+  role            = aws_iam_role.lambda_role.arn
+  handler         = "admin_registrations.lambda_handler"
+  runtime         = "python3.11"
+  timeout         = 30
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
+
+  layers = [aws_lambda_layer_version.dependencies.arn]
+
+  environment {
+    variables = {
+      USERS_TABLE     = aws_dynamodb_table.users.name
+      BLACKLIST_TABLE = aws_dynamodb_table.token_blacklist.name
+      STATS_TABLE     = aws_dynamodb_table.stats.name
+      JWT_SECRET      = var.jwt_secret
+    }
+  }
+
+  tags = {
+    Name        = "${var.project_name}-admin-registrations"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+# Router Lambda (optional): one function serving every route, so low-traffic
+# routes reuse the warm containers kept busy by GET /messages
+resource "aws_lambda_function" "router" {
+  count = var.use_single_router ? 1 : 0
+
+  filename         = data.archive_file.lambda_code.output_path
+  function_name    = "${var.project_name}-router"
+  role            = aws_iam_role.lambda_role.arn
+  handler         = "router.lambda_handler"
+  runtime         = "python3.11"
+  timeout         = 30
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
+
+  layers = [aws_lambda_layer_version.dependencies.arn]
+
+  environment {
+    variables = {
+      USERS_TABLE           = aws_dynamodb_table.users.name
+      MESSAGES_TABLE        = aws_dynamodb_table.messages.name
+      BLACKLIST_TABLE       = aws_dynamodb_table.token_blacklist.name
+      IDEMPOTENCY_TABLE     = aws_dynamodb_table.idempotency.name
+      ARCHIVE_BUCKET        = aws_s3_bucket.archive.id
+      REACTIONS_TABLE       = aws_dynamodb_table.reactions.name
+      REACTION_SHARDS_TABLE = aws_dynamodb_table.reaction_shards.name
+      REACTION_SHARD_COUNT  = var.reaction_shard_count
+      PRESENCE_TABLE        = aws_dynamodb_table.presence.name
+      FINGERPRINTS_TABLE    = aws_dynamodb_table.fingerprints.name
+      COW_NAMES_TABLE       = aws_dynamodb_table.cow_names.name
+      STATS_TABLE           = aws_dynamodb_table.stats.name
+      BOARDS_TABLE          = aws_dynamodb_table.boards.name
+      CHANGES_TABLE         = aws_dynamodb_table.changes.name
+      JWT_SECRET            = var.jwt_secret
+      ADMIN_EMAIL           = var.admin_email
+      SES_SENDER            = var.ses_sender
+    }
+  }
+
+  tags = {
+    Name        = "${var.project_name}-router"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+# Retention Lambda: archives old messages on a daily schedule
+resource "aws_lambda_function" "retention" {
+  filename         = data.archive_file.lambda_code.output_path
+  function_name    = "${var.project_name}-retention"
+  role            = aws_iam_role.lambda_role.arn
+  handler         = "retention.lambda_handler"
+  runtime         = "python3.11"
+  timeout         = 900
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
+
+  layers = [aws_lambda_layer_version.dependencies.arn]
+
+  environment {
+    variables = {
+      MESSAGES_TABLE = aws_dynamodb_table.messages.name
+      ARCHIVE_BUCKET = aws_s3_bucket.archive.id
+      RETENTION_DAYS = var.retention_days
+    }
+  }
+
+  tags = {
+    Name        = "${var.project_name}-retention"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+resource "aws_cloudwatch_event_rule" "retention" {
+  name                = "${var.project_name}-retention"
+  description         = "Archive messages older than the retention age"
+  schedule_expression = "rate(1 day)"
+}
+
+resource "aws_cloudwatch_event_target" "retention" {
+  rule = aws_cloudwatch_event_rule.retention.name
+  arn  = aws_lambda_function.retention.arn
+}
+
+resource "aws_lambda_permission" "retention_events" {
+  statement_id  = "AllowEventBridgeInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.retention.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.retention.arn
+}
+
+# Reaction Rollup Lambda: sums moo shards into message totals every minute
+resource "aws_lambda_function" "reaction_rollup" {
+  filename         = data.archive_file.lambda_code.output_path
+  function_name    = "${var.project_name}-reaction-rollup"
+  role            = aws_iam_role.lambda_role.arn
+  handler         = "reaction_rollup.lambda_handler"
+  runtime         = "python3.11"
+  timeout         = 60
+  source_code_hash = data.archive_file.lambda_code.output_base64sha256
+
+  layers = [aws_lambda_layer_version.dependencies.arn]
+
+  environment {
+    variables = {
+      MESSAGES_TABLE        = aws_dynamodb_table.messages.name
+      REACTIONS_TABLE       = aws_dynamodb_table.reactions.name
+      REACTION_SHARDS_TABLE = aws_dynamodb_table.reaction_shards.name
+      REACTION_SHARD_COUNT  = var.reaction_shard_count
+      CHANGES_TABLE         = aws_dynamodb_table.changes.name
+    }
+  }
+
+  tags = {
+    Name        = "${var.project_name}-reaction-rollup"
+    Project     = var.project_name
+    Environment = var.environment
+  }
+}
+
+resource "aws_cloudwatch_event_rule" "reaction_rollup" {
+  name                = "${var.project_name}-reaction-rollup"
+  description         = "Roll moo counter shards up into message totals"
+  schedule_expression = "rate(1 minute)"
+}
+
+resource "aws_cloudwatch_event_target" "reaction_rollup" {
+  rule = aws_cloudwatch_event_rule.reaction_rollup.name
+  arn  = aws_lambda_function.reaction_rollup.arn
+}
+
+resource "aws_lambda_permission" "reaction_rollup_events" {
+  statement_id  = "AllowEventBridgeInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.reaction_rollup.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.reaction_rollup.arn
+}
+
 # ============================================
 # API Gateway (using OpenAPI Specification)
 # ============================================
 
 # Prepare OpenAPI spec with Lambda integrations
 locals {
+  router_arn = one(aws_lambda_function.router[*].invoke_arn)
+
   openapi_spec = templatefile("${path.module}/api-spec-template.yaml", {
-    aws_region             = var.aws_region
-    environment            = var.environment
-    signin_lambda_arn      = aws_lambda_function.signin.invoke_arn
-    signup_lambda_arn      = aws_lambda_function.signup.invoke_arn
-    signout_lambda_arn     = aws_lambda_function.signout.invoke_arn
-    get_current_user_arn   = aws_lambda_function.get_current_user.invoke_arn
-    get_messages_arn       = aws_lambda_function.get_messages.invoke_arn
-    post_message_arn       = aws_lambda_function.post_message.invoke_arn
-    delete_message_arn     = aws_lambda_function.delete_message.invoke_arn
+    aws_region              = var.aws_region
+    environment             = var.environment
+    signin_lambda_arn       = coalesce(local.router_arn, aws_lambda_function.signin.invoke_arn)
+    signup_lambda_arn       = coalesce(local.router_arn, aws_lambda_function.signup.invoke_arn)
+    signout_lambda_arn      = coalesce(local.router_arn, aws_lambda_function.signout.invoke_arn)
+    get_current_user_arn    = coalesce(local.router_arn, aws_lambda_function.get_current_user.invoke_arn)
+    get_messages_arn        = coalesce(local.router_arn, aws_lambda_function.get_messages.invoke_arn)
+    post_message_arn        = coalesce(local.router_arn, aws_lambda_function.post_message.invoke_arn)
+    delete_message_arn      = coalesce(local.router_arn, aws_lambda_function.delete_message.invoke_arn)
+    get_replies_arn         = coalesce(local.router_arn, aws_lambda_function.get_replies.invoke_arn)
+    moo_message_arn         = coalesce(local.router_arn, aws_lambda_function.moo_message.invoke_arn)
+    presence_arn            = coalesce(local.router_arn, aws_lambda_function.presence.invoke_arn)
+    get_stats_arn           = coalesce(local.router_arn, aws_lambda_function.get_stats.invoke_arn)
+    get_boards_arn          = coalesce(local.router_arn, aws_lambda_function.get_boards.invoke_arn)
+    get_changes_arn         = coalesce(local.router_arn, aws_lambda_function.get_changes.invoke_arn)
+    admin_registrations_arn = coalesce(local.router_arn, aws_lambda_function.admin_registrations.invoke_arn)
   })
 }
 
@@ -536,6 +1216,72 @@ resource "aws_lambda_permission" "delete_message_apigw" {
   source_arn    = "${aws_api_gateway_rest_api.main.execution_arn}/*/*"
 }
 
+resource "aws_lambda_permission" "get_replies_apigw" {
+  statement_id  = "AllowAPIGatewayInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.get_replies.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_api_gateway_rest_api.main.execution_arn}/*/*"
+}
+
+resource "aws_lambda_permission" "moo_message_apigw" {
+  statement_id  = "AllowAPIGatewayInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.moo_message.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_api_gateway_rest_api.main.execution_arn}/*/*"
+}
+
+resource "aws_lambda_permission" "presence_apigw" {
+  statement_id  = "AllowAPIGatewayInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.presence.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_api_gateway_rest_api.main.execution_arn}/*/*"
+}
+
+resource "aws_lambda_permission" "get_stats_apigw" {
+  statement_id  = "AllowAPIGatewayInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.get_stats.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_api_gateway_rest_api.main.execution_arn}/*/*"
+}
+
+resource "aws_lambda_permission" "get_boards_apigw" {
+  statement_id  = "AllowAPIGatewayInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.get_boards.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_api_gateway_rest_api.main.execution_arn}/*/*"
+}
+
+resource "aws_lambda_permission" "get_changes_apigw" {
+  statement_id  = "AllowAPIGatewayInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.get_changes.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_api_gateway_rest_api.main.execution_arn}/*/*"
+}
+
+resource "aws_lambda_permission" "admin_registrations_apigw" {
+  statement_id  = "AllowAPIGatewayInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.admin_registrations.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_api_gateway_rest_api.main.execution_arn}/*/*"
+}
+
+resource "aws_lambda_permission" "router_apigw" {
+  count = var.use_single_router ? 1 : 0
+
+  statement_id  = "AllowAPIGatewayInvoke"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.router[0].function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_api_gateway_rest_api.main.execution_arn}/*/*"
+}
+
 # ============================================
 # S3 Bucket for Frontend Hosting
 # ============================================
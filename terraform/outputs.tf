@@ -33,15 +33,35 @@ output "token_blacklist_table_name" {
   value       = aws_dynamodb_table.token_blacklist.name
 }
 
+output "archive_bucket_name" {
+  description = "S3 bucket holding archived messages"
+  value       = aws_s3_bucket.archive.id
+}
+
+output "idempotency_table_name" {
+  description = "DynamoDB Idempotency table name"
+  value       = aws_dynamodb_table.idempotency.name
+}
+
 output "lambda_functions" {
   description = "Lambda function names"
   value = {
-    signin           = aws_lambda_function.signin.function_name
-    signup           = aws_lambda_function.signup.function_name
-    signout          = aws_lambda_function.signout.function_name
-    get_current_user = aws_lambda_function.get_current_user.function_name
-    get_messages     = aws_lambda_function.get_messages.function_name
-    post_message     = aws_lambda_function.post_message.function_name
-    delete_message   = aws_lambda_function.delete_message.function_name
+    signin              = aws_lambda_function.signin.function_name
+    signup              = aws_lambda_function.signup.function_name
+    signout             = aws_lambda_function.signout.function_name
+    get_current_user    = aws_lambda_function.get_current_user.function_name
+    get_messages        = aws_lambda_function.get_messages.function_name
+    post_message        = aws_lambda_function.post_message.function_name
+    delete_message      = aws_lambda_function.delete_message.function_name
+    get_replies         = aws_lambda_function.get_replies.function_name
+    moo_message         = aws_lambda_function.moo_message.function_name
+    presence            = aws_lambda_function.presence.function_name
+    get_stats           = aws_lambda_function.get_stats.function_name
+    get_boards          = aws_lambda_function.get_boards.function_name
+    get_changes         = aws_lambda_function.get_changes.function_name
+    admin_registrations = aws_lambda_function.admin_registrations.function_name
+    reaction_rollup     = aws_lambda_function.reaction_rollup.function_name
+    retention           = aws_lambda_function.retention.function_name
+    router              = one(aws_lambda_function.router[*].function_name)
   }
 }
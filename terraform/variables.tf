@@ -34,3 +34,57 @@ variable "ses_sender" {
   type        = string
   default     = "noreply@cowswithak.com"
 }
+
+variable "use_single_router" {
+  description = "Route every API path to one router Lambda instead of one function per route"
+  type        = bool
+  default     = false
+}
+
+variable "retention_days" {
+  description = "Age in days after which messages move from DynamoDB to the S3 archive"
+  type        = number
+  default     = 30
+}
+
+variable "reaction_shard_count" {
+  description = "Counter shards per message for moo reactions (only ever increase it)"
+  type        = number
+  default     = 10
+}
+
+variable "boards" {
+  description = "Message boards by boardId; post_clearance_level empty means the same as clearance_level"
+  type = map(object({
+    name                 = string
+    description          = string
+    clearance_level      = string
+    post_clearance_level = string
+  }))
+  default = {
+    herd = {
+      name                 = "Herd Chatter"
+      description          = "The whole herd, all together"
+      clearance_level      = "LEVEL 1"
+      post_clearance_level = ""
+    }
+    pasture-news = {
+      name                 = "Pasture News"
+      description          = "Announcements from the council"
+      clearance_level      = "LEVEL 1"
+      post_clearance_level = "TOP SECRET"
+    }
+    back-forty = {
+      name                 = "The Back Forty"
+      description          = "For cows with LEVEL 2 clearance and above"
+      clearance_level      = "LEVEL 2"
+      post_clearance_level = ""
+    }
+    hayloft = {
+      name                 = "The Hayloft"
+      description          = "TOP SECRET. You know why you are here."
+      clearance_level      = "TOP SECRET"
+      post_clearance_level = ""
+    }
+  }
+}
@@ -0,0 +1,57 @@
+"""
+One-off backfill of the activeCows statistic
+The Stats table only counts approvals made after it existed; cows approved earlier are missing from the total
+
+Usage:
+    python tools/backfill_active_cows.py --segments 8 --dry-run
+    python tools/backfill_active_cows.py --segments 8
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda')
+if LAMBDA_DIR not in sys.path:
+    sys.path.insert(0, LAMBDA_DIR)
+
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+import storage  # noqa: E402
+from export_table import make_table  # noqa: E402
+
+
+def count_segment(segment, total_segments):
+    """Active users in one scan segment"""
+    table = make_table(storage.USERS)
+    active, start_key = 0, None
+    while True:
+        page = table.scan(limit=500, start_key=start_key, segment=segment, total_segments=total_segments)
+        active += sum(1 for user in page.items if user.get('status') == 'active')
+        start_key = page.last_key
+        if not start_key:
+            return active
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bring the activeCows statistic up to the number of active users')
+    parser.add_argument('--segments', type=int, default=8)
+    parser.add_argument('--dry-run', action='store_true', help='Count users without updating the statistic')
+    args = parser.parse_args(argv)
+
+    with ThreadPoolExecutor(max_workers=args.segments) as pool:
+        active = sum(pool.map(lambda segment: count_segment(segment, args.segments), range(args.segments)))
+
+    # Add only the difference, so approvals already counted are kept and a
+    # second run changes nothing
+    totals, _, _ = storage.stats().read()
+    missing = active - int(totals['cows'])
+    print(f"{active} active users; activeCows is {int(totals['cows'])}, {missing} to add")
+    if missing and not args.dry_run:
+        storage.stats().add_to_totals({'cows': missing})
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+One-off backfill of boardId on the Messages table
+Top-level messages posted before boards existed have no boardId, so they are missing from board-index;
+they belong to the default board
+
+Usage:
+    python tools/backfill_board_ids.py --segments 8 --dry-run
+    python tools/backfill_board_ids.py --segments 8
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda')
+if LAMBDA_DIR not in sys.path:
+    sys.path.insert(0, LAMBDA_DIR)
+
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+import boards  # noqa: E402
+import storage  # noqa: E402
+from export_table import make_table  # noqa: E402
+
+
+def backfill_segment(segment, total_segments, board_id, dry_run):
+    """Put one scan segment's unassigned top-level messages on board_id; returns (found, updated)"""
+    table = make_table(storage.MESSAGES)
+    found, updated, start_key = 0, 0, None
+    while True:
+        page = table.scan(limit=500, start_key=start_key, segment=segment, total_segments=total_segments)
+        for message in page.items:
+            if message.get('parentId') or 'boardId' in message:
+                continue
+            found += 1
+            if dry_run:
+                continue
+            try:
+                table.update_item(
+                    {'messageId': message['messageId']},
+                    set_values={'boardId': board_id},
+                    conditions=[storage.attribute_exists('messageId'), storage.attribute_not_exists('boardId')]
+                )
+                updated += 1
+            except storage.ConditionFailed:
+                # Deleted, or given a board, since the scan read it
+                pass
+        start_key = page.last_key
+        if not start_key:
+            return found, updated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Put messages from before boards existed on the default board')
+    parser.add_argument('--segments', type=int, default=8)
+    parser.add_argument('--board', default=boards.DEFAULT_BOARD_ID, help='Board to assign (default: %(default)s)')
+    parser.add_argument('--dry-run', action='store_true', help='Count messages without updating them')
+    args = parser.parse_args(argv)
+
+    with ThreadPoolExecutor(max_workers=args.segments) as pool:
+        results = list(pool.map(
+            lambda segment: backfill_segment(segment, args.segments, args.board, args.dry_run),
+            range(args.segments)
+        ))
+    found = sum(f for f, _ in results)
+    updated = sum(u for _, u in results)
+    print(f"{found} top-level messages without boardId; {updated} updated")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
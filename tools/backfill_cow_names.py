@@ -0,0 +1,83 @@
+"""
+One-off backfill of the Cow Names table
+Users who signed up before cow names were reserved at signup have no reservation,
+so a new cow could still take their name
+
+Usage:
+    python tools/backfill_cow_names.py --segments 8 --dry-run
+    python tools/backfill_cow_names.py --segments 8
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda')
+if LAMBDA_DIR not in sys.path:
+    sys.path.insert(0, LAMBDA_DIR)
+
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+import storage  # noqa: E402
+from export_table import make_table  # noqa: E402
+
+
+def backfill_segment(segment, total_segments, dry_run):
+    """
+    Reserve the cow names of one scan segment's users
+
+    Returns (users with a cow name, reserved, conflicts); a conflict is a
+    (cow name, email, email already holding it) triple.
+    """
+    users = make_table(storage.USERS)
+    cow_names = make_table(storage.COW_NAMES)
+    found, reserved, conflicts, start_key = 0, 0, [], None
+    while True:
+        page = users.scan(limit=500, start_key=start_key, segment=segment, total_segments=total_segments)
+        for user in page.items:
+            cow_name = (user.get('cowName') or '').strip()
+            if not cow_name:
+                continue
+            found += 1
+            key = storage.UserRepository.cow_name_key(cow_name)
+            if dry_run:
+                continue
+            try:
+                cow_names.put_item({
+                    'cowNameKey': key,
+                    'cowName': cow_name,
+                    'email': user['email'],
+                    'createdAt': user.get('createdAt')
+                }, conditions=[storage.attribute_not_exists('cowNameKey')])
+                reserved += 1
+            except storage.ConditionFailed:
+                holder = cow_names.get_item({'cowNameKey': key}, consistent=True) or {}
+                if holder.get('email') != user['email']:
+                    conflicts.append((cow_name, user['email'], holder.get('email')))
+        start_key = page.last_key
+        if not start_key:
+            return found, reserved, conflicts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reserve the cow names of existing users')
+    parser.add_argument('--segments', type=int, default=8)
+    parser.add_argument('--dry-run', action='store_true', help='Count users without reserving names')
+    args = parser.parse_args(argv)
+
+    with ThreadPoolExecutor(max_workers=args.segments) as pool:
+        results = list(pool.map(
+            lambda segment: backfill_segment(segment, args.segments, args.dry_run), range(args.segments)
+        ))
+    found = sum(f for f, _, _ in results)
+    reserved = sum(r for _, r, _ in results)
+    conflicts = [c for _, _, segment_conflicts in results for c in segment_conflicts]
+    for cow_name, email, holder in conflicts:
+        print(f"Conflict: '{cow_name}' for {email} is already held by {holder}")
+    print(f"{found} users with a cow name; {reserved} reserved, {len(conflicts)} conflicts")
+    return 1 if conflicts else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
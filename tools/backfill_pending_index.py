@@ -0,0 +1,69 @@
+"""
+One-off backfill of the sparse pending-index on the Users table
+Users who signed up before the index existed are still 'pending' but lack pendingStatus
+
+Usage:
+    python tools/backfill_pending_index.py --segments 8 --dry-run
+    python tools/backfill_pending_index.py --segments 8
+"""
+
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda')
+if LAMBDA_DIR not in sys.path:
+    sys.path.insert(0, LAMBDA_DIR)
+
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+import storage  # noqa: E402
+from export_table import make_table  # noqa: E402
+
+
+def backfill_segment(segment, total_segments, dry_run):
+    """Tag the pending users of one scan segment; returns (pending found, updated)"""
+    table = make_table(storage.USERS)
+    found, updated, start_key = 0, 0, None
+    while True:
+        page = table.scan(limit=500, start_key=start_key, segment=segment, total_segments=total_segments)
+        for user in page.items:
+            if user.get('status') != 'pending' or 'pendingStatus' in user:
+                continue
+            found += 1
+            if dry_run:
+                continue
+            try:
+                table.update_item(
+                    {'email': user['email']},
+                    set_values={'pendingStatus': 'pending'},
+                    conditions=[storage.equals('status', 'pending')]
+                )
+                updated += 1
+            except storage.ConditionFailed:
+                # Reviewed since the scan read it
+                pass
+        start_key = page.last_key
+        if not start_key:
+            return found, updated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Add pending users to the pending-index')
+    parser.add_argument('--segments', type=int, default=8)
+    parser.add_argument('--dry-run', action='store_true', help='Count users without updating them')
+    args = parser.parse_args(argv)
+
+    with ThreadPoolExecutor(max_workers=args.segments) as pool:
+        results = list(pool.map(
+            lambda segment: backfill_segment(segment, args.segments, args.dry_run), range(args.segments)
+        ))
+    found = sum(f for f, _ in results)
+    updated = sum(u for _, u in results)
+    print(f"{found} pending users without pendingStatus; {updated} updated")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""
+Parallel export of a Cows with a K table for backups and analytics
+Splits a Scan into Segment/TotalSegments slices across a worker pool and streams each
+slice to compressed NDJSON (or Parquet) part files, checkpointing so a run can resume
+
+Usage:
+    python tools/export_table.py messages --output exports/ --segments 16 --workers 8
+    python tools/export_table.py messages --output exports/ --resume
+    STORAGE_BACKEND=sqlite SQLITE_PATH=/tmp/cows.db python tools/export_table.py users --format parquet
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda')
+if LAMBDA_DIR not in sys.path:
+    sys.path.insert(0, LAMBDA_DIR)
+
+# Exports are batch jobs; keep the per-request metric lines out of the output
+os.environ.setdefault('METRICS_ENABLED', 'false')
+
+import clients  # noqa: E402
+import storage  # noqa: E402
+
+TABLES = {
+    'users': storage.USERS,
+    'messages': storage.MESSAGES,
+    'blacklist': storage.BLACKLIST,
+    'idempotency': storage.IDEMPOTENCY,
+}
+
+
+# ============================================
+# Part writers
+# ============================================
+
+class NDJSONPartWriter:
+    """Gzipped newline-delimited JSON, written as items arrive"""
+
+    extension = '.ndjson.gz'
+
+    def __init__(self, path):
+        self._file = gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+
+    def write(self, items):
+        for item in items:
+            self._file.write(json.dumps(item, default=storage.json_default, separators=(',', ':')))
+            self._file.write('\n')
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetPartWriter:
+    """
+    Parquet with one row group per scan page
+
+    Columns come from the first page of the part; attributes first seen later
+    are kept as JSON in an _extra column. Nested values are stored as JSON text.
+    """
+
+    extension = '.parquet'
+
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit('Parquet export needs pyarrow: pip install pyarrow')
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._path = path
+        self._writer = None
+        self._columns = None
+
+    @staticmethod
+    def _cell(value):
+        if value is None or isinstance(value, str):
+            return value
+        return json.dumps(value, default=storage.json_default)
+
+    def write(self, items):
+        if not items:
+            return
+        if self._columns is None:
+            self._columns = sorted({name for item in items for name in item})
+            schema = self._pa.schema(
+                [(name, self._pa.string()) for name in self._columns] + [('_extra', self._pa.string())]
+            )
+            self._writer = self._pq.ParquetWriter(self._path, schema, compression='zstd')
+        known = set(self._columns)
+        data = {name: [self._cell(item.get(name)) for item in items] for name in self._columns}
+        data['_extra'] = [
+            self._cell({k: v for k, v in item.items() if k not in known}) if set(item) - known else None
+            for item in items
+        ]
+        self._writer.write_table(self._pa.table(data, schema=self._writer.schema))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+WRITERS = {
+    'ndjson': NDJSONPartWriter,
+    'parquet': ParquetPartWriter,
+}
+
+
+# ============================================
+# Checkpoints
+# ============================================
+
+def _write_json_atomic(path, document):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(document, f, default=storage.json_default)
+    os.replace(path + '.tmp', path)
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+# ============================================
+# Export
+# ============================================
+
+def make_table(schema):
+    """
+    A table handle for one worker thread
+
+    boto3 resources are not thread-safe, so each DynamoDB worker gets its own
+    session; the local backends already are safe to share.
+    """
+    if storage.STORAGE_BACKEND == 'dynamodb':
+        import boto3
+        resource = boto3.session.Session().resource('dynamodb', config=clients.client_config())
+        return storage.DynamoDBBackend(resource).create_table(schema)
+    return storage.get_backend().table(schema)
+
+
+def export_segment(schema, segment, total_segments, directory, fmt, page_size, part_items, resume):
+    """
+    Scan one segment into part files under directory; returns (items, seconds)
+
+    A checkpoint is written each time a part closes, recording the scan
+    position after it. On resume the segment restarts from that position and
+    part files written after the checkpoint are discarded.
+    """
+    writer_class = WRITERS[fmt]
+    name = f'segment-{segment:04d}-of-{total_segments:04d}'
+    checkpoint_path = os.path.join(directory, f'{name}.checkpoint.json')
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    if checkpoint and checkpoint.get('done'):
+        return checkpoint['items'], 0.0
+    checkpoint = checkpoint or {'segment': segment, 'parts': 0, 'items': 0, 'lastKey': None, 'done': False}
+
+    # Anything past the checkpoint is from an interrupted part
+    for existing in os.listdir(directory):
+        if existing.startswith(f'{name}.part-'):
+            part_number = int(existing.split('.part-')[1].split('.')[0])
+            if part_number >= checkpoint['parts']:
+                os.remove(os.path.join(directory, existing))
+
+    table = make_table(schema)
+    started = time.perf_counter()
+    start_key = checkpoint['lastKey']
+    writer, in_part = None, 0
+    while True:
+        page = table.scan(
+            limit=page_size, start_key=start_key, segment=segment, total_segments=total_segments
+        )
+        if page.items:
+            if writer is None:
+                part_path = os.path.join(directory, f"{name}.part-{checkpoint['parts']:05d}{writer_class.extension}")
+                writer = writer_class(part_path)
+            writer.write(page.items)
+            in_part += len(page.items)
+        start_key = page.last_key
+
+        if writer is not None and (in_part >= part_items or not start_key):
+            writer.close()
+            checkpoint['parts'] += 1
+            checkpoint['items'] += in_part
+            checkpoint['lastKey'] = start_key
+            checkpoint['done'] = not start_key
+            writer, in_part = None, 0
+            _write_json_atomic(checkpoint_path, checkpoint)
+        if not start_key:
+            break
+
+    if not checkpoint['done']:
+        # Empty segment: nothing was written, but there is nothing to resume either
+        checkpoint['done'] = True
+        _write_json_atomic(checkpoint_path, checkpoint)
+    return checkpoint['items'], time.perf_counter() - started
+
+
+def export_table(schema, directory, fmt='ndjson', total_segments=16, workers=8,
+                 page_size=1000, part_items=100000, resume=False, progress=print):
+    """Export every segment in parallel; returns a summary dict"""
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, 'manifest.json')
+    manifest = load_checkpoint(manifest_path) if resume else None
+    if manifest and (manifest['totalSegments'] != total_segments or manifest['format'] != fmt):
+        raise SystemExit(
+            f"{directory} holds an export with {manifest['totalSegments']} {manifest['format']} segments; "
+            'resume with the same --segments and --format'
+        )
+    _write_json_atomic(manifest_path, {
+        'table': schema.name, 'format': fmt, 'totalSegments': total_segments, 'complete': False
+    })
+
+    started = time.perf_counter()
+    total_items = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(export_segment, schema, segment, total_segments, directory,
+                        fmt, page_size, part_items, resume): segment
+            for segment in range(total_segments)
+        }
+        for future in as_completed(futures):
+            items, seconds = future.result()
+            total_items += items
+            progress(f'segment {futures[future]:>4}: {items} items in {seconds:.1f}s')
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        'table': schema.name, 'format': fmt, 'totalSegments': total_segments,
+        'items': total_items, 'seconds': round(elapsed, 3), 'complete': True
+    }
+    _write_json_atomic(manifest_path, summary)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export a table with a parallel segmented scan')
+    parser.add_argument('table', choices=sorted(TABLES))
+    parser.add_argument('--output', default='exports', help='Directory for part files and checkpoints')
+    parser.add_argument('--format', choices=sorted(WRITERS), default='ndjson')
+    parser.add_argument('--segments', type=int, default=16, help='TotalSegments of the parallel scan')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--page-size', type=int, default=1000, help='Items per Scan call')
+    parser.add_argument('--part-items', type=int, default=100000, help='Items per part file (and checkpoint)')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted export in --output')
+    args = parser.parse_args(argv)
+
+    schema = TABLES[args.table]
+    directory = os.path.join(args.output, schema.name)
+    summary = export_table(
+        schema, directory, args.format, args.segments, args.workers,
+        args.page_size, args.part_items, args.resume
+    )
+    rate = summary['items'] / summary['seconds'] if summary['seconds'] else 0.0
+    print(f"Exported {summary['items']} items from {schema.name} in {summary['seconds']:.1f}s "
+          f"({rate:.0f} items/s) to {directory}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())